@@ -0,0 +1,121 @@
+"""
+Maintenance commands, run from the project root:
+
+    python -m app.cli migrate
+    python -m app.cli rebuild-leaderboard
+    python -m app.cli recompute-personal-bests [--user STRAVA_ID]
+    python -m app.cli replay-timing-journal [--path FILE] [--event EVENT_ID]
+    python -m app.cli simulate-chip-reader (--event EVENT_ID | --chips ID,ID,...) [--port 10000] [--udp]
+"""
+import argparse
+import asyncio
+
+from app.db.session import AsyncSessionFactory, init_db
+from app.services import leaderboard_service, race_service, chip_timing_service
+from app.services.timing_journal_service import timing_journal
+
+
+async def _migrate(args: argparse.Namespace) -> None:
+    await init_db() # create_all + run_migrations
+    print("Database schema is up to date.")
+
+
+async def _rebuild_leaderboard(args: argparse.Namespace) -> None:
+    await init_db() # Make sure leaderboard_entries exists on older databases
+    async with AsyncSessionFactory() as db:
+        written = await leaderboard_service.rebuild_leaderboard_entries(db)
+        # The overall leaderboard is served from personal_bests, so rebuild those too
+        personal_bests = await leaderboard_service.recompute_personal_bests(db)
+        rollups = await leaderboard_service.rebuild_leaderboard_rollups(db) # Category/sex/age group boards
+    print(f"Rebuilt leaderboard: {written} entries, {personal_bests} personal bests, {rollups} rollup rows.")
+
+
+async def _recompute_personal_bests(args: argparse.Namespace) -> None:
+    await init_db()
+    async with AsyncSessionFactory() as db:
+        written = await leaderboard_service.recompute_personal_bests(db, user_strava_id=args.user)
+    scope = f"athlete {args.user}" if args.user is not None else "all athletes"
+    print(f"Recomputed personal bests for {scope}: {written} rows.")
+
+
+async def _replay_timing_journal(args: argparse.Namespace) -> None:
+    path = args.path or timing_journal.path
+    if not path:
+        raise SystemExit("No journal to replay: TIMING_JOURNAL_PATH is empty and --path was not given.")
+    await init_db()
+    async with AsyncSessionFactory() as db:
+        counts = await race_service.replay_timing_journal(db, path, event_id=args.event)
+    print(
+        f"Replayed {counts['entries']} journal entries from {path}: "
+        f"{counts['recorded']} finishes recorded, {counts['rejected']} already applied or rejected."
+    )
+
+
+async def _simulate_chip_reader(args: argparse.Namespace) -> None:
+    if args.chips:
+        chip_ids = [chip_id.strip() for chip_id in args.chips.split(",") if chip_id.strip()]
+    else:
+        await init_db()
+        async with AsyncSessionFactory() as db:
+            chip_ids = list(await race_service.get_chip_dorsal_map(db, args.event))
+    if not chip_ids:
+        raise SystemExit("No chips to simulate: pair chips with dorsals first, or pass --chips.")
+    sent = await chip_timing_service.simulate_reader(
+        args.host, args.port, chip_ids,
+        mats=args.mats, reads_per_crossing=args.reads, crossings_per_second=args.rate, udp=args.udp,
+    )
+    print(f"Sent {sent} reads for {len(chip_ids)} chips over {args.mats} mats.")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="PaddleTrack maintenance commands.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser(
+        "migrate",
+        help="Create missing tables, add new columns/indexes to existing ones and backfill them.",
+    )
+    migrate.set_defaults(handler=_migrate)
+
+    rebuild = subparsers.add_parser(
+        "rebuild-leaderboard",
+        help="Recompute leaderboard_entries, personal_bests and leaderboard_rollups from all results (backfills, corrections).",
+    )
+    rebuild.set_defaults(handler=_rebuild_leaderboard)
+
+    personal_bests = subparsers.add_parser(
+        "recompute-personal-bests",
+        help="Recompute personal_bests from raw results, e.g. after a result correction.",
+    )
+    personal_bests.add_argument("--user", type=int, default=None, help="Strava ID of a single athlete.")
+    personal_bests.set_defaults(handler=_recompute_personal_bests)
+
+    replay = subparsers.add_parser(
+        "replay-timing-journal",
+        help="Re-apply journaled starts and finishes after a crash; inputs already in the database are skipped.",
+    )
+    replay.add_argument("--path", default=None, help="Journal file (default: TIMING_JOURNAL_PATH).")
+    replay.add_argument("--event", type=int, default=None, help="Only replay this event's inputs.")
+    replay.set_defaults(handler=_replay_timing_journal)
+
+    simulate = subparsers.add_parser(
+        "simulate-chip-reader",
+        help="Play finish-mat chip readers against a running chip reader listener (testing, rehearsals).",
+    )
+    chips = simulate.add_mutually_exclusive_group(required=True)
+    chips.add_argument("--event", type=int, help="Simulate every chip paired with a dorsal in this event.")
+    chips.add_argument("--chips", help="Comma-separated chip IDs to simulate.")
+    simulate.add_argument("--host", default="127.0.0.1")
+    simulate.add_argument("--port", type=int, default=10000)
+    simulate.add_argument("--udp", action="store_true", help="Send UDP datagrams instead of TCP lines.")
+    simulate.add_argument("--mats", type=int, default=2, help="Mats (one connection each) reporting every crossing.")
+    simulate.add_argument("--reads", type=int, default=3, help="Reads per chip per mat for one crossing.")
+    simulate.add_argument("--rate", type=float, default=50.0, help="Crossings per second.")
+    simulate.set_defaults(handler=_simulate_chip_reader)
+
+    args = parser.parse_args(argv)
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -19,6 +21,63 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7 # Default to 7 days
     # SECURE_COOKIE: bool = True # For production, if using HTTPS. Set via env if needed.
 
+    # In-process cache for public results/leaderboard pages (see app/services/result_service.py).
+    # Entries are invalidated explicitly when results change; the TTLs are a safety net.
+    RESULTS_CACHE_MAX_ENTRIES: int = 512
+    RESULTS_CACHE_TTL_SECONDS: float = 60.0
+    LEADERBOARD_CACHE_TTL_SECONDS: float = 300.0
+
+    # Live results over Server-Sent Events (see app/services/live_results_service.py)
+    LIVE_RESULTS_QUEUE_SIZE: int = 100 # Pending updates per spectator before the oldest is dropped
+    LIVE_RESULTS_HEARTBEAT_SECONDS: float = 15.0 # Keeps idle connections open through proxies
+
+    # Chip timing reader listener (see app/services/chip_timing_service.py)
+    CHIP_READER_ENABLED: bool = False
+    CHIP_READER_EVENT_ID: Optional[int] = None # Event whose finishes the mats record
+    CHIP_READER_HOST: str = "0.0.0.0"
+    CHIP_READER_TCP_PORT: int = 10000 # 0 disables the TCP listener
+    CHIP_READER_UDP_PORT: int = 10001 # 0 disables the UDP listener
+    CHIP_READER_DEDUP_WINDOW_SECONDS: float = 5.0 # Repeat reads of a chip within this window are dropped
+    CHIP_READER_BATCH_SIZE: int = 200
+    CHIP_READER_FLUSH_INTERVAL_SECONDS: float = 0.25 # Longest a crossing waits for its batch
+    CHIP_READER_RETRY_SECONDS: float = 2.0 # Between attempts to write a batch the database refused
+
+    # Admin timing console WebSocket (see app/services/timing_console_service.py)
+    TIMING_CONSOLE_BATCH_SIZE: int = 100
+    TIMING_CONSOLE_FLUSH_INTERVAL_SECONDS: float = 0.01 # Longest an entry waits for its batch
+
+    # Pooled client for all outgoing HTTP (see app/core/http_client.py)
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 20
+    HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    HTTP_CLIENT_KEEPALIVE_SECONDS: float = 30.0
+    HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    HTTP_CLIENT_TIMEOUT_SECONDS: float = 15.0 # Read/write
+    HTTP_CLIENT_POOL_TIMEOUT_SECONDS: float = 10.0 # Waiting for a free connection
+    HTTP_CLIENT_HTTP2: bool = True # Used only if the `h2` package is installed
+
+    # Strava activity sync (see app/services/virtual_event_service.py)
+    STRAVA_BASE_URL: str = "https://www.strava.com" # Point at a fake Strava server for local runs
+    STRAVA_SYNC_PER_PAGE: int = 200 # Strava's maximum
+    STRAVA_SYNC_MAX_PAGES_IN_FLIGHT: int = 3 # Pages requested ahead while one is stored
+    # Background sync of every connected athlete (see app/services/sync_scheduler_service.py)
+    STRAVA_SYNC_SCHEDULER_ENABLED: bool = False
+    STRAVA_SYNC_SCHEDULER_INTERVAL_SECONDS: float = 900.0 # Between the starts of two rounds
+    # Strava webhook push (see app/services/strava_webhook_service.py); workers run when a verify token is set
+    STRAVA_WEBHOOK_VERIFY_TOKEN: str = "" # Chosen when creating the push subscription
+    STRAVA_WEBHOOK_SUBSCRIPTION_ID: Optional[int] = None # Returned when creating it; events are refused until set, and for other ids
+    STRAVA_WEBHOOK_WORKERS: int = 2
+    STRAVA_WEBHOOK_MAX_ATTEMPTS: int = 5
+    STRAVA_WEBHOOK_RETRY_SECONDS: float = 30.0 # First retry delay, doubled on each attempt
+    # Strava's quota until its X-RateLimit-* headers say otherwise (see app/core/rate_limit.py)
+    STRAVA_RATE_LIMIT_15_MIN: int = 200
+    STRAVA_RATE_LIMIT_DAILY: int = 2000
+    STRAVA_RATE_LIMIT_RESERVE_FRACTION: float = 0.2 # Left to logins and manual syncs
+    STRAVA_RATE_LIMIT_PACE_FROM_FRACTION: float = 0.5 # Spread requests out past this share of a window
+
+    # Every start/finish input is fsync'd here before it touches the database (see app/services/timing_journal_service.py).
+    # Replay with `python -m app.cli replay-timing-journal`. Empty disables the journal.
+    TIMING_JOURNAL_PATH: Optional[str] = "./timing_journal.jsonl"
+
     model_config = SettingsConfigDict(env_file=".env")
 
 # Example of how to instantiate and use the settings:
@@ -0,0 +1,35 @@
+from typing import Optional, Tuple
+
+# Age groups for leaderboards: (label, youngest age, oldest age or None for open-ended).
+# An athlete's age for a board is the age they reach during that board's year.
+AGE_BANDS = [
+    ("U18", 0, 17),
+    ("18-29", 18, 29),
+    ("30-39", 30, 39),
+    ("40-49", 40, 49),
+    ("50-59", 50, 59),
+    ("60+", 60, None),
+]
+
+
+def age_band_for(birth_year: Optional[int], on_year: int) -> Optional[str]:
+    """Returns the label of the age group an athlete born in birth_year is in during on_year."""
+    if birth_year is None:
+        return None
+    age = on_year - birth_year
+    for label, youngest, oldest in AGE_BANDS:
+        if age >= youngest and (oldest is None or age <= oldest):
+            return label
+    return None
+
+
+def birth_year_range(age_band: str, on_year: int) -> Tuple[Optional[int], Optional[int]]:
+    """
+    The (earliest, latest) birth years of athletes in age_band during on_year; None means
+    unbounded. Boards filter on birth year, so stored rows never go stale as athletes age.
+    Raises ValueError for an unknown label.
+    """
+    for label, youngest, oldest in AGE_BANDS:
+        if label == age_band:
+            return (on_year - oldest if oldest is not None else None), on_year - youngest
+    raise ValueError(f"Unknown age band {age_band!r}")
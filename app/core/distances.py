@@ -0,0 +1,32 @@
+from typing import Optional
+
+from sqlalchemy import case, func
+
+# Define standard distances for leaderboards (in km)
+STANDARD_DISTANCES_KM = [1.0, 3.0, 5.0, 7.0, 10.0, 12.0]
+# Define a tolerance for matching activity distances to standard distances
+DISTANCE_TOLERANCE_KM = 0.1 # e.g., 5km +/- 0.1km
+
+
+def distance_bucket_for(distance_km: Optional[float]) -> Optional[float]:
+    """Returns the standard distance a raw distance counts towards, or None."""
+    if distance_km is None or distance_km <= 0:
+        return None
+    for std_dist_km in STANDARD_DISTANCES_KM:
+        if abs(distance_km - std_dist_km) <= DISTANCE_TOLERANCE_KM:
+            return std_dist_km
+    return None
+
+
+def distance_bucket_expr(distance_column):
+    """
+    SQL equivalent of distance_bucket_for(), so the database can bucket rows itself.
+    Evaluates to NULL for distances outside every tolerance window.
+    """
+    return case(
+        *[
+            (func.abs(distance_column - std_dist_km) <= DISTANCE_TOLERANCE_KM, std_dist_km)
+            for std_dist_km in STANDARD_DISTANCES_KM
+        ],
+        else_=None,
+    )
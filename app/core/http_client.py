@@ -0,0 +1,110 @@
+"""
+The application's one outgoing HTTP client (Strava's API and OAuth endpoints). A client
+per call paid a TCP and TLS handshake every time; this one keeps connections alive in a
+pool, speaks HTTP/2 when the optional `h2` package is installed, counts what goes
+through it for /admin/http-client-stats and reports Strava's rate limit headers to
+app/core/rate_limit.py.
+
+Opened in main.on_startup and closed in on_shutdown; code running outside the app
+(scripts, tests) gets a client created on first use.
+"""
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.config import Settings
+from app.core.rate_limit import strava_rate_limit
+
+try:
+    import h2 # noqa: F401 # httpx negotiates HTTP/2 only with it installed
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """Wraps the pooled transport to count requests, in-flight requests and failures."""
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, stats: Dict[str, Any]):
+        self.transport = transport
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats["requests"] += 1
+        self.stats["in_flight"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        started = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TransportError:
+            self.stats["transport_errors"] += 1
+            raise
+        finally:
+            self.stats["in_flight"] -= 1
+            self.stats["total_ms"] += (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            self.stats["error_responses"] += 1
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class SharedHTTPClient:
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self._transport: Optional[httpx.AsyncHTTPTransport] = None
+        self.http2 = False
+        self.stats: Dict[str, Any] = {}
+
+    def start(self, settings: Settings) -> httpx.AsyncClient:
+        if self.client is None:
+            self.stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "transport_errors": 0, "error_responses": 0, "total_ms": 0.0}
+            self.http2 = settings.HTTP_CLIENT_HTTP2 and HTTP2_AVAILABLE
+            self._transport = httpx.AsyncHTTPTransport(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_SECONDS,
+                ),
+            )
+            self.client = httpx.AsyncClient(
+                transport=_CountingTransport(self._transport, self.stats),
+                timeout=httpx.Timeout(
+                    settings.HTTP_CLIENT_TIMEOUT_SECONDS,
+                    connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS,
+                    pool=settings.HTTP_CLIENT_POOL_TIMEOUT_SECONDS,
+                ),
+                event_hooks={"response": [strava_rate_limit.observe_response]}, # Every caller spends the same quota
+            )
+        return self.client
+
+    def get(self) -> httpx.AsyncClient:
+        return self.client if self.client is not None else self.start(Settings())
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            self._transport = None
+
+    def metrics(self) -> Dict[str, Any]:
+        if self.client is None:
+            return {"open": False}
+        # httpx doesn't expose its pool; httpcore's is reachable through the transport
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        completed = self.stats["requests"] - self.stats["in_flight"]
+        return {
+            "open": True,
+            "http2": self.http2,
+            "connections": len(connections),
+            "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+            **{key: value for key, value in self.stats.items() if key != "total_ms"},
+            "mean_ms": round(self.stats["total_ms"] / completed, 1) if completed else None,
+        }
+
+
+http_client = SharedHTTPClient()
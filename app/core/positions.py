@@ -0,0 +1,58 @@
+"""
+Finish positions of race results, per (event, distance): overall, within the category
+and within the athlete's sex, plus the gap to the distance leader. Order is net time,
+then race result id, so equal net times still get distinct, stable positions.
+standings_service keeps them up to date finish by finish; the statement below
+recomputes them in SQL (migration backfill, start time corrections).
+"""
+from typing import Optional
+
+from sqlalchemy import and_, case, func, select, update
+
+POSITION_COLUMNS = ("overall_position", "category_position", "sex_position", "gap_to_leader_seconds")
+
+
+def position_sort_key(net_time_seconds: int, race_result_id: int) -> tuple:
+    return (net_time_seconds, race_result_id)
+
+
+def positions_update_stmts(race_results, registrations, strava_users, event_id: Optional[int] = None, distance_id: Optional[int] = None):
+    """
+    UPDATE statements (Core tables, so migrations can use them too) that set every
+    position column of the event's (or distance's, or all) race results: timed results
+    from window functions, untimed ones back to NULL.
+    """
+    scope = []
+    if event_id is not None:
+        scope.append(registrations.c.event_id == event_id)
+    if distance_id is not None:
+        scope.append(registrations.c.event_distance_id == distance_id)
+
+    net = race_results.c.net_time_seconds
+    order = (net, race_results.c.id)
+    distance = (registrations.c.event_id, registrations.c.event_distance_id)
+    ranked = (
+        select(
+            race_results.c.id.label("race_result_id"),
+            func.row_number().over(partition_by=distance, order_by=order).label("overall_position"),
+            func.row_number().over(partition_by=(*distance, registrations.c.event_category_id), order_by=order).label("category_position"),
+            case(
+                (strava_users.c.sex.is_(None), None),
+                else_=func.row_number().over(partition_by=(*distance, strava_users.c.sex), order_by=order),
+            ).label("sex_position"),
+            (net - func.min(net).over(partition_by=distance)).label("gap_to_leader_seconds"),
+        )
+        .join(registrations, registrations.c.id == race_results.c.registration_id)
+        .join(strava_users, strava_users.c.strava_id == registrations.c.user_strava_id)
+        .where(net.isnot(None), *scope)
+        .subquery()
+    )
+    in_scope = race_results.c.registration_id.in_(select(registrations.c.id).where(*scope)) if scope else True
+    return (
+        update(race_results)
+        .where(race_results.c.id == ranked.c.race_result_id)
+        .values({column: ranked.c[column] for column in POSITION_COLUMNS}),
+        update(race_results)
+        .where(and_(net.is_(None), in_scope))
+        .values({column: None for column in POSITION_COLUMNS}),
+    )
@@ -0,0 +1,146 @@
+"""
+Strava's API quota, as a budget the background sync spends from. Strava allows a number
+of requests per fixed 15-minute window (reset at :00, :15, :30 and :45) and per UTC day,
+and reports both on every response:
+
+    X-RateLimit-Limit: 200,2000
+    X-RateLimit-Usage: 37,412
+
+The budget counts its own requests as it makes them and takes the server's count from
+those headers whenever a response carries them (any caller's: the OAuth routes and
+manual syncs spend the same quota). It keeps `reserve_fraction` of each window for
+interactive use, and once a window is `pace_from_fraction` spent it stops spending in
+bursts: the rest of the window refills like a token bucket, one request every
+(time left / requests left) seconds. An exhausted window waits for its reset.
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Mapping, Optional
+
+import httpx
+
+from app.config import Settings
+
+settings = Settings()
+
+SHORT_WINDOW_SECONDS = 15 * 60
+
+
+def _parse_pair(value: Optional[str]) -> Optional[tuple]:
+    try:
+        short, daily = (int(part) for part in value.split(","))
+    except (AttributeError, ValueError):
+        return None
+    return short, daily
+
+
+class RateLimitBudget:
+    def __init__(
+        self,
+        short_limit: int = 200,
+        daily_limit: int = 2000,
+        reserve_fraction: float = 0.2,
+        pace_from_fraction: float = 0.5,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.reserve_fraction = reserve_fraction
+        self.pace_from_fraction = pace_from_fraction
+        self.clock = clock
+        self.short_usage = 0
+        self.daily_usage = 0
+        self._short_window = self._short_window_start(clock())
+        self._day = self._day_start(clock())
+        self._last_spent: Optional[float] = None
+        self.stats = {"spent": 0, "observed": 0, "waits": 0, "waited_seconds": 0.0}
+
+    @staticmethod
+    def _short_window_start(now: float) -> float:
+        return now - now % SHORT_WINDOW_SECONDS
+
+    @staticmethod
+    def _day_start(now: float) -> float:
+        day = datetime.fromtimestamp(now, tz=timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        return day.timestamp()
+
+    def _roll_windows(self, now: float) -> None:
+        if self._short_window_start(now) != self._short_window:
+            self._short_window = self._short_window_start(now)
+            self.short_usage = 0
+            self._last_spent = None
+        if self._day_start(now) != self._day:
+            self._day = self._day_start(now)
+            self.daily_usage = 0
+
+    def _usable(self, limit: int) -> int:
+        return int(limit * (1 - self.reserve_fraction))
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """Takes limits and usage from a Strava response's X-RateLimit-* headers, if present."""
+        usage = _parse_pair(headers.get("X-RateLimit-Usage"))
+        if usage is None:
+            return
+        self._roll_windows(self.clock())
+        limits = _parse_pair(headers.get("X-RateLimit-Limit"))
+        if limits is not None:
+            self.short_limit, self.daily_limit = limits
+        # Requests of ours still in flight aren't in the server's count yet
+        self.short_usage = max(self.short_usage, usage[0])
+        self.daily_usage = max(self.daily_usage, usage[1])
+        self.stats["observed"] += 1
+
+    async def observe_response(self, response: httpx.Response) -> None:
+        """httpx response event hook."""
+        self.observe(response.headers)
+
+    def wait_seconds(self) -> float:
+        """How long until one more request fits the budget; 0 if it fits now."""
+        now = self.clock()
+        self._roll_windows(now)
+        if self.daily_usage >= self._usable(self.daily_limit):
+            return self._day + 86400 - now
+        short_usable = self._usable(self.short_limit)
+        if self.short_usage >= short_usable:
+            return self._short_window + SHORT_WINDOW_SECONDS - now
+        if self.short_usage < short_usable * self.pace_from_fraction or self._last_spent is None:
+            return 0.0
+        # Near the limit: spread what is left evenly over the rest of the window
+        interval = (self._short_window + SHORT_WINDOW_SECONDS - now) / (short_usable - self.short_usage)
+        return max(0.0, self._last_spent + interval - now)
+
+    def spend(self) -> None:
+        now = self.clock()
+        self._roll_windows(now)
+        self.short_usage += 1
+        self.daily_usage += 1
+        self._last_spent = now
+        self.stats["spent"] += 1
+
+    async def acquire(self) -> None:
+        """Waits until a request fits the budget, then counts it."""
+        while True:
+            delay = self.wait_seconds()
+            if delay <= 0:
+                self.spend()
+                return
+            self.stats["waits"] += 1
+            self.stats["waited_seconds"] += delay
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._roll_windows(self.clock())
+        return {
+            "short_usage": self.short_usage, "short_limit": self.short_limit,
+            "daily_usage": self.daily_usage, "daily_limit": self.daily_limit,
+            "wait_seconds": round(self.wait_seconds(), 1), **self.stats,
+        }
+
+
+strava_rate_limit = RateLimitBudget(
+    short_limit=settings.STRAVA_RATE_LIMIT_15_MIN,
+    daily_limit=settings.STRAVA_RATE_LIMIT_DAILY,
+    reserve_fraction=settings.STRAVA_RATE_LIMIT_RESERVE_FRACTION,
+    pace_from_fraction=settings.STRAVA_RATE_LIMIT_PACE_FROM_FRACTION,
+)
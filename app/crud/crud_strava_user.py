@@ -5,6 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.security import encrypt_token # decrypt_token is not used in this file yet
 from app.models.strava_user import StravaUserDB, StravaAthleteData, StravaTokenData
+from app.models.leaderboard_rollup import LeaderboardRollup
 # StravaUserCreate is not directly used for creating from API data here, but good to have for other contexts if needed.
 
 async def get_user_by_strava_id(db: AsyncSession, *, strava_id: int) -> StravaUserDB | None:
@@ -55,6 +56,9 @@ async def create_or_update_strava_user(
             "scope": scope_str,
             "last_login_at": datetime.utcnow(), # Update last login time
         }
+        if athlete_data.sex is not None: # The token exchange summary may omit it
+            update_values["sex"] = athlete_data.sex
+            await _sync_leaderboard_dimensions(db, strava_id=athlete_data.id, sex=athlete_data.sex)
         await db.execute(
             update(StravaUserDB)
             .where(StravaUserDB.strava_id == athlete_data.id)
@@ -69,6 +73,7 @@ async def create_or_update_strava_user(
             firstname=athlete_data.firstname,
             lastname=athlete_data.lastname,
             profile_picture_url=athlete_data.profile_medium or athlete_data.profile,
+            sex=athlete_data.sex,
             encrypted_access_token=encrypted_access,
             encrypted_refresh_token=encrypted_refresh,
             token_expires_at=token_expires_at_dt,
@@ -82,3 +87,24 @@ async def create_or_update_strava_user(
     await db.commit()
     await db.refresh(user_to_refresh)
     return user_to_refresh
+
+async def update_user_birth_year(db: AsyncSession, *, strava_id: int, birth_year: int | None) -> StravaUserDB | None:
+    """
+    Sets the athlete's birth year, used to place them in leaderboard age groups.
+    """
+    user = await get_user_by_strava_id(db, strava_id=strava_id)
+    if not user:
+        return None
+    user.birth_year = birth_year
+    await _sync_leaderboard_dimensions(db, strava_id=strava_id, birth_year=birth_year)
+    await db.commit()
+    await db.refresh(user)
+    return user
+
+async def _sync_leaderboard_dimensions(db: AsyncSession, *, strava_id: int, **values) -> None:
+    # leaderboard_rollups keeps copies of sex/birth_year for index-only filtering; keep them current
+    await db.execute(
+        update(LeaderboardRollup)
+        .where(LeaderboardRollup.user_strava_id == strava_id)
+        .values(**values)
+    )
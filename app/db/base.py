@@ -14,3 +14,9 @@ from app.models.event_distance import EventDistance
 from app.models.registration import Registration
 from app.models.race_result import RaceResult
 from app.models.virtual_result import VirtualResult
+from app.models.leaderboard_entry import LeaderboardEntry
+from app.models.personal_best import PersonalBest
+from app.models.leaderboard_rollup import LeaderboardRollup
+from app.models.start_wave import StartWave
+from app.models.station_crossing import StationCrossing
+from app.models.strava_webhook_event import StravaWebhookEvent
@@ -0,0 +1,151 @@
+# app/db/migrations.py
+# Lightweight, idempotent schema migrations for existing databases.
+# Base.metadata.create_all() creates missing tables (and their indexes), but it never
+# alters a table that already exists. Each migration below adds the columns/indexes a
+# newer model expects and backfills existing rows. They run on every startup (init_db)
+# and can be run by hand with `python -m app.cli migrate`.
+
+from typing import Iterable, List
+
+from sqlalchemy import inspect, update, extract, select, func
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateIndex
+
+from app.core.distances import distance_bucket_expr
+from app.core.positions import POSITION_COLUMNS, positions_update_stmts
+from app.db.base import Base
+
+
+def _add_missing_columns(conn: Connection, table_name: str, column_names: Iterable[str]) -> List[str]:
+    """ALTER TABLE ... ADD COLUMN for each model column the table lacks. Returns the added names."""
+    table = Base.metadata.tables[table_name]
+    existing = {column["name"] for column in inspect(conn).get_columns(table_name)}
+    added = []
+    for name in column_names:
+        if name in existing:
+            continue
+        column_type = table.c[name].type.compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}")
+        added.append(name)
+    return added
+
+
+def _create_missing_indexes(conn: Connection, table_name: str) -> None:
+    if not inspect(conn).has_table(table_name):
+        return # create_all builds it, indexes included
+    # IF NOT EXISTS rather than checkfirst: reflection does not report expression indexes
+    for index in Base.metadata.tables[table_name].indexes:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _migrate_distance_buckets(conn: Connection) -> None:
+    """virtual_results.distance_bucket/activity_year and event_distances.distance_bucket."""
+    virtual_results = Base.metadata.tables["virtual_results"]
+    if _add_missing_columns(conn, "virtual_results", ["distance_bucket", "activity_year"]):
+        conn.execute(
+            update(virtual_results).values(
+                distance_bucket=distance_bucket_expr(virtual_results.c.distance_km),
+                activity_year=extract('year', virtual_results.c.activity_date),
+            )
+        )
+    _create_missing_indexes(conn, "virtual_results")
+
+    event_distances = Base.metadata.tables["event_distances"]
+    if _add_missing_columns(conn, "event_distances", ["distance_bucket"]):
+        conn.execute(
+            update(event_distances).values(distance_bucket=distance_bucket_expr(event_distances.c.distance_km))
+        )
+    _create_missing_indexes(conn, "event_distances")
+
+
+def _migrate_leaderboard_rank_indexes(conn: Connection) -> None:
+    """Rank indexes now end with user_strava_id (tie-break of keyset pages and rank counts)."""
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_leaderboard_entries_year_bucket_pace")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_personal_bests_bucket_pace")
+    _create_missing_indexes(conn, "leaderboard_entries")
+    _create_missing_indexes(conn, "personal_bests")
+
+
+def _migrate_athlete_dimensions(conn: Connection) -> None:
+    """strava_users.sex/birth_year for the category, sex and age group leaderboards."""
+    if inspect(conn).has_table("strava_users"):
+        _add_missing_columns(conn, "strava_users", ["sex", "birth_year"])
+    # leaderboard_rollups itself is new, so create_all builds it; fill it with `python -m app.cli rebuild-leaderboard`
+
+
+def _migrate_race_result_chips(conn: Connection) -> None:
+    """race_results.chip_id for chip timing (filled by the admin chip assignment, no backfill)."""
+    if inspect(conn).has_table("race_results"):
+        _add_missing_columns(conn, "race_results", ["chip_id"])
+    # Its index is created by _migrate_race_result_event_ids, once every indexed column exists
+
+
+def _check_unique_dorsals(conn: Connection) -> None:
+    """
+    Refuses to go on if an event has a dorsal on several race results: the unique index
+    would fail to build, and which athlete keeps the number is for the organiser to decide.
+    """
+    if "uq_race_results_event_dorsal" in {index["name"] for index in inspect(conn).get_indexes("race_results")}:
+        return
+    race_results = Base.metadata.tables["race_results"]
+    duplicates = conn.execute(
+        select(race_results.c.event_id, race_results.c.dorsal_number, func.group_concat(race_results.c.id))
+        .where(race_results.c.dorsal_number.isnot(None))
+        .group_by(race_results.c.event_id, race_results.c.dorsal_number)
+        .having(func.count(race_results.c.id) > 1)
+        .order_by(race_results.c.event_id, race_results.c.dorsal_number)
+    ).all()
+    if duplicates:
+        listed = "; ".join(
+            f"event {event_id} dorsal {dorsal_number} (race_results {ids})" for event_id, dorsal_number, ids in duplicates
+        )
+        raise RuntimeError(
+            f"Cannot add the unique (event_id, dorsal_number) index: {len(duplicates)} dorsals are assigned more than once: "
+            f"{listed}. Reassign or clear those dorsals (UPDATE race_results SET dorsal_number = ...), then restart."
+        )
+
+
+def _migrate_race_result_event_ids(conn: Connection) -> None:
+    """race_results.event_id (copied from the registration) and the unique (event_id, dorsal_number) index."""
+    if not inspect(conn).has_table("race_results"):
+        return
+    if _add_missing_columns(conn, "race_results", ["event_id"]):
+        race_results = Base.metadata.tables["race_results"]
+        registrations = Base.metadata.tables["registrations"]
+        conn.execute(
+            update(race_results).values(
+                event_id=select(registrations.c.event_id)
+                .where(registrations.c.id == race_results.c.registration_id)
+                .scalar_subquery()
+            )
+        )
+    _check_unique_dorsals(conn)
+    _create_missing_indexes(conn, "race_results")
+
+
+def _migrate_race_result_positions(conn: Connection) -> None:
+    """race_results overall/category/sex positions and gap to leader, backfilled for every event."""
+    if not inspect(conn).has_table("race_results"):
+        return
+    tables = Base.metadata.tables
+    added = _add_missing_columns(conn, "race_results", POSITION_COLUMNS)
+    timed = conn.execute(select(tables["race_results"].c.id).where(tables["race_results"].c.net_time_seconds.isnot(None)).limit(1)).first()
+    if added and timed:
+        for stmt in positions_update_stmts(tables["race_results"], tables["registrations"], tables["strava_users"]):
+            conn.execute(stmt)
+
+
+# Applied in order; every migration must be safe to run again on an up-to-date schema.
+MIGRATIONS = [
+    _migrate_distance_buckets,
+    _migrate_leaderboard_rank_indexes,
+    _migrate_athlete_dimensions,
+    _migrate_race_result_chips,
+    _migrate_race_result_event_ids,
+    _migrate_race_result_positions,
+]
+
+
+def run_migrations(conn: Connection) -> None:
+    for migration in MIGRATIONS:
+        migration(conn)
@@ -5,6 +5,7 @@ from sqlalchemy.orm import sessionmaker
 
 from app.config import Settings
 from app.db.base import Base
+from app.db.migrations import run_migrations
 # Import models to ensure they are registered with Base.metadata
 from app.models.strava_user import StravaUserDB # Ensure StravaUserDB is imported
 
@@ -29,3 +30,5 @@ async def init_db():
     async with async_engine.begin() as conn:
         # In a real application, you might use Alembic for migrations
         await conn.run_sync(Base.metadata.create_all)
+        # Bring tables that predate newer columns/indexes up to date (see app/db/migrations.py)
+        await conn.run_sync(run_migrations)
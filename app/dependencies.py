@@ -1,6 +1,6 @@
 from typing import Optional
 
-from fastapi import Depends, HTTPException, status, Request
+from fastapi import Depends, HTTPException, status, Request, WebSocket
 from fastapi.responses import RedirectResponse # Ensure RedirectResponse is imported
 from fastapi.security import OAuth2PasswordBearer
 
@@ -32,6 +32,14 @@ async def get_current_user_strava_id_optional(request: Request) -> Optional[int]
         # Optionally log the exception here
         return None
 
+async def get_admin_username_from_websocket(websocket: WebSocket) -> Optional[str]:
+    # WebSocket routes can't use the Request-based admin dependency; same admin cookie, checked by hand
+    token = websocket.cookies.get("admin_access_token")
+    payload = verify_token(token) if token else None
+    if not payload or not payload.get("is_admin"):
+        return None
+    return payload.get("sub")
+
 async def get_current_user_strava_id(strava_id_from_optional: Optional[int] = Depends(get_current_user_strava_id_optional)) -> int:
     # Renamed parameter to avoid conflict with the strava_id variable from the outer scope if this was nested
     if strava_id_from_optional is None:
@@ -50,6 +58,13 @@ async def get_db_session() -> AsyncSession: # Make sure this return type matches
     async with AsyncSessionFactory() as session:
         yield session
 
+import httpx
+from app.core.http_client import http_client
+
+def get_http_client() -> httpx.AsyncClient:
+    """The app-wide pooled client; never closed by the request using it."""
+    return http_client.get()
+
 # Example usage (not part of this file, just for context):
 # from fastapi import APIRouter
 # router = APIRouter()
@@ -8,12 +8,35 @@ from fastapi.responses import HTMLResponse # Added HTMLResponse
 from app.db.session import init_db, get_db_session, AsyncSession # Import get_db_session, AsyncSession
 from app.dependencies import get_current_user_strava_id_optional # Import the optional dependency
 from app.crud.crud_strava_user import get_user_by_strava_id # Import crud function
+from app.config import Settings
+from app.db.session import AsyncSessionFactory
+from app.services import chip_timing_service, sync_scheduler_service, strava_webhook_service
+from app.services.timing_journal_service import timing_journal
+from app.core.http_client import http_client
+from app.core.rate_limit import strava_rate_limit
+
+settings = Settings()
 
 app = FastAPI()
 
 @app.on_event("startup")
 async def on_startup():
     await init_db()
+    http_client.start(settings)
+    if settings.CHIP_READER_ENABLED:
+        await chip_timing_service.start_chip_reader(settings, session_factory=AsyncSessionFactory)
+    if settings.STRAVA_SYNC_SCHEDULER_ENABLED:
+        sync_scheduler_service.start_sync_scheduler(settings, session_factory=AsyncSessionFactory, budget=strava_rate_limit)
+    if settings.STRAVA_WEBHOOK_VERIFY_TOKEN:
+        await strava_webhook_service.start_webhook_workers(settings, session_factory=AsyncSessionFactory, budget=strava_rate_limit)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await chip_timing_service.stop_chip_reader() # Writes the crossings still queued
+    await sync_scheduler_service.stop_sync_scheduler()
+    await strava_webhook_service.stop_webhook_workers()
+    timing_journal.close()
+    await http_client.close()
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
@@ -24,6 +47,7 @@ from app.routers import auth as auth_router # Import the auth router
 from app.routers import user as user_router # Import the user router
 from app.routers import event_admin as event_admin_router # Import the event admin router
 from app.routers import admin_auth as admin_auth_router # Import the admin_auth router
+from app.routers import webhooks as webhooks_router
 
 app.include_router(registration.router)
 app.include_router(race.router)
@@ -31,6 +55,7 @@ app.include_router(auth_router.router) # Include the auth router
 app.include_router(user_router.router) # Include the user router
 app.include_router(event_admin_router.router) # Include the event admin router
 app.include_router(admin_auth_router.router) # Include the admin_auth router
+app.include_router(webhooks_router.router)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -9,6 +9,12 @@ from .event_distance import EventDistance
 from .registration import Registration, RegistrationStatus
 from .race_result import RaceResult
 from .virtual_result import VirtualResult
+from .leaderboard_entry import LeaderboardEntry
+from .personal_best import PersonalBest
+from .leaderboard_rollup import LeaderboardRollup
+from .start_wave import StartWave
+from .station_crossing import StationCrossing
+from .strava_webhook_event import StravaWebhookEvent
 
 # It's also good practice to ensure that related models have their relationships defined correctly.
 # For example, StravaUserDB might need a 'registrations' and 'virtual_results' relationship.
@@ -1,5 +1,6 @@
 from sqlalchemy import Column, Integer, Float, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
+from app.core.distances import distance_bucket_for
 from app.db.base import Base
 
 class EventDistance(Base):
@@ -8,7 +9,14 @@ class EventDistance(Base):
     id = Column(Integer, primary_key=True, index=True)
     distance_km = Column(Float, nullable=False)
     event_id = Column(Integer, ForeignKey("events.id"), nullable=False)
+    # Standard distance this course counts towards (NULL if none), derived from distance_km
+    distance_bucket = Column(Float, nullable=True, index=True)
 
     # Relationships
     event = relationship("Event", back_populates="distances")
     registrations = relationship("Registration", back_populates="distance", cascade="all, delete-orphan")
+
+    @validates("distance_km")
+    def _set_distance_bucket(self, key, distance_km):
+        self.distance_bucket = distance_bucket_for(distance_km)
+        return distance_km
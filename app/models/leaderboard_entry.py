@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.orm import relationship
+from app.db.base import Base
+
+class LeaderboardEntry(Base):
+    __tablename__ = "leaderboard_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    bucket_km = Column(Float, nullable=False) # One of STANDARD_DISTANCES_KM
+    year = Column(Integer, nullable=False)
+    user_strava_id = Column(Integer, ForeignKey("strava_users.strava_id"), nullable=False)
+    best_pace_seconds_per_km = Column(Float, nullable=False)
+    time_seconds = Column(Integer, nullable=False)
+    distance_km = Column(Float, nullable=False) # Actual distance of the best effort
+    # Where the best effort came from: "Race" -> race_results.id, "Virtual" -> virtual_results.id
+    source = Column(String, nullable=False)
+    source_id = Column(Integer, nullable=False)
+    event_name = Column(String, nullable=True)
+    activity_date = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # One row per athlete per standard distance per year; target of the upsert
+        UniqueConstraint("bucket_km", "year", "user_strava_id", name="uq_leaderboard_entries_bucket_year_user"),
+        # Serves the ranked reads (WHERE year = ? AND bucket_km = ? ORDER BY pace, time, user),
+        # keyset page seeks and rank counts without touching the table
+        Index(
+            "ix_leaderboard_entries_year_bucket_rank",
+            "year", "bucket_km", "best_pace_seconds_per_km", "time_seconds", "user_strava_id",
+        ),
+    )
+
+    # Relationship
+    user = relationship("StravaUserDB")
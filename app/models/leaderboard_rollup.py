@@ -0,0 +1,49 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.orm import relationship
+from app.db.base import Base
+
+# Sentinels for the "every year" and "every category" slices, kept NOT NULL so they take part in the unique key
+ALL_YEARS = 0
+ALL_CATEGORIES = ""
+
+class LeaderboardRollup(Base):
+    """
+    Best effort per athlete for every (year, bucket, category) slice, with the athlete's
+    sex and birth year copied in so boards can be filtered by them from the index.
+    Each result feeds four slices: its year and ALL_YEARS, its category and ALL_CATEGORIES.
+    """
+    __tablename__ = "leaderboard_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(Integer, nullable=False) # ALL_YEARS for the overall board
+    bucket_km = Column(Float, nullable=False) # One of STANDARD_DISTANCES_KM
+    category = Column(String, nullable=False) # EventCategory.name, or ALL_CATEGORIES
+    user_strava_id = Column(Integer, ForeignKey("strava_users.strava_id"), nullable=False)
+    sex = Column(String, nullable=True) # Copy of strava_users.sex
+    birth_year = Column(Integer, nullable=True) # Copy of strava_users.birth_year
+    best_pace_seconds_per_km = Column(Float, nullable=False)
+    time_seconds = Column(Integer, nullable=False)
+    distance_km = Column(Float, nullable=False) # Actual distance of the best effort
+    # Where the best effort came from: "Race" -> race_results.id, "Virtual" -> virtual_results.id
+    source = Column(String, nullable=False)
+    source_id = Column(Integer, nullable=False)
+    event_name = Column(String, nullable=True)
+    activity_date = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # One row per athlete per slice; target of the upsert
+        UniqueConstraint("year", "category", "bucket_km", "user_strava_id", name="uq_leaderboard_rollups_slice_user"),
+        # Filtered boards (all buckets at once) seek on the slice, then sex, then a birth year range
+        Index(
+            "ix_leaderboard_rollups_slice_sex_birth",
+            "year", "category", "sex", "birth_year", "bucket_km", "best_pace_seconds_per_km", "time_seconds",
+        ),
+        # Age group filter without a sex filter
+        Index(
+            "ix_leaderboard_rollups_slice_birth",
+            "year", "category", "birth_year", "bucket_km", "best_pace_seconds_per_km", "time_seconds",
+        ),
+    )
+
+    # Relationship
+    user = relationship("StravaUserDB")
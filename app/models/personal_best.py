@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.orm import relationship
+from app.db.base import Base
+
+class PersonalBest(Base):
+    __tablename__ = "personal_bests"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_strava_id = Column(Integer, ForeignKey("strava_users.strava_id"), nullable=False)
+    bucket_km = Column(Float, nullable=False) # One of STANDARD_DISTANCES_KM
+    best_pace_seconds_per_km = Column(Float, nullable=False)
+    time_seconds = Column(Integer, nullable=False)
+    distance_km = Column(Float, nullable=False) # Actual distance of the best effort
+    # Where the best effort came from: "Race" -> race_results.id, "Virtual" -> virtual_results.id
+    source = Column(String, nullable=False)
+    source_id = Column(Integer, nullable=False)
+    event_name = Column(String, nullable=True)
+    activity_date = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # One row per athlete per standard distance; the dashboard reads all of a user's rows through it
+        UniqueConstraint("user_strava_id", "bucket_km", name="uq_personal_bests_user_bucket"),
+        # All-time leaderboard: WHERE bucket_km = ? ORDER BY pace, time, user (pages and rank counts too)
+        Index("ix_personal_bests_bucket_rank", "bucket_km", "best_pace_seconds_per_km", "time_seconds", "user_strava_id"),
+    )
+
+    # Relationship
+    user = relationship("StravaUserDB")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.db.base import Base
 
@@ -7,10 +7,23 @@ class RaceResult(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     registration_id = Column(Integer, ForeignKey("registrations.id"), unique=True, nullable=False)
+    # Copy of registrations.event_id, so a dorsal can be unique per event at the database level
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=True)
     dorsal_number = Column(Integer, nullable=True)
+    chip_id = Column(String, nullable=True, index=True) # Timing chip worn with the dorsal, read at the finish mats
     start_time = Column(DateTime(timezone=True), nullable=True)
     finish_time = Column(DateTime(timezone=True), nullable=True)
     net_time_seconds = Column(Integer, nullable=True) # Store duration in seconds for easy calculation
+    # Denormalized standings within the event distance (see app/core/positions.py), kept current on every finish
+    overall_position = Column(Integer, nullable=True)
+    category_position = Column(Integer, nullable=True)
+    sex_position = Column(Integer, nullable=True) # NULL when the athlete's sex is unknown
+    gap_to_leader_seconds = Column(Integer, nullable=True)
 
     # Relationship
     registration = relationship("Registration", back_populates="race_result")
+
+    __table_args__ = (
+        # NULL dorsals (not assigned yet) don't conflict
+        Index("uq_race_results_event_dorsal", "event_id", "dorsal_number", unique=True),
+    )
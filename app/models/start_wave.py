@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.db.base import Base
+
+class StartWave(Base):
+    """
+    Start gun time of one wave: every registration of a distance, or only one category of it.
+    A category wave takes precedence over the distance-wide wave for that category's athletes.
+    """
+    __tablename__ = "start_waves"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_distance_id = Column(Integer, ForeignKey("event_distances.id"), nullable=False)
+    event_category_id = Column(Integer, ForeignKey("event_categories.id"), nullable=True) # NULL: the whole distance
+    start_time = Column(DateTime(timezone=True), nullable=False)
+
+    distance = relationship("EventDistance")
+    category = relationship("EventCategory")
+
+    __table_args__ = (
+        UniqueConstraint("event_distance_id", "event_category_id", name="uq_start_waves_distance_category"),
+    )
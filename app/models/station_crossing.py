@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.db.base import Base
+
+class StationCrossing(Base):
+    """
+    A finish-line crossing uploaded by a timing station, kept as received. The station's
+    crossing_id is the idempotency key: a retried upload finds it here and changes nothing.
+    Of all crossings of a dorsal, the one holding the RaceResult's finish is `recorded`.
+    """
+    __tablename__ = "station_crossings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=False)
+    station_id = Column(String, nullable=False)
+    batch_id = Column(String, nullable=False)
+    crossing_id = Column(String, nullable=False)
+    dorsal_number = Column(Integer, nullable=False)
+    finish_time = Column(DateTime(timezone=True), nullable=False)
+    race_result_id = Column(Integer, ForeignKey("race_results.id"), nullable=True) # NULL: unknown dorsal
+    outcome = Column(String, nullable=False) # StationCrossingOutcome value
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    race_result = relationship("RaceResult")
+
+    __table_args__ = (
+        UniqueConstraint("station_id", "crossing_id", name="uq_station_crossings_station_crossing"),
+        Index("ix_station_crossings_station_batch", "station_id", "batch_id"),
+        Index("ix_station_crossings_race_result", "race_result_id"),
+    )
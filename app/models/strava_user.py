@@ -61,6 +61,8 @@ class StravaUserDB(Base):
     firstname: Optional[str] = Column(String, nullable=True)
     lastname: Optional[str] = Column(String, nullable=True)
     profile_picture_url: Optional[str] = Column(String, nullable=True)
+    sex: Optional[str] = Column(String, nullable=True) # As reported by Strava: "M", "F" or None
+    birth_year: Optional[int] = Column(Integer, nullable=True) # Entered by the athlete; Strava does not share it
     
     encrypted_access_token: str = Column(String, nullable=False)
     encrypted_refresh_token: str = Column(String, nullable=False)
@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, BigInteger, Float, String, DateTime, Text, Index
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class StravaWebhookEvent(Base):
+    """
+    A Strava webhook event, stored as received before it is acknowledged so none is lost
+    if the app stops before a worker applies it (see strava_webhook_service). This table
+    is the queue: workers claim `pending` rows oldest first.
+    """
+    __tablename__ = "strava_webhook_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    object_type = Column(String, nullable=False) # "activity" or "athlete"
+    object_id = Column(BigInteger, nullable=False) # Activity id, or the athlete id
+    aspect_type = Column(String, nullable=False) # "create", "update" or "delete"
+    owner_id = Column(Integer, nullable=False) # Athlete id
+    updates = Column(Text, nullable=True) # JSON, e.g. {"title": "..."} or {"authorized": "false"}
+    event_time = Column(Integer, nullable=True) # Unix seconds, as sent
+    status = Column(String, nullable=False, default="pending") # pending, processing, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    retry_at = Column(Float, nullable=True) # Unix seconds; a failed attempt isn't claimed again before
+    last_error = Column(String, nullable=True)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Claiming: WHERE status = 'pending' ORDER BY id
+        Index("ix_strava_webhook_events_status_id", "status", "id"),
+    )
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship, validates
+from app.core.distances import distance_bucket_for
 from app.db.base import Base
 
 class VirtualResult(Base):
@@ -14,7 +15,34 @@ class VirtualResult(Base):
     distance_km = Column(Float, nullable=False)
     elapsed_time_seconds = Column(Integer, nullable=False) # Duration in seconds
     activity_date = Column(DateTime(timezone=True), nullable=False)
+    # Derived from distance_km / activity_date (see validators below) so leaderboard
+    # and personal best queries can filter in SQL. NULL bucket = no standard distance.
+    distance_bucket = Column(Float, nullable=True)
+    activity_year = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        # Leaderboard rebuilds: WHERE distance_bucket = ? AND activity_year = ? ORDER BY pace
+        Index(
+            "ix_virtual_results_bucket_year_pace",
+            distance_bucket, activity_year, elapsed_time_seconds / distance_km,
+        ),
+        # Personal bests: WHERE user_strava_id = ? AND distance_bucket IS NOT NULL ORDER BY pace
+        Index(
+            "ix_virtual_results_user_bucket_pace",
+            user_strava_id, distance_bucket, elapsed_time_seconds / distance_km,
+        ),
+    )
 
     # Relationships
     user = relationship("StravaUserDB", back_populates="virtual_results")
     event = relationship("Event", back_populates="virtual_results") # If linked to a specific event
+
+    @validates("distance_km")
+    def _set_distance_bucket(self, key, distance_km):
+        self.distance_bucket = distance_bucket_for(distance_km)
+        return distance_km
+
+    @validates("activity_date")
+    def _set_activity_year(self, key, activity_date):
+        self.activity_year = activity_date.year if activity_date else None
+        return activity_date
@@ -6,6 +6,10 @@ from typing import Optional
 from app.config import Settings
 from app.core.security import verify_admin_password, create_access_token
 from app.dependencies import require_admin_auth # Import the dependency
+from app.services.result_service import results_cache
+from app.services import chip_timing_service, sync_scheduler_service, strava_webhook_service
+from app.core.http_client import http_client
+from app.core.rate_limit import strava_rate_limit
 # No db session needed for basic admin login if checking against .env
 
 settings = Settings()
@@ -85,3 +89,51 @@ async def admin_dashboard_page(
         "admin/dashboard_admin.html", 
         {"request": request, "admin_user": admin_username} # Pass admin_username if needed by template
     )
+
+
+@router.get("/cache-stats", name="admin_cache_stats")
+async def admin_cache_stats(
+    admin_username: Optional[str] = Depends(require_admin_auth) # Protect route
+):
+    # Hit/miss/eviction counters of this worker's results cache
+    return results_cache.stats()
+
+
+@router.get("/chip-reader-stats", name="admin_chip_reader_stats")
+async def admin_chip_reader_stats(
+    admin_username: Optional[str] = Depends(require_admin_auth) # Protect route
+):
+    # Read/batch counters of this worker's chip reader listener, if it runs
+    reader = chip_timing_service.chip_reader
+    if reader is None:
+        return {"enabled": False}
+    return {"enabled": True, "event_id": reader.ingestor.event_id, "pending": reader.ingestor.pending(), **reader.ingestor.stats}
+
+
+@router.get("/http-client-stats", name="admin_http_client_stats")
+async def admin_http_client_stats(
+    admin_username: Optional[str] = Depends(require_admin_auth) # Protect route
+):
+    # Pool and request counters of this worker's outgoing HTTP client
+    return http_client.metrics()
+
+
+@router.get("/sync-scheduler-stats", name="admin_sync_scheduler_stats")
+async def admin_sync_scheduler_stats(
+    admin_username: Optional[str] = Depends(require_admin_auth) # Protect route
+):
+    # Background Strava sync counters and the quota it spends from
+    scheduler = sync_scheduler_service.sync_scheduler
+    stats = {"enabled": False} if scheduler is None else {"enabled": True, **scheduler.stats}
+    return {**stats, "rate_limit": strava_rate_limit.snapshot()}
+
+
+@router.get("/strava-webhook-stats", name="admin_strava_webhook_stats")
+async def admin_strava_webhook_stats(
+    admin_username: Optional[str] = Depends(require_admin_auth) # Protect route
+):
+    # Webhook queue by status and this worker's counters
+    workers = strava_webhook_service.webhook_workers
+    if workers is None:
+        return {"enabled": False}
+    return {"enabled": True, **(await workers.queue_stats())}
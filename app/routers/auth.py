@@ -12,9 +12,10 @@ from app.config import Settings
 from app.core.security import create_access_token, verify_token, decrypt_token # Added verify_token, decrypt_token
 from app.crud.crud_strava_user import create_or_update_strava_user, get_user_by_strava_id # Added get_user_by_strava_id
 from app.db.session import get_db_session
-from app.dependencies import oauth2_scheme, get_current_user_strava_id_optional # Import the scheme and optional dependency
+from app.dependencies import oauth2_scheme, get_current_user_strava_id_optional, get_http_client # Import the scheme and optional dependency
 from app.models.strava_user import StravaAthleteData, StravaTokenData # Pydantic models for validation
 from app.schemas.token import Token # Pydantic model for the response
+from app.services.strava_service import STRAVA_API_BASE_URL, STRAVA_AUTHORIZE_URL, STRAVA_DEAUTHORIZE_URL, STRAVA_OAUTH_URL # Follow STRAVA_BASE_URL
 # httpx is already imported
 # Settings is already imported
 # RedirectResponse is already imported
@@ -43,7 +44,7 @@ async def strava_login():
     Redirects the user to Strava's authorization page.
     """
     auth_url = (
-        f"https://www.strava.com/oauth/authorize"
+        f"{STRAVA_AUTHORIZE_URL}"
         f"?client_id={settings.STRAVA_CLIENT_ID}"
         f"&redirect_uri={settings.STRAVA_REDIRECT_URI}"
         f"&response_type=code"
@@ -58,7 +59,8 @@ async def strava_callback(
     code: Optional[str] = None,
     error: Optional[str] = None,
     scope: Optional[str] = None, # Strava returns granted scope in the callback
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_db_session),
+    client: httpx.AsyncClient = Depends(get_http_client)
 ):
     """
     Handles the callback from Strava after user authorization.
@@ -73,7 +75,7 @@ async def strava_callback(
         raise HTTPException(status_code=400, detail="Authorization code not provided by Strava.")
 
     # 1. Exchange code for token
-    token_url = "https://www.strava.com/oauth/token"
+    token_url = STRAVA_OAUTH_URL
     payload = {
         "client_id": settings.STRAVA_CLIENT_ID,
         "client_secret": settings.STRAVA_CLIENT_SECRET,
@@ -85,16 +87,15 @@ async def strava_callback(
     athlete_summary_from_token_exchange: Optional[dict] = None # Strava includes athlete summary here
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(token_url, data=payload)
-            response.raise_for_status() # Raises HTTPStatusError for 4xx/5xx responses
-            token_response_data = response.json()
-            
-            # Validate with Pydantic model
-            strava_token_data = StravaTokenData(**token_response_data)
-            # The athlete summary is included in the token exchange response
-            if 'athlete' in token_response_data:
-                athlete_summary_from_token_exchange = token_response_data['athlete']
+        response = await client.post(token_url, data=payload)
+        response.raise_for_status() # Raises HTTPStatusError for 4xx/5xx responses
+        token_response_data = response.json()
+        
+        # Validate with Pydantic model
+        strava_token_data = StravaTokenData(**token_response_data)
+        # The athlete summary is included in the token exchange response
+        if 'athlete' in token_response_data:
+            athlete_summary_from_token_exchange = token_response_data['athlete']
 
     except httpx.HTTPStatusError as e:
         # Log error details for debugging
@@ -115,14 +116,13 @@ async def strava_callback(
         strava_athlete_data = StravaAthleteData(**athlete_summary_from_token_exchange)
     else:
         # Fallback to fetching athlete data if not in token response (should not happen with current Strava API)
-        athlete_url = "https://www.strava.com/api/v3/athlete"
+        athlete_url = f"{STRAVA_API_BASE_URL}/athlete"
         headers = {"Authorization": f"Bearer {strava_token_data.access_token}"}
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(athlete_url, headers=headers)
-                response.raise_for_status()
-                athlete_api_data = response.json()
-                strava_athlete_data = StravaAthleteData(**athlete_api_data)
+            response = await client.get(athlete_url, headers=headers)
+            response.raise_for_status()
+            athlete_api_data = response.json()
+            strava_athlete_data = StravaAthleteData(**athlete_api_data)
         except httpx.HTTPStatusError as e:
             # print(f"HTTP error during athlete data fetch: {e.response.text}")
             raise HTTPException(status_code=400, detail=f"Failed to fetch athlete data: {e.response.text}")
@@ -177,7 +177,8 @@ async def strava_callback(
 async def strava_logout(
     request: Request, 
     db: AsyncSession = Depends(get_db_session), 
-    token: str = Depends(oauth2_scheme) # Use the dependency to get token
+    token: str = Depends(oauth2_scheme), # Use the dependency to get token
+    client: httpx.AsyncClient = Depends(get_http_client)
 ):
     """
     Handles user logout:
@@ -216,26 +217,25 @@ async def strava_logout(
         # For now, let's assume this means we can't proceed with Strava deauth.
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not process user credentials for Strava deauthorization.")
 
-    deauthorize_url = "https://www.strava.com/oauth/deauthorize"
+    deauthorize_url = STRAVA_DEAUTHORIZE_URL
     # Strava's deauthorize endpoint expects the access_token as a POST parameter (form data).
     # The header "Authorization: Bearer <token>" is for API calls, not for this deauth call.
     form_data = {"access_token": strava_access_token} 
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(deauthorize_url, data=form_data)
-            # Strava returns 200 OK on successful deauthorization.
-            # It also returns 200 OK even if the token was already invalid or revoked.
-            if response.status_code != 200:
-                # This indicates a problem with the request itself or Strava's service
-                # print(f"Error deauthorizing from Strava: {response.status_code} - {response.text}")
-                # Don't fail the whole logout for this, but good to log.
-                pass # Or raise an internal error if strict deauth is required
-        except httpx.RequestError as e:
-            # Network error or similar when trying to reach Strava
-            # print(f"RequestError during Strava deauthorization: {str(e)}")
-            # Don't fail the whole logout for this.
-            pass
+    try:
+        response = await client.post(deauthorize_url, data=form_data)
+        # Strava returns 200 OK on successful deauthorization.
+        # It also returns 200 OK even if the token was already invalid or revoked.
+        if response.status_code != 200:
+            # This indicates a problem with the request itself or Strava's service
+            # print(f"Error deauthorizing from Strava: {response.status_code} - {response.text}")
+            # Don't fail the whole logout for this, but good to log.
+            pass # Or raise an internal error if strict deauth is required
+    except httpx.RequestError as e:
+        # Network error or similar when trying to reach Strava
+        # print(f"RequestError during Strava deauthorization: {str(e)}")
+        # Don't fail the whole logout for this.
+        pass
 
     # Client is responsible for deleting the JWT.
     # Redirecting to login page might be a good UX.
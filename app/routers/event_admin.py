@@ -1,18 +1,24 @@
-from fastapi import APIRouter, Depends, Request, HTTPException, Form, status # Added status
+from fastapi import APIRouter, Depends, Request, HTTPException, Form, status, WebSocket, WebSocketDisconnect # Added status
 from fastapi.responses import HTMLResponse, RedirectResponse # Added RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import date, datetime # date for Form, datetime for combining
 
-from app.dependencies import get_db_session, require_admin_auth # Added require_admin_auth
+from app.dependencies import get_db_session, require_admin_auth, get_admin_username_from_websocket # Added require_admin_auth
+from app.db.session import AsyncSessionFactory
+from app.config import Settings
 from app.services import event_service, race_service
 from app.schemas.event import EventCreate, EventRead, EventType
 from app.schemas.event_category import EventCategoryCreate, EventCategoryRead
 from app.schemas.event_distance import EventDistanceCreate, EventDistanceRead
 from app.schemas.registration import RegistrationRead
-from app.schemas.race_result import RaceResultRead
+from app.schemas.race_result import RaceResultRead, BulkFinishRequest, BulkFinishResponse, ChipAssignmentRequest
+from app.schemas.race_result import DorsalAllocationRequest, DorsalAllocationResponse, StationBatchRequest, StationBatchResponse
 from app.services.user_service import get_event_registrations_for_admin
+from app.services.timing_console_service import TimingConsole
+
+settings = Settings()
 
 router = APIRouter(
     prefix="/admin/events",
@@ -231,6 +237,27 @@ async def assign_dorsal_to_registration(
     except HTTPException as e:
         raise e
 
+@router.post("/{event_id}/allocate_dorsals", response_model=DorsalAllocationResponse)
+async def allocate_dorsals_route(
+    event_id: int,
+    allocation: DorsalAllocationRequest,
+    db: AsyncSession = Depends(get_db_session),
+    admin_user: Optional[str] = Depends(require_admin_auth)
+):
+    # Numbers every registration still without a dorsal in one go
+    return await race_service.allocate_dorsals(db=db, event_id=event_id, allocation=allocation)
+
+@router.post("/{event_id}/chips")
+async def assign_chips_route(
+    event_id: int,
+    assignments: ChipAssignmentRequest,
+    db: AsyncSession = Depends(get_db_session),
+    admin_user: Optional[str] = Depends(require_admin_auth)
+):
+    # Pairs timing chips with assigned dorsals for the chip reader listener
+    updated = await race_service.assign_chip_ids(db=db, event_id=event_id, chips=assignments.chips)
+    return {"assigned": updated}
+
 @router.post("/{event_id}/distance/{distance_id}/start_timer", response_model=List[RaceResultRead])
 async def trigger_start_timer_for_distance(
     event_id: int,
@@ -251,6 +278,25 @@ async def trigger_start_timer_for_distance(
     except HTTPException as e:
         raise e
 
+@router.post("/{event_id}/distance/{distance_id}/start_wave", response_class=RedirectResponse)
+async def correct_wave_start_time(
+    event_id: int,
+    distance_id: int,
+    start_time: datetime = Form(...),
+    event_category_id: Optional[str] = Form(None), # Empty: the whole distance
+    db: AsyncSession = Depends(get_db_session),
+    admin_user: Optional[str] = Depends(require_admin_auth)
+):
+    # Sets or corrects a wave's start gun time; net times of finished athletes are recomputed
+    await race_service.update_event_distance_start_time(
+        db=db, event_id=event_id, distance_id=distance_id, new_start_time=start_time,
+        category_id=int(event_category_id) if event_category_id else None,
+    )
+    return RedirectResponse(
+        url=router.url_path_for("manage_event_registrations_form", event_id=event_id),
+        status_code=status.HTTP_303_SEE_OTHER
+    )
+
 @router.post("/{event_id}/record_finish", response_model=RaceResultRead)
 async def record_athlete_finish_time_route(
     event_id: int,
@@ -270,3 +316,43 @@ async def record_athlete_finish_time_route(
         )
     except HTTPException as e:
         raise e
+
+@router.post("/{event_id}/record_finishes", response_model=BulkFinishResponse)
+async def record_athlete_finishes_bulk_route(
+    event_id: int,
+    batch: BulkFinishRequest,
+    db: AsyncSession = Depends(get_db_session),
+    admin_user: Optional[str] = Depends(require_admin_auth)
+):
+    # JSON batch endpoint for timing systems: {"finishes": [{"dorsal_number": 12, "finish_time": "..."}, ...]}
+    return await race_service.record_finishes_bulk(db=db, event_id=event_id, finishes=batch.finishes)
+
+@router.websocket("/{event_id}/timing_console")
+async def timing_console_socket(websocket: WebSocket, event_id: int):
+    # Finish entries typed by the timer, acked in batches with the updated rows (see timing_console_service)
+    if await get_admin_username_from_websocket(websocket) is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    console = TimingConsole(
+        event_id, session_factory=AsyncSessionFactory, send=websocket.send_json,
+        batch_size=settings.TIMING_CONSOLE_BATCH_SIZE, flush_interval_seconds=settings.TIMING_CONSOLE_FLUSH_INTERVAL_SECONDS,
+    )
+    console.start()
+    try:
+        while True:
+            console.submit_text(await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await console.stop() # Entries already received are still recorded
+
+@router.post("/{event_id}/station_batches", response_model=StationBatchResponse)
+async def sync_station_batch_route(
+    event_id: int,
+    batch: StationBatchRequest,
+    db: AsyncSession = Depends(get_db_session),
+    admin_user: Optional[str] = Depends(require_admin_auth)
+):
+    # Upload from a timing station that buffers crossings offline; safe to retry with the same batch_id
+    return await race_service.sync_station_batch(db=db, event_id=event_id, batch=batch)
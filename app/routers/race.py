@@ -1,17 +1,23 @@
-from fastapi import APIRouter, Depends, Request, HTTPException, Form, status
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Depends, Request, HTTPException, Form, Query, status
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Optional, Any # Added Dict, Optional, Any
 import datetime # Explicit import for datetime.datetime.now() if needed, though not directly here
+import asyncio
 
 from app.dependencies import get_db_session, get_current_user_strava_id, get_current_user_strava_id_optional
 from app.services import event_service, registration_service, result_service # Added result_service
+from app.services.live_results_service import results_hub
+from app.config import Settings
 from app.services.result_service import STANDARD_DISTANCES_KM # Import for passing to template
+from app.core.age_groups import AGE_BANDS
 from app.schemas.event import EventRead
 from app.schemas.registration import RegistrationCreate, RegistrationRead
 # from app.schemas.race_result import RaceResultRead # Not directly used as response model for HTMLResponse
 
+settings = Settings()
+
 router = APIRouter(
     prefix="/races", # Setting a prefix for all routes in this router
     tags=["races"]
@@ -123,20 +129,93 @@ async def show_event_results(
         {"request": request, "event": event, "classified_results": classified_results}
     )
 
+def _leaderboard_filters(category: Optional[str], sex: Optional[str], age_band: Optional[str]) -> Dict[str, Optional[str]]:
+    # Empty form fields mean "no filter"
+    return {"category": category or None, "sex": sex or None, "age_band": age_band or None}
+
+@router.get("/events/{event_id}/results/stream")
+async def stream_event_results(
+    request: Request,
+    event_id: int,
+    db: AsyncSession = Depends(get_db_session)
+):
+    # Server-Sent Events: one "result" event per new or changed result row, instead of page reloads
+    event = await event_service.get_event(db=db, event_id=event_id)
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    await db.close() # Give the connection back; the stream itself never touches the database
+
+    async def result_frames():
+        queue = results_hub.subscribe(event_id)
+        try:
+            yield "retry: 3000\n\n" # Browser reconnect delay
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=settings.LIVE_RESULTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            results_hub.unsubscribe(event_id, queue)
+
+    return StreamingResponse(
+        result_frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/leaderboard/{year}", response_class=HTMLResponse)
-async def show_yearly_leaderboard_for_year(request: Request, year: int, db: AsyncSession = Depends(get_db_session)):
-    leaderboard_data = await result_service.get_yearly_leaderboard(db=db, year=year)
+async def show_yearly_leaderboard_for_year(
+    request: Request,
+    year: int,
+    category: Optional[str] = None,
+    sex: Optional[str] = None,
+    age_band: Optional[str] = None,
+    db: AsyncSession = Depends(get_db_session)
+):
+    filters = _leaderboard_filters(category, sex, age_band)
+    leaderboard_data = await result_service.get_yearly_leaderboard(db=db, year=year, **filters)
     # Pass STANDARD_DISTANCES_KM to the template context
     return templates.TemplateResponse(
         "leaderboard.html",
-        {"request": request, "leaderboard_data": leaderboard_data, "year": year, "standard_distances_km_list": STANDARD_DISTANCES_KM}
+        {"request": request, "leaderboard_data": leaderboard_data, "year": year, "standard_distances_km_list": STANDARD_DISTANCES_KM,
+         "filters": filters, "age_bands": [label for label, _, _ in AGE_BANDS]}
     )
 
 @router.get("/leaderboard", response_class=HTMLResponse)
-async def show_overall_leaderboard(request: Request, db: AsyncSession = Depends(get_db_session)):
-    leaderboard_data = await result_service.get_yearly_leaderboard(db=db, year=None) # No year filter
+async def show_overall_leaderboard(
+    request: Request,
+    category: Optional[str] = None,
+    sex: Optional[str] = None,
+    age_band: Optional[str] = None,
+    db: AsyncSession = Depends(get_db_session)
+):
+    filters = _leaderboard_filters(category, sex, age_band)
+    leaderboard_data = await result_service.get_yearly_leaderboard(db=db, year=None, **filters) # No year filter
     # Pass STANDARD_DISTANCES_KM to the template context
     return templates.TemplateResponse(
         "leaderboard.html",
-        {"request": request, "leaderboard_data": leaderboard_data, "year": "Overall", "standard_distances_km_list": STANDARD_DISTANCES_KM}
+        {"request": request, "leaderboard_data": leaderboard_data, "year": "Overall", "standard_distances_km_list": STANDARD_DISTANCES_KM,
+         "filters": filters, "age_bands": [label for label, _, _ in AGE_BANDS]}
+    )
+
+# JSON API for full boards. Kept under /api so it cannot clash with /leaderboard/{year}.
+@router.get("/api/leaderboard/{distance_km}")
+async def get_leaderboard_page(
+    distance_km: float,
+    year: Optional[int] = None, # Omit for the overall (all years) board
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None, # next_cursor of the previous page
+    db: AsyncSession = Depends(get_db_session)
+):
+    return await result_service.get_leaderboard_page(db=db, distance_km=distance_km, year=year, limit=limit, cursor=cursor)
+
+@router.get("/api/leaderboard-ranks/{user_strava_id}")
+async def get_athlete_leaderboard_ranks(
+    user_strava_id: int,
+    year: Optional[int] = None,
+    distance_km: Optional[float] = None,
+    db: AsyncSession = Depends(get_db_session)
+):
+    return await result_service.get_user_leaderboard_ranks(
+        db=db, user_strava_id=user_strava_id, year=year, distance_km=distance_km
     )
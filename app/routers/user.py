@@ -1,12 +1,15 @@
-from fastapi import APIRouter, Depends, Request, HTTPException, File, UploadFile, status # Added status
+from fastapi import APIRouter, Depends, Request, HTTPException, File, UploadFile, Form, status # Added status
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
+import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Dict, Any # Added Dict, Any
+from typing import List, Dict, Any, Optional # Added Dict, Any
+import datetime
 import shutil
 from pathlib import Path
 
-from app.dependencies import get_db_session, get_current_user_strava_id
+from app.dependencies import get_db_session, get_current_user_strava_id, get_http_client
+from app.crud.crud_strava_user import get_user_by_strava_id, update_user_birth_year
 from app.services import user_service, result_service as user_result_service, virtual_event_service # Added virtual_event_service
 from app.schemas.registration import RegistrationRead
 from app.schemas.race_result import RaceResultRead
@@ -33,6 +36,8 @@ async def view_dashboard(
     registrations = await user_service.get_user_registrations(db=db, user_strava_id=strava_id)
     
     personal_bests = await user_result_service.get_user_personal_bests(db=db, user_strava_id=strava_id)
+    leaderboard_ranks = await user_result_service.get_user_leaderboard_ranks(db=db, user_strava_id=strava_id) # Overall board
+    athlete = await get_user_by_strava_id(db, strava_id=strava_id) # birth_year is not part of the public UserRead
     distinct_virtual_results = await user_service.get_user_virtual_results_summary(db=db, user_strava_id=strava_id)
 
     return templates.TemplateResponse(
@@ -43,6 +48,8 @@ async def view_dashboard(
             "registrations": registrations,
             "virtual_results_summary": distinct_virtual_results, # Use the new summary data
             "personal_bests": personal_bests,
+            "leaderboard_ranks": leaderboard_ranks,
+            "birth_year": athlete.birth_year if athlete else None,
             # "active_page": "dashboard" # Removed as not used in new template
             # Macros are defined in the template itself
         }
@@ -99,17 +106,40 @@ async def upload_payment_proof(
     # router.url_path_for("view_dashboard") should work as "view_dashboard" is the function name
     return RedirectResponse(url=router.url_path_for("view_dashboard"), status_code=status.HTTP_303_SEE_OTHER)
 
+@router.post("/profile/birth-year", response_class=RedirectResponse)
+async def set_birth_year(
+    birth_year: Optional[str] = Form(None), # Empty clears it
+    db: AsyncSession = Depends(get_db_session),
+    strava_id: int = Depends(get_current_user_strava_id)
+):
+    # Places the athlete in the leaderboard age groups; Strava does not share birth dates
+    parsed_birth_year = None
+    if birth_year:
+        if not birth_year.isdigit() or not 1900 <= int(birth_year) <= datetime.date.today().year:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid birth year.")
+        parsed_birth_year = int(birth_year)
+
+    updated_user = await update_user_birth_year(db, strava_id=strava_id, birth_year=parsed_birth_year)
+    if not updated_user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
+    return RedirectResponse(url=router.url_path_for("view_dashboard"), status_code=status.HTTP_303_SEE_OTHER)
+
 @router.post("/sync-strava", status_code=status.HTTP_200_OK)
 async def trigger_strava_sync(
     request: Request, 
     db: AsyncSession = Depends(get_db_session),
-    strava_id: int = Depends(get_current_user_strava_id) 
+    strava_id: int = Depends(get_current_user_strava_id),
+    client: httpx.AsyncClient = Depends(get_http_client)
 ):
+    pages = []
     try:
         new_count, processed_count = await virtual_event_service.sync_strava_activities_for_user(
-            db=db, user_strava_id=strava_id
+            db=db, user_strava_id=strava_id, client=client, progress=pages.append
         )
-        return {"message": f"Strava sync complete. Processed {processed_count} activities, synced {new_count} new activities."}
+        return {
+            "message": f"Strava sync complete. Processed {processed_count} activities, synced {new_count} new activities.",
+            "pages": [page._asdict() for page in pages],
+        }
     except Exception as e:
         # Log the exception e
         raise HTTPException(
@@ -0,0 +1,39 @@
+import secrets
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import Settings
+from app.dependencies import get_db_session
+from app.schemas.strava_webhook import StravaWebhookEventIn
+from app.services import strava_webhook_service
+
+settings = Settings()
+
+router = APIRouter(prefix="/webhooks", tags=["webhooks"])
+
+@router.get("/strava")
+async def strava_webhook_handshake(
+    mode: str = Query(..., alias="hub.mode"),
+    challenge: str = Query(..., alias="hub.challenge"),
+    verify_token: str = Query(..., alias="hub.verify_token"),
+):
+    """Strava's subscription check: echo the challenge if the verify token is ours."""
+    expected = settings.STRAVA_WEBHOOK_VERIFY_TOKEN
+    if mode != "subscribe" or not expected or not secrets.compare_digest(verify_token, expected):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid verify token.")
+    return {"hub.challenge": challenge}
+
+@router.post("/strava")
+async def strava_webhook_event(
+    event: StravaWebhookEventIn,
+    db: AsyncSession = Depends(get_db_session),
+):
+    """Queues the event for the workers (which check it with Strava); Strava only needs a quick 200."""
+    expected = settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID
+    if expected is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No Strava webhook subscription is configured.")
+    if event.subscription_id != expected:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Unknown subscription.")
+    await strava_webhook_service.enqueue_event(db, event)
+    return {"status": "queued"}
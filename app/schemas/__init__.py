@@ -3,8 +3,14 @@ from .event_category import EventCategoryBase, EventCategoryCreate, EventCategor
 from .event_distance import EventDistanceBase, EventDistanceCreate, EventDistanceUpdate, EventDistanceRead, EventDistanceReadMinimal
 from .strava_user import UserRead
 from .race_result import RaceResultBase, RaceResultCreate, RaceResultUpdate, RaceResultRead, RaceResultReadMinimal
+from .race_result import FinishRecord, BulkFinishRequest, FinishOutcome, BulkFinishResult, BulkFinishResponse
+from .race_result import ChipAssignment, ChipAssignmentRequest
+from .race_result import StationCrossingRecord, StationBatchRequest, StationCrossingOutcome, StationCrossingResult, StationBatchResponse
+from .race_result import DorsalOrder, CategoryDorsalRange, DorsalAllocationRequest, DorsalAssignment, DorsalAllocationResponse
 from .registration import RegistrationBase, RegistrationCreate, RegistrationUpdate, RegistrationRead, RegistrationReadMinimal, RegistrationStatus
+from .start_wave import StartWaveBase, StartWaveCreate, StartWaveRead, StartWaveUpdateResult
 from .virtual_result import VirtualResultBase, VirtualResultCreate, VirtualResultUpdate, VirtualResultRead
+from .strava_webhook import StravaWebhookEventIn
 from .token import Token # Existing schema
 
 # Update forward references now that all schemas are defined
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Optional, List
 from datetime import datetime
+import enum
 
 # Import RegistrationReadMinimal for nesting
 from app.schemas.registration import RegistrationReadMinimal 
@@ -8,9 +9,15 @@ from app.schemas.registration import RegistrationReadMinimal
 class RaceResultBase(BaseModel):
     registration_id: int
     dorsal_number: Optional[int] = Field(None, ge=1)
+    chip_id: Optional[str] = None
     start_time: Optional[datetime] = None
     finish_time: Optional[datetime] = None
     net_time_seconds: Optional[int] = Field(None, ge=0) # Duration
+    # Within the event distance; maintained by standings_service, not set by clients
+    overall_position: Optional[int] = None
+    category_position: Optional[int] = None
+    sex_position: Optional[int] = None
+    gap_to_leader_seconds: Optional[int] = None
 
 class RaceResultCreate(RaceResultBase):
     # For creation, we might only need registration_id, other fields set later
@@ -34,3 +41,112 @@ class RaceResultReadMinimal(BaseModel):
     dorsal_number: Optional[int] = None
     net_time_seconds: Optional[int] = None
     model_config = {"from_attributes": True}
+
+
+# --- Bulk finish-line ingestion ---
+
+class FinishRecord(BaseModel):
+    dorsal_number: int = Field(..., ge=1)
+    finish_time: datetime
+
+    @field_validator("finish_time")
+    @classmethod
+    def as_local_naive(cls, value: datetime) -> datetime:
+        # Start times are stored as naive server-local times (datetime.now()), so match them
+        return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+class BulkFinishRequest(BaseModel):
+    finishes: List[FinishRecord] = Field(..., min_length=1, max_length=1000)
+
+class FinishOutcome(str, enum.Enum):
+    RECORDED = "recorded"
+    DUPLICATE = "duplicate" # Finish already recorded, or a later crossing of the same dorsal in the batch
+    UNKNOWN_DORSAL = "unknown_dorsal"
+
+class BulkFinishResult(BaseModel):
+    dorsal_number: int
+    finish_time: datetime
+    outcome: FinishOutcome
+    race_result_id: Optional[int] = None
+    net_time_seconds: Optional[int] = None
+
+class BulkFinishResponse(BaseModel):
+    results: List[BulkFinishResult] # Same order as the request
+    recorded: int
+    duplicates: int
+    unknown_dorsals: int
+
+
+# --- Chip timing ---
+
+class ChipAssignment(BaseModel):
+    dorsal_number: int = Field(..., ge=1)
+    chip_id: str = Field(..., min_length=1, max_length=64)
+
+class ChipAssignmentRequest(BaseModel):
+    chips: List[ChipAssignment] = Field(..., min_length=1, max_length=5000)
+
+
+# --- Bulk dorsal allocation ---
+
+class DorsalOrder(str, enum.Enum):
+    REGISTRATION = "registration" # Earliest registration gets the lowest number
+    ALPHABETICAL = "alphabetical" # By last name, then first name
+
+class CategoryDorsalRange(BaseModel):
+    event_category_id: int
+    first_dorsal: int = Field(..., ge=1)
+    last_dorsal: int = Field(..., ge=1)
+
+    @model_validator(mode="after")
+    def check_bounds(self):
+        if self.last_dorsal < self.first_dorsal:
+            raise ValueError("last_dorsal must not be lower than first_dorsal")
+        return self
+
+class DorsalAllocationRequest(BaseModel):
+    order: DorsalOrder = DorsalOrder.REGISTRATION
+    category_ranges: List[CategoryDorsalRange] = [] # Categories without a range share the numbering from first_dorsal
+    first_dorsal: int = Field(1, ge=1)
+    include_pending: bool = False # Also number registrations that are not confirmed yet
+
+class DorsalAssignment(BaseModel):
+    registration_id: int
+    dorsal_number: int
+
+class DorsalAllocationResponse(BaseModel):
+    assigned: List[DorsalAssignment] # In allocation order
+
+
+# --- Timing stations (offline buffering, idempotent upload) ---
+
+class StationCrossingRecord(FinishRecord):
+    crossing_id: str = Field(..., min_length=1, max_length=64) # Unique per station; the idempotency key
+
+class StationBatchRequest(BaseModel):
+    station_id: str = Field(..., min_length=1, max_length=64)
+    batch_id: str = Field(..., min_length=1, max_length=64) # A retried upload sends the same batch_id
+    crossings: List[StationCrossingRecord] = Field(..., min_length=1, max_length=1000)
+
+class StationCrossingOutcome(str, enum.Enum):
+    RECORDED = "recorded" # Holds the dorsal's finish time
+    SUPERSEDED = "superseded" # An earlier crossing (any station) or a manual finish holds it
+    DUPLICATE = "duplicate" # crossing_id already received from this station; nothing changed
+    UNKNOWN_DORSAL = "unknown_dorsal"
+
+class StationCrossingResult(BaseModel):
+    crossing_id: str
+    dorsal_number: int
+    outcome: StationCrossingOutcome
+    race_result_id: Optional[int] = None
+    net_time_seconds: Optional[int] = None
+
+class StationBatchResponse(BaseModel):
+    station_id: str
+    batch_id: str
+    replayed: bool # The batch had already been applied; results are the stored ones
+    results: List[StationCrossingResult] # Same order as the request
+    recorded: int
+    superseded: int
+    duplicates: int
+    unknown_dorsals: int
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+class StartWaveBase(BaseModel):
+    event_distance_id: int
+    event_category_id: Optional[int] = None # None: the whole distance
+    start_time: datetime
+
+class StartWaveCreate(StartWaveBase):
+    pass
+
+class StartWaveRead(StartWaveBase):
+    id: int
+    model_config = {"from_attributes": True}
+
+class StartWaveUpdateResult(StartWaveRead):
+    results_updated: int # RaceResults whose start (and net time, if finished) changed
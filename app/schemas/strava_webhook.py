@@ -0,0 +1,12 @@
+from pydantic import BaseModel, Field
+from typing import Dict, Literal, Optional
+
+class StravaWebhookEventIn(BaseModel):
+    """An event as Strava POSTs it to the webhook callback."""
+    object_type: Literal["activity", "athlete"]
+    object_id: int
+    aspect_type: Literal["create", "update", "delete"]
+    owner_id: int # Athlete id
+    updates: Dict[str, str] = Field(default_factory=dict) # e.g. {"title": "..."} or {"authorized": "false"}
+    subscription_id: Optional[int] = None
+    event_time: Optional[int] = None # Unix seconds
@@ -4,5 +4,7 @@ from . import event_service
 from . import registration_service
 from . import race_service
 from . import result_service
+from . import leaderboard_service
+from . import live_results_service
 from . import strava_service
 from . import virtual_event_service
@@ -0,0 +1,361 @@
+"""
+Chip timing: an asyncio listener for RFID finish-mat readers.
+
+Readers send one line per chip read, over TCP or as UDP datagrams (a datagram may
+carry several lines):
+
+    <chip_id>,<timestamp>[,<mat_id>]
+
+The timestamp is ISO 8601 or Unix epoch seconds. A chip crossing a mat is read many
+times in a burst, and several mats may see the same crossing, so repeat reads of a
+chip within CHIP_READER_DEDUP_WINDOW_SECONDS are dropped on arrival. The remaining
+crossings are mapped chip -> dorsal and written in micro-batches through
+race_service.record_finishes_bulk: one IN query and one commit per batch, however
+many reads per second the mats produce. A batch the database refuses is written again
+with the next one (or after CHIP_READER_RETRY_SECONDS if no reads come); whatever is
+still unwritten when the listener stops goes to the timing journal for replay.
+
+Started with the app when CHIP_READER_ENABLED is set; `python -m app.cli
+simulate-chip-reader` plays a reader against it for testing.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from app.config import Settings
+from app.schemas.race_result import FinishRecord
+from app.services import race_service, timing_journal_service
+from app.services.timing_journal_service import timing_journal
+
+logger = logging.getLogger(__name__)
+
+
+class ChipRead(NamedTuple):
+    chip_id: str
+    timestamp: datetime
+    mat_id: Optional[str] = None
+
+
+def parse_chip_read(line: str) -> ChipRead:
+    """Parses one protocol line. Raises ValueError on anything malformed."""
+    fields = [field.strip() for field in line.strip().split(",")]
+    if len(fields) not in (2, 3) or not fields[0] or not fields[1]:
+        raise ValueError(f"Expected '<chip_id>,<timestamp>[,<mat_id>]', got {line!r}")
+    chip_id, raw_timestamp = fields[0], fields[1]
+    try:
+        timestamp = datetime.fromtimestamp(float(raw_timestamp))
+    except (ValueError, OverflowError, OSError): # Not a number, or out of datetime's range
+        timestamp = datetime.fromisoformat(raw_timestamp)
+    # Normalized like every other finish time (naive server-local)
+    timestamp = FinishRecord.as_local_naive(timestamp)
+    mat_id = (fields[2] or None) if len(fields) == 3 else None
+    return ChipRead(chip_id=chip_id, timestamp=timestamp, mat_id=mat_id)
+
+
+def format_chip_read(read: ChipRead) -> str:
+    """The protocol line for a read (used by the simulator)."""
+    fields = [read.chip_id, read.timestamp.isoformat()]
+    if read.mat_id is not None:
+        fields.append(read.mat_id)
+    return ",".join(fields) + "\n"
+
+
+class RepeatReadFilter:
+    """
+    Keeps the first read of each chip and drops any other read of it within the window,
+    from whichever mat. A chip read again after the window counts as a new crossing
+    (race_service reports it as a duplicate if the athlete already finished).
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._last_accepted: Dict[str, datetime] = {}
+
+    def accept(self, read: ChipRead) -> bool:
+        last = self._last_accepted.get(read.chip_id)
+        if last is not None and abs((read.timestamp - last).total_seconds()) <= self.window_seconds:
+            return False
+        self._last_accepted[read.chip_id] = read.timestamp
+        return True
+
+
+class ChipTimingIngestor:
+    """
+    Accepts parsed reads from any number of reader connections and writes the crossings
+    to the event's RaceResults in micro-batches: a batch is flushed when it reaches
+    batch_size or flush_interval_seconds after its first read, whichever comes first.
+    Reads of a failed batch are kept and written with the next batch.
+    """
+
+    def __init__(
+        self,
+        event_id: int,
+        session_factory: Callable,
+        batch_size: int = 200,
+        flush_interval_seconds: float = 0.25,
+        dedup_window_seconds: float = 5.0,
+        retry_seconds: float = 2.0,
+    ):
+        self.event_id = event_id
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.retry_seconds = retry_seconds # Longest failed reads wait when no new reads arrive
+        self.repeat_filter = RepeatReadFilter(dedup_window_seconds)
+        self._queue: asyncio.Queue = asyncio.Queue() # Unbounded: a read is never refused
+        self._chip_dorsals: Dict[str, int] = {}
+        self._unwritten: List[ChipRead] = [] # Reads of failed batches, written with the next one
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "reads": 0, "malformed": 0, "repeat_reads": 0, "unknown_chips": 0,
+            "recorded": 0, "duplicates": 0, "batches": 0, "failed_batches": 0, "journaled_reads": 0,
+        }
+
+    def submit_line(self, line: str) -> None:
+        if not line.strip():
+            return
+        try:
+            read = parse_chip_read(line)
+        except ValueError:
+            self.stats["malformed"] += 1
+            logger.warning("Ignoring malformed chip read: %r", line)
+            return
+        self.submit(read)
+
+    def submit(self, read: ChipRead) -> None:
+        self.stats["reads"] += 1
+        if not self.repeat_filter.accept(read):
+            self.stats["repeat_reads"] += 1
+            return
+        self._queue.put_nowait(read)
+
+    def pending(self) -> int:
+        return self._queue.qsize() + len(self._unwritten)
+
+    async def _next_batch(self) -> List[Optional[ChipRead]]:
+        if self._unwritten: # Don't wait for new reads to retry the failed ones
+            try:
+                batch = [await asyncio.wait_for(self._queue.get(), self.retry_seconds)]
+            except asyncio.TimeoutError:
+                return []
+        else:
+            batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval_seconds
+        while len(batch) < self.batch_size and batch[-1] is not None: # None: stop() was called
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _resolve_dorsals(self, db, reads: Sequence[ChipRead]) -> None:
+        # Chips are paired before the race; reload the map only when a read names a chip we don't know
+        if any(read.chip_id not in self._chip_dorsals for read in reads):
+            self._chip_dorsals = await race_service.get_chip_dorsal_map(db, self.event_id)
+
+    async def flush(self, reads: Sequence[ChipRead]) -> bool:
+        """Writes one batch of crossings. Returns False if it failed (logged and counted)."""
+        self.stats["batches"] += 1
+        try:
+            async with self.session_factory() as db:
+                await self._resolve_dorsals(db, reads)
+                finishes = []
+                for read in reads:
+                    dorsal_number = self._chip_dorsals.get(read.chip_id)
+                    if dorsal_number is None:
+                        self.stats["unknown_chips"] += 1
+                        continue
+                    finishes.append(FinishRecord(dorsal_number=dorsal_number, finish_time=read.timestamp))
+                if not finishes:
+                    return True
+                response = await race_service.record_finishes_bulk(db, event_id=self.event_id, finishes=finishes)
+        except Exception:
+            self.stats["failed_batches"] += 1
+            logger.exception("Could not record a batch of %d chip reads for event %s", len(reads), self.event_id)
+            return False
+        self.stats["recorded"] += response.recorded
+        self.stats["duplicates"] += response.duplicates
+        self.stats["unknown_chips"] += response.unknown_dorsals # Chip paired with a dorsal that has no result row
+        return True
+
+    async def _journal_unwritten(self) -> None:
+        """Hands reads that could never be written to the timing journal (replay-timing-journal applies them)."""
+        reads, self._unwritten = self._unwritten, []
+        if timing_journal.enabled:
+            try:
+                await timing_journal.append(
+                    timing_journal_service.CHIP_READS, event_id=self.event_id,
+                    reads=[(read.chip_id, read.timestamp, read.mat_id) for read in reads],
+                )
+            except Exception:
+                logger.exception("Could not journal unrecorded chip reads for event %s", self.event_id)
+            else:
+                self.stats["journaled_reads"] += len(reads)
+                logger.error("Journaled %d chip reads for event %s that could not be recorded", len(reads), self.event_id)
+                return
+        # Last resort: the reads in the log, in the protocol's format
+        logger.error(
+            "Could not record %d chip reads for event %s:\n%s",
+            len(reads), self.event_id, "".join(format_chip_read(read) for read in reads),
+        )
+
+    async def run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            stopping = bool(batch) and batch[-1] is None
+            reads = self._unwritten + [read for read in batch if read is not None]
+            self._unwritten = []
+            if reads and not await self.flush(reads):
+                self._unwritten = reads
+            if stopping:
+                if self._unwritten:
+                    await self._journal_unwritten()
+                return
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stops once everything queued so far has been written (or journaled, if it can't be)."""
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
+
+
+class _ChipReadDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, ingestor: ChipTimingIngestor):
+        self.ingestor = ingestor
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            self.ingestor.submit_line(line)
+
+
+class ChipReaderServer:
+    """
+    TCP and/or UDP listeners feeding one ingestor. A port of None disables that transport,
+    0 picks a free port (tcp_port/udp_port hold the bound ports once started).
+    """
+
+    def __init__(self, ingestor: ChipTimingIngestor, host: str, tcp_port: Optional[int], udp_port: Optional[int]):
+        self.ingestor = ingestor
+        self.host = host
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self._tcp_server: Optional[asyncio.AbstractServer] = None
+        self._udp_transport: Optional[asyncio.DatagramTransport] = None
+
+    async def _handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                self.ingestor.submit_line(line.decode("utf-8", errors="replace"))
+        finally:
+            writer.close()
+
+    async def start(self) -> None:
+        if self.tcp_port is not None:
+            self._tcp_server = await asyncio.start_server(self._handle_tcp, self.host, self.tcp_port)
+            self.tcp_port = self._tcp_server.sockets[0].getsockname()[1]
+        if self.udp_port is not None:
+            self._udp_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: _ChipReadDatagramProtocol(self.ingestor), local_addr=(self.host, self.udp_port)
+            )
+            self.udp_port = self._udp_transport.get_extra_info("sockname")[1]
+        self.ingestor.start()
+
+    async def stop(self) -> None:
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            await self._tcp_server.wait_closed()
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+        await self.ingestor.stop()
+
+
+chip_reader: Optional[ChipReaderServer] = None
+
+
+async def start_chip_reader(settings: Settings, session_factory: Callable) -> ChipReaderServer:
+    """Starts the app-wide chip reader listener (called from app startup)."""
+    global chip_reader
+    if settings.CHIP_READER_EVENT_ID is None:
+        raise RuntimeError("CHIP_READER_ENABLED needs CHIP_READER_EVENT_ID: the event whose finishes the mats record.")
+    ingestor = ChipTimingIngestor(
+        event_id=settings.CHIP_READER_EVENT_ID,
+        session_factory=session_factory,
+        batch_size=settings.CHIP_READER_BATCH_SIZE,
+        flush_interval_seconds=settings.CHIP_READER_FLUSH_INTERVAL_SECONDS,
+        dedup_window_seconds=settings.CHIP_READER_DEDUP_WINDOW_SECONDS,
+        retry_seconds=settings.CHIP_READER_RETRY_SECONDS,
+    )
+    chip_reader = ChipReaderServer(
+        ingestor, host=settings.CHIP_READER_HOST,
+        # 0 in the settings turns a transport off
+        tcp_port=settings.CHIP_READER_TCP_PORT or None, udp_port=settings.CHIP_READER_UDP_PORT or None,
+    )
+    await chip_reader.start()
+    return chip_reader
+
+
+async def stop_chip_reader() -> None:
+    global chip_reader
+    if chip_reader is not None:
+        await chip_reader.stop()
+        chip_reader = None
+
+
+async def simulate_reader(
+    host: str,
+    port: int,
+    chip_ids: Sequence[str],
+    mats: int = 2,
+    reads_per_crossing: int = 3,
+    crossings_per_second: float = 50.0,
+    udp: bool = False,
+) -> int:
+    """
+    Plays finish-mat readers: each chip crosses once, in random order, and every mat
+    reports it reads_per_crossing times a few milliseconds apart, as real readers do.
+    Each mat has its own connection. Returns the number of lines sent.
+    """
+    order = list(chip_ids)
+    random.shuffle(order)
+    interval = 1.0 / crossings_per_second if crossings_per_second > 0 else 0.0
+    loop = asyncio.get_running_loop()
+
+    if udp:
+        transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(host, port))
+        senders = [lambda data: transport.sendto(data)] * mats
+    else:
+        writers = [(await asyncio.open_connection(host, port))[1] for _ in range(mats)]
+        senders = [writer.write for writer in writers]
+
+    sent = 0
+    try:
+        for chip_id in order:
+            crossed_at = datetime.now()
+            for mat, send in enumerate(senders, start=1):
+                lines = "".join(
+                    format_chip_read(ChipRead(chip_id, crossed_at + timedelta(milliseconds=5 * (mat + repeat)), f"mat-{mat}"))
+                    for repeat in range(reads_per_crossing)
+                )
+                send(lines.encode())
+                sent += reads_per_crossing
+            if not udp:
+                await asyncio.gather(*(writer.drain() for writer in writers))
+            await asyncio.sleep(interval)
+    finally:
+        if udp:
+            transport.close()
+        else:
+            for writer in writers:
+                writer.close()
+            await asyncio.gather(*(writer.wait_closed() for writer in writers))
+    return sent
@@ -142,9 +142,9 @@ async def get_event_participant_counts(
         count = row[2]         
 
         gender_key = "Unspecified"
-        if sex == "Male":
+        if sex in ("M", "Male"): # Strava reports "M" / "F"
             gender_key = "Male"
-        elif sex == "Female":
+        elif sex in ("F", "Female"):
             gender_key = "Female"
         
         participant_counts[category_name][gender_key] += count
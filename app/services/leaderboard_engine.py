@@ -0,0 +1,244 @@
+"""
+Optional vectorized leaderboard engine. Loads (user, distance, seconds, year, source)
+for every result into NumPy arrays and does the bucketing, pace and best-per-athlete
+selection with array operations instead of per-row Python. Produces the same rows as
+leaderboard_service.get_top_leaderboard_rows / get_personal_best_rows, so it can stand
+in for the stored tables (e.g. to cross-check them) without a per-row loop.
+
+NumPy is not a hard dependency; install it (`pip install numpy`) to use this module.
+"""
+from typing import Optional, List, Dict, Any, Sequence, Tuple
+
+from sqlalchemy import select, extract, literal, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+try:
+    import numpy as np
+except ImportError: # Optional dependency
+    np = None
+
+from app.core.distances import STANDARD_DISTANCES_KM, DISTANCE_TOLERANCE_KM
+from app.models.race_result import RaceResult
+from app.models.registration import Registration
+from app.models.virtual_result import VirtualResult
+from app.models.event import Event
+from app.models.event_distance import EventDistance
+from app.models.strava_user import StravaUserDB
+
+# Numeric source codes for the arrays; mapped back to leaderboard_service's labels on output
+RACE_CODE = 0
+VIRTUAL_CODE = 1
+_SOURCE_LABELS = {RACE_CODE: "Race", VIRTUAL_CODE: "Virtual"}
+
+# Columns of the loaded result matrix
+_USER, _DISTANCE, _SECONDS, _YEAR, _SOURCE, _SOURCE_ID = range(6)
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("The vectorized leaderboard engine needs NumPy: pip install numpy")
+
+
+# --- Array kernels (pure NumPy, no database) ---
+
+def bucket_indices(distances_km: "np.ndarray") -> "np.ndarray":
+    """
+    Index into sorted STANDARD_DISTANCES_KM of the standard distance each raw distance
+    counts towards, or -1. Vectorized distance_bucket_for(): searchsorted finds the two
+    neighbouring standard distances, the nearer one is kept if it is within tolerance.
+    """
+    standard = np.sort(np.asarray(STANDARD_DISTANCES_KM, dtype=np.float64))
+    upper = np.clip(np.searchsorted(standard, distances_km), 0, len(standard) - 1)
+    lower = np.clip(upper - 1, 0, len(standard) - 1)
+    nearest = np.where(
+        np.abs(distances_km - standard[lower]) <= np.abs(distances_km - standard[upper]), lower, upper
+    )
+    qualifies = (distances_km > 0) & (np.abs(distances_km - standard[nearest]) <= DISTANCE_TOLERANCE_KM)
+    return np.where(qualifies, nearest, -1)
+
+
+def best_effort_indices(
+    group_keys: Sequence["np.ndarray"], pace: "np.ndarray", seconds: "np.ndarray"
+) -> "np.ndarray":
+    """
+    Row index of the fastest effort (lowest pace, then time) per distinct group key,
+    e.g. (bucket, user). One lexsort puts each group's best row first; a shifted
+    comparison marks the group starts.
+    """
+    if len(pace) == 0:
+        return np.empty(0, dtype=np.int64)
+    # lexsort sorts by its last key first: group keys, then pace, then time
+    order = np.lexsort((seconds, pace, *reversed(group_keys)))
+    group_start = np.ones(len(order), dtype=bool)
+    changed = np.zeros(len(order) - 1, dtype=bool)
+    for key in group_keys:
+        sorted_key = key[order]
+        changed |= sorted_key[1:] != sorted_key[:-1]
+    group_start[1:] = changed
+    return order[group_start]
+
+
+def top_n_per_bucket(
+    buckets: "np.ndarray", pace: "np.ndarray", seconds: "np.ndarray", users: "np.ndarray", top_n: int
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    (row indices, 1-based positions) of the top N rows per bucket, ordered by bucket then
+    position. Same order as the SQL boards: pace, time, then user id for exact ties.
+    """
+    if len(buckets) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    order = np.lexsort((users, seconds, pace, buckets))
+    sorted_buckets = buckets[order]
+    starts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(order)])
+    positions = np.arange(len(order)) - np.repeat(starts, counts) + 1
+    keep = positions <= top_n
+    return order[keep], positions[keep]
+
+
+# --- Loading and output ---
+
+def _raw_result_rows(year: Optional[int] = None, user_strava_id: Optional[int] = None):
+    """Every timed race and virtual result, unbucketed: bucketing happens in NumPy."""
+    race_rows = (
+        select(
+            Registration.user_strava_id,
+            EventDistance.distance_km,
+            RaceResult.net_time_seconds,
+            extract('year', Event.date),
+            literal(RACE_CODE),
+            RaceResult.id,
+        )
+        .join(RaceResult.registration)
+        .join(Registration.event)
+        .join(Registration.distance)
+        .where(RaceResult.net_time_seconds.isnot(None))
+    )
+    virtual_rows = (
+        select(
+            VirtualResult.user_strava_id,
+            VirtualResult.distance_km,
+            VirtualResult.elapsed_time_seconds,
+            VirtualResult.activity_year,
+            literal(VIRTUAL_CODE),
+            VirtualResult.id,
+        )
+        .where(VirtualResult.elapsed_time_seconds.isnot(None))
+    )
+    if year:
+        race_rows = race_rows.where(extract('year', Event.date) == year)
+        virtual_rows = virtual_rows.where(VirtualResult.activity_year == year)
+    if user_strava_id is not None:
+        race_rows = race_rows.where(Registration.user_strava_id == user_strava_id)
+        virtual_rows = virtual_rows.where(VirtualResult.user_strava_id == user_strava_id)
+    return union_all(race_rows, virtual_rows)
+
+
+async def load_result_matrix(
+    db: AsyncSession, year: Optional[int] = None, user_strava_id: Optional[int] = None, chunk_size: int = 50000
+) -> "np.ndarray":
+    """Results as an (n, 6) float64 matrix, built chunk by chunk from a streamed query."""
+    _require_numpy()
+    stmt = _raw_result_rows(year=year, user_strava_id=user_strava_id).execution_options(yield_per=chunk_size)
+    chunks = []
+    result = await db.stream(stmt)
+    async for partition in result.partitions():
+        chunks.append(np.array(partition, dtype=np.float64))
+    if not chunks:
+        return np.empty((0, 6), dtype=np.float64)
+    return np.concatenate(chunks)
+
+
+def _qualifying(matrix: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """(rows that count towards a standard distance, their bucket index, their pace)."""
+    bucket_idx = bucket_indices(matrix[:, _DISTANCE])
+    mask = (bucket_idx >= 0) & (matrix[:, _SECONDS] > 0)
+    rows, bucket_idx = matrix[mask], bucket_idx[mask]
+    return rows, bucket_idx, rows[:, _SECONDS] / rows[:, _DISTANCE]
+
+
+async def _row_details(db: AsyncSession, rows: "np.ndarray") -> Dict[Tuple[int, int], Tuple[Any, Any]]:
+    """(source code, source id) -> (event name, activity date), for the selected rows only."""
+    race_ids = [int(i) for i in rows[rows[:, _SOURCE] == RACE_CODE][:, _SOURCE_ID]]
+    virtual_ids = [int(i) for i in rows[rows[:, _SOURCE] == VIRTUAL_CODE][:, _SOURCE_ID]]
+    details = {}
+    if race_ids:
+        race_stmt = (
+            select(RaceResult.id, Event.name, Event.date)
+            .join(RaceResult.registration)
+            .join(Registration.event)
+            .where(RaceResult.id.in_(race_ids))
+        )
+        for source_id, name, date in await db.execute(race_stmt):
+            details[(RACE_CODE, source_id)] = (name, date)
+    if virtual_ids:
+        virtual_stmt = (
+            select(VirtualResult.id, VirtualResult.name, VirtualResult.activity_date)
+            .where(VirtualResult.id.in_(virtual_ids))
+        )
+        for source_id, name, date in await db.execute(virtual_stmt):
+            details[(VIRTUAL_CODE, source_id)] = (name, date)
+    return details
+
+
+def _output_row(row: "np.ndarray", bucket_km: float, pace: float, details) -> Dict[str, Any]:
+    source_code, source_id = int(row[_SOURCE]), int(row[_SOURCE_ID])
+    event_name, activity_date = details.get((source_code, source_id), (None, None))
+    return {
+        "user_strava_id": int(row[_USER]),
+        "bucket_km": bucket_km,
+        "best_pace_seconds_per_km": float(pace),
+        "time_seconds": int(row[_SECONDS]),
+        "distance_km": float(row[_DISTANCE]),
+        "source": _SOURCE_LABELS[source_code],
+        "source_id": source_id,
+        "event_name": event_name,
+        "activity_date": activity_date,
+    }
+
+
+async def get_top_leaderboard_rows_vectorized(db: AsyncSession, year: Optional[int], top_n: int) -> List[Dict[str, Any]]:
+    """Same rows as leaderboard_service.get_top_leaderboard_rows, computed from raw results in NumPy."""
+    matrix = await load_result_matrix(db, year=year)
+    rows, bucket_idx, pace = _qualifying(matrix)
+    users = rows[:, _USER].astype(np.int64)
+
+    best = best_effort_indices([bucket_idx, users], pace, rows[:, _SECONDS])
+    top, positions = top_n_per_bucket(bucket_idx[best], pace[best], rows[best, _SECONDS], users[best], top_n)
+    selected = best[top]
+
+    standard = np.sort(np.asarray(STANDARD_DISTANCES_KM, dtype=np.float64))
+    details = await _row_details(db, rows[selected])
+    output = [
+        {**_output_row(rows[i], float(standard[bucket_idx[i]]), pace[i], details), "position": int(position)}
+        for i, position in zip(selected, positions)
+    ]
+
+    # Names only for the athletes that made a board, in one IN query
+    user_ids = {row["user_strava_id"] for row in output}
+    names = {}
+    if user_ids:
+        name_rows = await db.execute(
+            select(StravaUserDB.strava_id, StravaUserDB.firstname, StravaUserDB.lastname)
+            .where(StravaUserDB.strava_id.in_(user_ids))
+        )
+        names = {strava_id: (firstname, lastname) for strava_id, firstname, lastname in name_rows}
+    for row in output:
+        row["firstname"], row["lastname"] = names.get(row["user_strava_id"], (None, None))
+    return output
+
+
+async def get_personal_best_rows_vectorized(db: AsyncSession, user_strava_id: int) -> List[Dict[str, Any]]:
+    """Same data as leaderboard_service.get_personal_best_rows (as dicts), shortest distance first."""
+    matrix = await load_result_matrix(db, user_strava_id=user_strava_id)
+    rows, bucket_idx, pace = _qualifying(matrix)
+
+    best = best_effort_indices([bucket_idx], pace, rows[:, _SECONDS])
+    standard = np.sort(np.asarray(STANDARD_DISTANCES_KM, dtype=np.float64))
+    details = await _row_details(db, rows[best])
+    # best is already in bucket order: the bucket index is the primary sort key
+    return [_output_row(rows[i], float(standard[bucket_idx[i]]), pace[i], details) for i in best]
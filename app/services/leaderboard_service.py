@@ -0,0 +1,525 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, insert, func, extract, literal, union_all, or_, and_, tuple_, case, String
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import Optional, Sequence, List, Dict, Tuple, Any
+from datetime import datetime
+from collections import defaultdict
+import heapq
+
+from app.core.distances import distance_bucket_for
+from app.core.age_groups import birth_year_range
+from app.models.leaderboard_entry import LeaderboardEntry
+from app.models.leaderboard_rollup import LeaderboardRollup, ALL_YEARS, ALL_CATEGORIES
+from app.models.personal_best import PersonalBest
+from app.models.event_category import EventCategory
+from app.models.race_result import RaceResult
+from app.models.registration import Registration
+from app.models.virtual_result import VirtualResult
+from app.models.event import Event
+from app.models.event_distance import EventDistance
+from app.models.strava_user import StravaUserDB
+
+RACE_SOURCE = "Race"
+VIRTUAL_SOURCE = "Virtual"
+
+# Columns describing a best effort, shared by leaderboard_entries and personal_bests
+_BEST_EFFORT_COLUMNS = [
+    "best_pace_seconds_per_km", "time_seconds", "distance_km",
+    "source", "source_id", "event_name", "activity_date",
+]
+
+
+def _leaderboard_source_rows(
+    user_strava_id: Optional[int] = None, year: Optional[int] = None, user_strava_ids: Optional[Sequence[int]] = None,
+    virtual_result_ids: Optional[Sequence[int]] = None,
+):
+    """
+    UNION ALL of race and virtual results that count towards a standard distance, with
+    pace computed in SQL. Filters on the stored distance_bucket columns so the
+    composite indexes only visit qualifying rows. Only used to (re)build the derived
+    tables; normal reads never touch raw results. With virtual_result_ids, just those
+    virtual results (see record_virtual_results).
+    """
+    race_rows = (
+        select(
+            Registration.user_strava_id.label("user_strava_id"),
+            EventDistance.distance_bucket.label("bucket_km"),
+            extract('year', Event.date).label("year"),
+            (RaceResult.net_time_seconds / EventDistance.distance_km).label("best_pace_seconds_per_km"),
+            RaceResult.net_time_seconds.label("time_seconds"),
+            EventDistance.distance_km.label("distance_km"),
+            literal(RACE_SOURCE).label("source"),
+            RaceResult.id.label("source_id"),
+            Event.name.label("event_name"),
+            Event.date.label("activity_date"),
+            EventCategory.name.label("category"),
+        )
+        .join(RaceResult.registration)
+        .join(Registration.event)
+        .join(Registration.distance)
+        .join(Registration.category)
+        .where(EventDistance.distance_bucket.isnot(None))
+        .where(RaceResult.net_time_seconds.isnot(None))
+    )
+    virtual_rows = (
+        select(
+            VirtualResult.user_strava_id.label("user_strava_id"),
+            VirtualResult.distance_bucket.label("bucket_km"),
+            VirtualResult.activity_year.label("year"),
+            # Same expression as the pace column of the composite indexes on virtual_results
+            (VirtualResult.elapsed_time_seconds / VirtualResult.distance_km).label("best_pace_seconds_per_km"),
+            VirtualResult.elapsed_time_seconds.label("time_seconds"),
+            VirtualResult.distance_km.label("distance_km"),
+            literal(VIRTUAL_SOURCE).label("source"),
+            VirtualResult.id.label("source_id"),
+            VirtualResult.name.label("event_name"),
+            VirtualResult.activity_date.label("activity_date"),
+            literal(None, String).label("category"), # Virtual activities have no category
+        )
+        .where(VirtualResult.distance_bucket.isnot(None))
+        .where(VirtualResult.elapsed_time_seconds.isnot(None))
+    )
+    if user_strava_id is not None:
+        race_rows = race_rows.where(Registration.user_strava_id == user_strava_id)
+        virtual_rows = virtual_rows.where(VirtualResult.user_strava_id == user_strava_id)
+    if user_strava_ids is not None:
+        race_rows = race_rows.where(Registration.user_strava_id.in_(user_strava_ids))
+        virtual_rows = virtual_rows.where(VirtualResult.user_strava_id.in_(user_strava_ids))
+    if year:
+        race_rows = race_rows.where(extract('year', Event.date) == year)
+        virtual_rows = virtual_rows.where(VirtualResult.activity_year == year)
+    if virtual_result_ids is not None:
+        return virtual_rows.where(VirtualResult.id.in_(virtual_result_ids)).subquery("leaderboard_source")
+    return union_all(race_rows, virtual_rows).subquery("leaderboard_source")
+
+
+def _best_effort_rows(key_columns: List[str], source, extra_columns: Sequence[str] = ()):
+    """
+    Selects the fastest source row per key (e.g. bucket/year/user) using
+    ROW_NUMBER() OVER (PARTITION BY key ORDER BY pace, time).
+    """
+    ranked = select(
+        source,
+        func.row_number().over(
+            partition_by=[source.c[name] for name in key_columns],
+            order_by=[source.c.best_pace_seconds_per_km, source.c.time_seconds],
+        ).label("athlete_rank"),
+    ).subquery("ranked_source")
+    columns = key_columns + _BEST_EFFORT_COLUMNS + list(extra_columns)
+    return columns, select(*[ranked.c[name] for name in columns]).where(ranked.c.athlete_rank == 1)
+
+
+def _rollup_source_rows(user_strava_ids: Optional[Sequence[int]] = None, virtual_result_ids: Optional[Sequence[int]] = None):
+    """
+    Every source row expanded into its four rollup slices (its year / ALL_YEARS x its
+    category / ALL_CATEGORIES) in a single pass, with the athlete's sex and birth year.
+    Virtual results have no category, so they only feed the ALL_CATEGORIES slices.
+    """
+    source = _leaderboard_source_rows(user_strava_ids=user_strava_ids, virtual_result_ids=virtual_result_ids)
+    slices = union_all(*[
+        select(literal(every_year).label("every_year"), literal(every_category).label("every_category"))
+        for every_year in (0, 1) for every_category in (0, 1)
+    ]).subquery("slices")
+    return (
+        select(
+            case((slices.c.every_year == 1, literal(ALL_YEARS)), else_=source.c.year).label("year"),
+            source.c.bucket_km,
+            case((slices.c.every_category == 1, literal(ALL_CATEGORIES)), else_=source.c.category).label("category"),
+            source.c.user_strava_id,
+            StravaUserDB.sex,
+            StravaUserDB.birth_year,
+            *[source.c[name] for name in _BEST_EFFORT_COLUMNS],
+        )
+        .select_from(source)
+        .join(StravaUserDB, StravaUserDB.strava_id == source.c.user_strava_id)
+        .join(slices, literal(True))
+        .where(or_(slices.c.every_category == 1, source.c.category.isnot(None)))
+        .subquery("rollup_source")
+    )
+
+
+def _keep_faster(stmt, model, key_columns: List[str]):
+    """ON CONFLICT DO UPDATE for an INSERT into a best-effort table: only a slower stored effort is overwritten."""
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[getattr(model, name) for name in key_columns],
+        set_={name: excluded[name] for name in _BEST_EFFORT_COLUMNS},
+        where=or_(
+            excluded.best_pace_seconds_per_km < model.best_pace_seconds_per_km,
+            and_(
+                excluded.best_pace_seconds_per_km == model.best_pace_seconds_per_km,
+                excluded.time_seconds < model.time_seconds,
+            ),
+        ),
+    )
+
+
+async def _upsert_if_faster(db: AsyncSession, model, key_columns: List[str], values: dict) -> None:
+    """INSERT ... ON CONFLICT DO UPDATE that only overwrites a slower stored effort."""
+    await db.execute(_keep_faster(sqlite_insert(model).values(**values), model, key_columns))
+
+
+async def record_leaderboard_result(
+    db: AsyncSession,
+    *,
+    user_strava_id: int,
+    distance_km: Optional[float],
+    time_seconds: Optional[int],
+    activity_date: Optional[datetime],
+    event_name: Optional[str],
+    source: str,
+    source_id: int,
+    category: Optional[str] = None,
+) -> bool:
+    """
+    Upserts the athlete's leaderboard entry (bucket, year), personal best (bucket) and
+    rollup slices (see LeaderboardRollup), keeping the stored rows unless the new result
+    is faster. Does not commit, so the caller's result write and these updates land in
+    the same transaction. category is the EventCategory name of a race result.
+    Returns False when the result does not qualify for any standard distance.
+    """
+    bucket_km = distance_bucket_for(distance_km)
+    if bucket_km is None or not time_seconds or activity_date is None:
+        return False
+
+    best_effort = {
+        "best_pace_seconds_per_km": time_seconds / distance_km,
+        "time_seconds": time_seconds,
+        "distance_km": distance_km,
+        "source": source,
+        "source_id": source_id,
+        "event_name": event_name,
+        "activity_date": activity_date,
+    }
+    await _upsert_if_faster(
+        db, LeaderboardEntry, ["bucket_km", "year", "user_strava_id"],
+        {"bucket_km": bucket_km, "year": activity_date.year, "user_strava_id": user_strava_id, **best_effort},
+    )
+    await _upsert_if_faster(
+        db, PersonalBest, ["user_strava_id", "bucket_km"],
+        {"user_strava_id": user_strava_id, "bucket_km": bucket_km, **best_effort},
+    )
+
+    athlete = (await db.execute(
+        select(StravaUserDB.sex, StravaUserDB.birth_year).where(StravaUserDB.strava_id == user_strava_id)
+    )).one_or_none()
+    sex, birth_year = athlete if athlete else (None, None)
+    categories = [ALL_CATEGORIES] if category is None else [category, ALL_CATEGORIES]
+    for slice_year in (activity_date.year, ALL_YEARS):
+        for slice_category in categories:
+            await _upsert_if_faster(
+                db, LeaderboardRollup, ["year", "bucket_km", "category", "user_strava_id"],
+                {
+                    "year": slice_year, "bucket_km": bucket_km, "category": slice_category,
+                    "user_strava_id": user_strava_id, "sex": sex, "birth_year": birth_year,
+                    **best_effort,
+                },
+            )
+    return True
+
+
+async def record_virtual_results(db: AsyncSession, virtual_result_ids: Sequence[int]) -> None:
+    """
+    record_leaderboard_result for a batch of newly stored virtual results (e.g. one synced
+    page), set-based: per table one INSERT ... SELECT of the batch's best effort per key,
+    keeping stored rows unless the batch is faster. Costs three statements whatever the
+    batch size or the athletes' history. Does not commit.
+    """
+    if not virtual_result_ids:
+        return
+    derived_tables = [
+        (LeaderboardEntry, ["bucket_km", "year", "user_strava_id"], _leaderboard_source_rows(virtual_result_ids=virtual_result_ids), []),
+        (PersonalBest, ["user_strava_id", "bucket_km"], _leaderboard_source_rows(virtual_result_ids=virtual_result_ids), []),
+        (
+            LeaderboardRollup, ["year", "bucket_km", "category", "user_strava_id"],
+            _rollup_source_rows(virtual_result_ids=virtual_result_ids), ["sex", "birth_year"],
+        ),
+    ]
+    for model, key_columns, source, extra_columns in derived_tables:
+        columns, best_rows = _best_effort_rows(key_columns, source, extra_columns=extra_columns)
+        # best_rows ends in WHERE, which SQLite needs to parse an upsert from a SELECT
+        await db.execute(_keep_faster(sqlite_insert(model).from_select(columns, best_rows), model, key_columns))
+
+
+async def rebuild_leaderboard_entries(db: AsyncSession) -> int:
+    """
+    Recomputes leaderboard_entries from every race and virtual result in one
+    INSERT ... SELECT. Use for backfills and after results are corrected or deleted.
+    Returns the number of entries written.
+    """
+    columns, best_rows = _best_effort_rows(["bucket_km", "year", "user_strava_id"], _leaderboard_source_rows())
+    await db.execute(delete(LeaderboardEntry))
+    await db.execute(insert(LeaderboardEntry).from_select(columns, best_rows))
+    await db.commit()
+    return (await db.execute(select(func.count(LeaderboardEntry.id)))).scalar_one()
+
+
+async def recompute_personal_bests(db: AsyncSession, user_strava_id: Optional[int] = None) -> int:
+    """
+    Recomputes personal_bests from raw results, for one athlete (after a correction)
+    or for everyone when user_strava_id is None. Returns the number of rows written.
+    """
+    columns, best_rows = _best_effort_rows(
+        ["user_strava_id", "bucket_km"], _leaderboard_source_rows(user_strava_id=user_strava_id)
+    )
+    clear_stmt = delete(PersonalBest)
+    count_stmt = select(func.count(PersonalBest.id))
+    if user_strava_id is not None:
+        clear_stmt = clear_stmt.where(PersonalBest.user_strava_id == user_strava_id)
+        count_stmt = count_stmt.where(PersonalBest.user_strava_id == user_strava_id)
+
+    await db.execute(clear_stmt)
+    await db.execute(insert(PersonalBest).from_select(columns, best_rows))
+    await db.commit()
+    return (await db.execute(count_stmt)).scalar_one()
+
+
+async def rebuild_leaderboard_rollups(db: AsyncSession) -> int:
+    """
+    Recomputes leaderboard_rollups (every year/category slice) from all race and virtual
+    results in one INSERT ... SELECT. Returns the number of rows written.
+    """
+    columns, best_rows = _best_effort_rows(
+        ["year", "bucket_km", "category", "user_strava_id"], _rollup_source_rows(),
+        extra_columns=["sex", "birth_year"],
+    )
+    await db.execute(delete(LeaderboardRollup))
+    await db.execute(insert(LeaderboardRollup).from_select(columns, best_rows))
+    await db.commit()
+    return (await db.execute(select(func.count(LeaderboardRollup.id)))).scalar_one()
+
+
+async def refresh_athlete_leaderboards(db: AsyncSession, user_strava_ids: Sequence[int]) -> None:
+    """
+    Re-derives the leaderboard entries, personal bests and rollup slices of these athletes
+    from their raw results, set-based (one DELETE and one INSERT ... SELECT per table).
+    Unlike record_leaderboard_result this also handles results that got slower, e.g. after
+    a start time correction. Does not commit, so it lands with the caller's correction.
+    """
+    user_strava_ids = sorted(set(user_strava_ids))
+    if not user_strava_ids:
+        return
+    derived_tables = [
+        (LeaderboardEntry, ["bucket_km", "year", "user_strava_id"], _leaderboard_source_rows(user_strava_ids=user_strava_ids), []),
+        (PersonalBest, ["user_strava_id", "bucket_km"], _leaderboard_source_rows(user_strava_ids=user_strava_ids), []),
+        (
+            LeaderboardRollup, ["year", "bucket_km", "category", "user_strava_id"],
+            _rollup_source_rows(user_strava_ids=user_strava_ids), ["sex", "birth_year"],
+        ),
+    ]
+    for model, key_columns, source, extra_columns in derived_tables:
+        columns, best_rows = _best_effort_rows(key_columns, source, extra_columns=extra_columns)
+        await db.execute(delete(model).where(model.user_strava_id.in_(user_strava_ids)))
+        await db.execute(insert(model).from_select(columns, best_rows))
+
+
+def _rollup_entries(year: Optional[int], category: Optional[str], sex: Optional[str], age_band: Optional[str]):
+    """
+    One slice of leaderboard_rollups, narrowed by sex and age group. Every filter is an
+    equality or range on a prefix of the rollup indexes, so no filter adds a scan.
+    """
+    stmt = select(LeaderboardRollup).where(
+        LeaderboardRollup.year == (year or ALL_YEARS),
+        LeaderboardRollup.category == (category or ALL_CATEGORIES),
+    )
+    if sex:
+        stmt = stmt.where(LeaderboardRollup.sex == sex)
+    if age_band:
+        # Age reached during the board's year; the overall board uses this year's age groups
+        earliest, latest = birth_year_range(age_band, year or datetime.now().year)
+        stmt = stmt.where(LeaderboardRollup.birth_year <= latest)
+        if earliest is not None:
+            stmt = stmt.where(LeaderboardRollup.birth_year >= earliest)
+    return stmt.subquery("entries")
+
+
+def _ranked_entries_stmt(
+    year: Optional[int],
+    top_n: int,
+    category: Optional[str] = None,
+    sex: Optional[str] = None,
+    age_band: Optional[str] = None,
+):
+    """
+    Top N athletes per bucket. Filtered boards read leaderboard_rollups. Otherwise a
+    single year reads leaderboard_entries and the overall board reads personal_bests,
+    which already hold each athlete's all-time best.
+    """
+    if category or sex or age_band:
+        entries = _rollup_entries(year, category, sex, age_band)
+    elif year:
+        entries = select(LeaderboardEntry).where(LeaderboardEntry.year == year).subquery("entries")
+    else:
+        entries = select(PersonalBest).subquery("entries")
+
+    bucket_ranking = select(
+        entries,
+        func.row_number().over(
+            partition_by=entries.c.bucket_km,
+            order_by=[entries.c.best_pace_seconds_per_km, entries.c.time_seconds, entries.c.user_strava_id],
+        ).label("position"),
+    ).subquery("bucket_ranking")
+
+    return (
+        select(bucket_ranking, StravaUserDB.firstname, StravaUserDB.lastname)
+        .join(StravaUserDB, StravaUserDB.strava_id == bucket_ranking.c.user_strava_id)
+        .where(bucket_ranking.c.position <= top_n)
+        .order_by(bucket_ranking.c.bucket_km, bucket_ranking.c.position)
+    )
+
+
+async def get_top_leaderboard_rows(
+    db: AsyncSession,
+    year: Optional[int],
+    top_n: int,
+    category: Optional[str] = None,
+    sex: Optional[str] = None,
+    age_band: Optional[str] = None,
+) -> Sequence:
+    """Returns the ranked leaderboard rows (as mappings), ordered by bucket then position."""
+    stmt = _ranked_entries_stmt(year, top_n, category=category, sex=sex, age_band=age_band)
+    return (await db.execute(stmt)).mappings().all()
+
+
+def _board_model(year: Optional[int]):
+    """The table a board is read from: leaderboard_entries for one year, personal_bests overall."""
+    return LeaderboardEntry if year else PersonalBest
+
+
+def _board_filters(model, year: Optional[int]) -> list:
+    return [model.year == year] if year else []
+
+
+def _rank_key(model):
+    # Board order; user id breaks exact ties so every athlete has a distinct position
+    return tuple_(model.best_pace_seconds_per_km, model.time_seconds, model.user_strava_id)
+
+
+async def get_leaderboard_page_rows(
+    db: AsyncSession,
+    bucket_km: float,
+    year: Optional[int],
+    limit: int,
+    after: Optional[Tuple[float, int, int]] = None,
+) -> Sequence:
+    """
+    One page of a bucket's board in rank order. Keyset pagination: `after` is the
+    (pace, time, user_strava_id) of the last row of the previous page, so the query
+    seeks into the (bucket, pace, time, user) index instead of skipping OFFSET rows
+    and page 50 costs the same as page 1. Fetch limit + 1 rows to detect a next page.
+    """
+    model = _board_model(year)
+    stmt = (
+        select(model, StravaUserDB.firstname, StravaUserDB.lastname)
+        .join(StravaUserDB, StravaUserDB.strava_id == model.user_strava_id)
+        .where(model.bucket_km == bucket_km, *_board_filters(model, year))
+        .order_by(model.best_pace_seconds_per_km, model.time_seconds, model.user_strava_id)
+        .limit(limit)
+    )
+    if after is not None:
+        stmt = stmt.where(_rank_key(model) > tuple_(*[literal(value) for value in after]))
+    rows = (await db.execute(stmt)).all()
+    return [
+        {**{name: getattr(entry, name) for name in ["user_strava_id", "bucket_km", *_BEST_EFFORT_COLUMNS]},
+         "firstname": firstname, "lastname": lastname}
+        for entry, firstname, lastname in rows
+    ]
+
+
+async def get_athlete_rank_rows(
+    db: AsyncSession,
+    user_strava_id: int,
+    year: Optional[int] = None,
+    bucket_km: Optional[float] = None,
+) -> Sequence:
+    """
+    The athlete's position and the board size in every bucket they appear in (or just
+    bucket_km), in one query. Each position is a COUNT of the entries ranked ahead,
+    answered by a range scan of the covering rank index; the athlete's own entry is
+    a unique-key lookup.
+    """
+    athlete = _board_model(year)
+    ahead = aliased(athlete)
+    position = (
+        select(func.count())
+        .select_from(ahead)
+        .where(ahead.bucket_km == athlete.bucket_km, *_board_filters(ahead, year))
+        .where(_rank_key(ahead) < _rank_key(athlete))
+        .scalar_subquery()
+    )
+    total = (
+        select(func.count())
+        .select_from(ahead)
+        .where(ahead.bucket_km == athlete.bucket_km, *_board_filters(ahead, year))
+        .scalar_subquery()
+    )
+    stmt = (
+        select(athlete.bucket_km, (position + 1).label("position"), total.label("total"))
+        .where(athlete.user_strava_id == user_strava_id, *_board_filters(athlete, year))
+        .order_by(athlete.bucket_km)
+    )
+    if bucket_km is not None:
+        stmt = stmt.where(athlete.bucket_km == bucket_km)
+    return (await db.execute(stmt)).mappings().all()
+
+
+async def get_personal_best_rows(db: AsyncSession, user_strava_id: int) -> Sequence[PersonalBest]:
+    """A user's stored personal bests, one per standard distance, shortest distance first."""
+    stmt = (
+        select(PersonalBest)
+        .where(PersonalBest.user_strava_id == user_strava_id)
+        .order_by(PersonalBest.bucket_km)
+    )
+    return (await db.execute(stmt)).scalars().all()
+
+
+async def stream_top_leaderboard_rows(
+    db: AsyncSession,
+    year: Optional[int],
+    top_n: int,
+    chunk_size: int = 1000,
+) -> List[Dict[str, Any]]:
+    """
+    Computes the same rows as get_top_leaderboard_rows straight from raw results,
+    streaming them in chunks of chunk_size. Only one best effort per (bucket, athlete)
+    is kept while streaming, and each bucket's top N is picked with a size-N heap, so
+    memory is bounded by athletes x buckets instead of by result history.
+    Useful before leaderboard_entries has been backfilled, or to cross-check it.
+    """
+    source = _leaderboard_source_rows(year=year)
+    stmt = select(source).execution_options(yield_per=chunk_size)
+
+    best_per_athlete: Dict[Tuple[float, int], Tuple[Tuple[float, int], Dict[str, Any]]] = {}
+    result = await db.stream(stmt)
+    async for row in result.mappings():
+        key = (row["bucket_km"], row["user_strava_id"])
+        rank_key = (row["best_pace_seconds_per_km"], row["time_seconds"])
+        current = best_per_athlete.get(key)
+        if current is None or rank_key < current[0]:
+            best_per_athlete[key] = (rank_key, dict(row))
+
+    per_bucket: Dict[float, List[Dict[str, Any]]] = defaultdict(list)
+    for (bucket_km, user_strava_id), (rank_key, row) in best_per_athlete.items():
+        per_bucket[bucket_km].append(row)
+
+    top_rows: List[Dict[str, Any]] = []
+    for bucket_km in sorted(per_bucket):
+        top_rows.extend(heapq.nsmallest(
+            top_n,
+            per_bucket[bucket_km],
+            key=lambda r: (r["best_pace_seconds_per_km"], r["time_seconds"], r["user_strava_id"]),
+        ))
+
+    # Names only for the athletes that made a board, in one IN query
+    user_ids = {row["user_strava_id"] for row in top_rows}
+    names = {}
+    if user_ids:
+        name_rows = await db.execute(
+            select(StravaUserDB.strava_id, StravaUserDB.firstname, StravaUserDB.lastname)
+            .where(StravaUserDB.strava_id.in_(user_ids))
+        )
+        names = {strava_id: (firstname, lastname) for strava_id, firstname, lastname in name_rows}
+    for row in top_rows:
+        row["firstname"], row["lastname"] = names.get(row["user_strava_id"], (None, None))
+    return top_rows
@@ -0,0 +1,98 @@
+import asyncio
+import json
+from collections import defaultdict
+from typing import Any, Dict, Optional, Set
+
+from app.config import Settings
+from app.models.race_result import RaceResult
+
+settings = Settings()
+
+
+def format_sse(data: str, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """One Server-Sent Events frame."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+class ResultsBroadcastHub:
+    """
+    In-process fan-out of live result updates to SSE subscribers, per event.
+    Each update is serialized once and put on every subscriber's bounded queue, so one
+    recorded finish costs one broadcast however many spectators are watching.
+    Single-process: with several workers, each only sees the finishes it recorded.
+    """
+
+    def __init__(self, max_queue_size: int):
+        self.max_queue_size = max_queue_size
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, event_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._subscribers[event_id].add(queue)
+        return queue
+
+    def unsubscribe(self, event_id: int, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(event_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[event_id]
+
+    def publish(self, event_id: int, frame: str) -> int:
+        """Queues an SSE frame for every subscriber of the event. Returns how many were reached."""
+        subscribers = self._subscribers.get(event_id, set())
+        for queue in subscribers:
+            if queue.full():
+                # A stalled client loses its oldest update instead of blocking the timer
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(frame)
+        self.published += 1
+        return len(subscribers)
+
+    def subscriber_count(self, event_id: Optional[int] = None) -> int:
+        if event_id is not None:
+            return len(self._subscribers.get(event_id, ()))
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+results_hub = ResultsBroadcastHub(max_queue_size=settings.LIVE_RESULTS_QUEUE_SIZE)
+
+
+def live_result_payload(race_result: RaceResult) -> Dict[str, Any]:
+    """
+    The fields the results page shows for one row, keyed like get_event_results_classified.
+    Expects registration.user/category/distance to be loaded.
+    """
+    registration = race_result.registration
+    user = registration.user
+    return {
+        "id": race_result.id,
+        "category": registration.category.name,
+        "distance": f"{registration.distance.distance_km} km",
+        "athlete": f"{user.firstname or ''} {user.lastname or ''}".strip() if user else None,
+        "username": user.username if user else None,
+        "dorsal_number": race_result.dorsal_number,
+        "net_time_seconds": race_result.net_time_seconds,
+        "overall_position": race_result.overall_position,
+        "category_position": race_result.category_position,
+        "sex_position": race_result.sex_position,
+        "gap_to_leader_seconds": race_result.gap_to_leader_seconds,
+        "start_time": race_result.start_time.isoformat() if race_result.start_time else None,
+        "finish_time": race_result.finish_time.isoformat() if race_result.finish_time else None,
+    }
+
+
+def publish_result(event_id: int, race_result: RaceResult) -> int:
+    """Broadcasts a new or changed result row. Call after the write is committed."""
+    frame = format_sse(json.dumps(live_result_payload(race_result)), event="result", event_id=str(race_result.id))
+    return results_hub.publish(event_id, frame)
@@ -1,40 +1,89 @@
 from sqlalchemy.ext.asyncio import AsyncSession # Standard import
-from sqlalchemy import select
-from sqlalchemy.orm import joinedload # selectinload is not used in the provided code, keeping joinedload
+from sqlalchemy import select, update, or_, func, case, cast, literal, Integer, DateTime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 from fastapi import HTTPException, status
 from datetime import datetime # Python's datetime
-from typing import List, Optional
+from typing import List, Optional, Dict, Set, Iterator
 
 from app.models.race_result import RaceResult
-from app.models.registration import Registration
+from app.models.registration import Registration, RegistrationStatus
+from app.models.strava_user import StravaUserDB
 from app.models.event import Event # Event model for context if needed later
 from app.models.event_distance import EventDistance # EventDistance model for context if needed later
+from app.models.event_category import EventCategory
+from app.models.start_wave import StartWave
+from app.models.station_crossing import StationCrossing
 
-from app.schemas.race_result import RaceResultRead
+from app.schemas.race_result import RaceResultRead, FinishRecord, FinishOutcome, BulkFinishResult, BulkFinishResponse, ChipAssignment
+from app.schemas.race_result import StationBatchRequest, StationCrossingOutcome, StationCrossingResult, StationBatchResponse
+from app.schemas.race_result import DorsalOrder, DorsalAllocationRequest, DorsalAssignment, DorsalAllocationResponse
+from app.schemas.start_wave import StartWaveUpdateResult
+from app.services import leaderboard_service, result_service, live_results_service, timing_journal_service, standings_service
+from app.services.timing_journal_service import timing_journal
 # from app.schemas.registration import RegistrationRead # Not directly used in return types here
 
+class DorsalIndex:
+    """
+    Per-event map dorsal -> RaceResult id for the events being timed, so a finish finds its
+    RaceResult by primary key instead of joining race_results to registrations.
+    An event is loaded with one query when its start timer fires (or on first lookup), kept
+    in sync by assign_dorsal_number, and dropped with invalidate() when registrations change.
+    A dorsal missing from a loaded event, or found on a row that no longer wears it (see
+    _finish_line_rows), triggers one reload before it is reported unknown.
+    Per worker, like results_cache.
+    """
+
+    def __init__(self):
+        self._events: Dict[int, Dict[int, int]] = {}
+        self.loads = 0
+
+    async def load(self, db: AsyncSession, event_id: int) -> Dict[int, int]:
+        stmt = (
+            select(RaceResult.dorsal_number, RaceResult.id)
+            .join(RaceResult.registration)
+            .where(Registration.event_id == event_id)
+            .where(RaceResult.dorsal_number.isnot(None))
+        )
+        self._events[event_id] = dict((await db.execute(stmt)).all())
+        self.loads += 1
+        return self._events[event_id]
+
+    async def dorsals(self, db: AsyncSession, event_id: int) -> Dict[int, int]:
+        dorsals = self._events.get(event_id)
+        return dorsals if dorsals is not None else await self.load(db, event_id)
+
+    async def lookup_many(self, db: AsyncSession, event_id: int, dorsal_numbers) -> Dict[int, int]:
+        """dorsal -> RaceResult id for the dorsals that exist in the event."""
+        dorsals = await self.dorsals(db, event_id)
+        if any(dorsal_number not in dorsals for dorsal_number in dorsal_numbers):
+            dorsals = await self.load(db, event_id) # Assigned since the load (or by another worker)?
+        return {dorsal_number: dorsals[dorsal_number] for dorsal_number in dorsal_numbers if dorsal_number in dorsals}
+
+    def assign(self, event_id: int, dorsal_number: int, race_result_id: int) -> None:
+        dorsals = self._events.get(event_id)
+        if dorsals is None:
+            return # Not loaded; the next lookup loads it with this dorsal
+        for existing, existing_id in list(dorsals.items()):
+            if existing_id == race_result_id: # The athlete changed dorsal
+                del dorsals[existing]
+        dorsals[dorsal_number] = race_result_id
+
+    def invalidate(self, event_id: Optional[int] = None) -> None:
+        if event_id is None:
+            self._events.clear()
+        else:
+            self._events.pop(event_id, None)
+
+
+dorsal_index = DorsalIndex()
+
 async def assign_dorsal_number(
     db: AsyncSession,
     registration_id: int,
     dorsal_number: int,
     event_id: int # To ensure dorsal is unique per event
 ) -> Optional[RaceResultRead]:
-    # Check if dorsal number is already assigned for this event
-    existing_dorsal_stmt = (
-        select(RaceResult)
-        .join(RaceResult.registration) # Assuming 'registration' is the relationship attribute in RaceResult model
-        .where(
-            Registration.event_id == event_id,
-            RaceResult.dorsal_number == dorsal_number
-        )
-    )
-    existing_dorsal_result = await db.execute(existing_dorsal_stmt)
-    if existing_dorsal_result.scalar_one_or_none():
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"Dorsal number {dorsal_number} is already assigned for this event."
-        )
-
     # Find the RaceResult by registration_id
     race_result_stmt = (
         select(RaceResult)
@@ -49,21 +98,166 @@ async def assign_dorsal_number(
     if race_result_obj.registration.event_id != event_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Registration does not belong to the specified event.")
 
-    race_result_obj.dorsal_number = dorsal_number
+    try:
+        async with db.begin_nested(): # The unique (event_id, dorsal_number) index is the duplicate check
+            race_result_obj.dorsal_number = dorsal_number
+            race_result_obj.event_id = event_id
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Dorsal number {dorsal_number} is already assigned for this event."
+        )
     await db.commit()
+    dorsal_index.assign(event_id, dorsal_number, race_result_obj.id)
     # Refresh to get relationship attributes properly loaded for the schema, if they were changed or are lazy
     # The specific attribute 'registration' is useful here if RaceResultRead needs details from it
     # that might not be loaded by default after commit.
     await db.refresh(race_result_obj, attribute_names=['registration']) 
+    await db.refresh(race_result_obj.registration, attribute_names=['user']) # RaceResultRead embeds the user
 
     return RaceResultRead.model_validate(race_result_obj)
 
+def _free_dorsals(first: int, last: Optional[int], taken: Set[int], reserved: List[tuple] = ()) -> Iterator[int]:
+    """Dorsal numbers from first to last (unbounded if None), skipping taken ones and reserved (first, last) ranges."""
+    number = first
+    while last is None or number <= last:
+        skip_to = next((reserved_last + 1 for reserved_first, reserved_last in reserved if reserved_first <= number <= reserved_last), None)
+        if skip_to is not None:
+            number = skip_to
+            continue
+        if number not in taken:
+            yield number
+        number += 1
+
+async def allocate_dorsals(db: AsyncSession, event_id: int, allocation: DorsalAllocationRequest) -> DorsalAllocationResponse:
+    """
+    Numbers every confirmed (optionally also pending) registration of the event that has no
+    dorsal yet, in one transaction: one query for the candidates, one for the numbers already
+    taken, one executemany UPDATE. Categories with a range draw from it; the others share the
+    numbering from first_dorsal, which skips every category range. Numbers already assigned
+    are never reused. All-or-nothing: an exhausted range assigns nothing.
+    """
+    event = await db.get(Event, event_id)
+    if not event:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found.")
+
+    ranges = {dorsal_range.event_category_id: dorsal_range for dorsal_range in allocation.category_ranges}
+    event_category_ids = set((await db.execute(select(EventCategory.id).where(EventCategory.event_id == event_id))).scalars())
+    unknown = sorted(set(ranges) - event_category_ids)
+    if unknown or len(ranges) != len(allocation.category_ranges):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid or repeated categories in ranges: {unknown}")
+    bounds = sorted((r.first_dorsal, r.last_dorsal) for r in ranges.values())
+    if any(next_first <= last for (_, last), (next_first, _) in zip(bounds, bounds[1:])):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Category dorsal ranges overlap.")
+
+    statuses = [RegistrationStatus.CONFIRMED.value]
+    if allocation.include_pending:
+        statuses.append(RegistrationStatus.PENDING.value)
+    if allocation.order is DorsalOrder.ALPHABETICAL:
+        order_by = [StravaUserDB.lastname, StravaUserDB.firstname, StravaUserDB.username, Registration.id]
+    else:
+        order_by = [Registration.registered_at, Registration.id]
+    candidates = (await db.execute(
+        select(RaceResult.id, Registration.id, Registration.event_category_id)
+        .join(RaceResult.registration)
+        .join(Registration.user)
+        .where(Registration.event_id == event_id)
+        .where(Registration.status.in_(statuses))
+        .where(RaceResult.dorsal_number.is_(None))
+        .order_by(*order_by)
+    )).all()
+    taken = set((await db.execute(
+        select(RaceResult.dorsal_number)
+        .join(RaceResult.registration)
+        .where(Registration.event_id == event_id)
+        .where(RaceResult.dorsal_number.isnot(None))
+    )).scalars())
+
+    shared_numbers = _free_dorsals(allocation.first_dorsal, None, taken, reserved=bounds)
+    range_numbers = {
+        category_id: _free_dorsals(r.first_dorsal, r.last_dorsal, taken) for category_id, r in ranges.items()
+    }
+    assignments = []
+    rows = []
+    for race_result_id, registration_id, category_id in candidates:
+        dorsal_number = next(range_numbers.get(category_id, shared_numbers), None)
+        if dorsal_number is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Dorsal range {ranges[category_id].first_dorsal}-{ranges[category_id].last_dorsal} "
+                       f"is too small for category {category_id}."
+            )
+        assignments.append(DorsalAssignment(registration_id=registration_id, dorsal_number=dorsal_number))
+        rows.append({"id": race_result_id, "dorsal_number": dorsal_number, "event_id": event_id})
+
+    if rows:
+        try:
+            async with db.begin_nested():
+                await db.execute(update(RaceResult), rows) # Bulk UPDATE by primary key
+        except IntegrityError: # Another admin assigned one of these numbers meanwhile
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Dorsals changed during allocation; try again.")
+        await db.commit()
+        dorsal_index.invalidate(event_id)
+        result_service.invalidate_event_results(event_id)
+    return DorsalAllocationResponse(assigned=assignments)
+
+async def assign_chip_ids(db: AsyncSession, event_id: int, chips: List[ChipAssignment]) -> int:
+    """
+    Pairs timing chips with already assigned dorsals, e.g. from the chip supplier's list.
+    All-or-nothing: unknown dorsals or a chip already worn by another dorsal reject the batch.
+    Returns the number of race results updated.
+    """
+    chip_by_dorsal = {assignment.dorsal_number: assignment.chip_id for assignment in chips}
+    if len(set(chip_by_dorsal.values())) != len(chip_by_dorsal) or len(chip_by_dorsal) != len(chips):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Each dorsal and each chip may appear only once.")
+
+    event_results_stmt = (
+        select(RaceResult)
+        .join(RaceResult.registration)
+        .where(Registration.event_id == event_id)
+        .where(or_(RaceResult.dorsal_number.in_(chip_by_dorsal), RaceResult.chip_id.in_(chip_by_dorsal.values())))
+    )
+    race_results = (await db.execute(event_results_stmt)).scalars().all()
+
+    by_dorsal = {rr.dorsal_number: rr for rr in race_results if rr.dorsal_number in chip_by_dorsal}
+    missing = sorted(set(chip_by_dorsal) - set(by_dorsal))
+    if missing:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Dorsals not assigned in this event: {missing}")
+    assigned_chips = set(chip_by_dorsal.values())
+    for race_result in race_results:
+        # A chip may move between dorsals of the same batch (swaps), not away from one left out of it
+        if race_result.chip_id in assigned_chips and race_result.dorsal_number not in chip_by_dorsal:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Chip {race_result.chip_id} is already assigned to dorsal {race_result.dorsal_number}."
+            )
+
+    for dorsal_number, race_result in by_dorsal.items():
+        race_result.chip_id = chip_by_dorsal[dorsal_number]
+    await db.commit()
+    return len(by_dorsal)
+
+async def get_chip_dorsal_map(db: AsyncSession, event_id: int) -> Dict[str, int]:
+    """chip_id -> dorsal_number for every chipped athlete of the event, in one query."""
+    stmt = (
+        select(RaceResult.chip_id, RaceResult.dorsal_number)
+        .join(RaceResult.registration)
+        .where(Registration.event_id == event_id)
+        .where(RaceResult.chip_id.isnot(None))
+        .where(RaceResult.dorsal_number.isnot(None))
+    )
+    return {chip_id: dorsal_number for chip_id, dorsal_number in await db.execute(stmt)}
+
 async def start_event_distance_timer(
     db: AsyncSession, 
     event_id: int, 
     distance_id: int, 
-    start_time: datetime
+    start_time: datetime,
+    journal: bool = True
 ) -> List[RaceResultRead]:
+    if journal: # Durable before anything else happens (see timing_journal_service)
+        await timing_journal.append(timing_journal_service.START, event_id=event_id, distance_id=distance_id, start_time=start_time)
+
     # Verify event and distance exist
     event = await db.get(Event, event_id)
     if not event:
@@ -97,7 +291,11 @@ async def start_event_distance_timer(
         .values(start_time=start_time)
     )
     await db.execute(update_stmt)
+    if await _find_wave(db, distance_id, category_id=None) is None:
+        db.add(StartWave(event_distance_id=distance_id, start_time=start_time)) # So the gun time can be corrected later
     await db.commit()
+    result_service.invalidate_event_results(event_id)
+    await dorsal_index.load(db, event_id) # The timing session opens: finishes will look dorsals up here
 
     # Fetch and return the updated RaceResult objects
     results_stmt = (
@@ -109,29 +307,46 @@ async def start_event_distance_timer(
     updated_race_results = (await db.execute(results_stmt)).scalars().all()
     return [RaceResultRead.model_validate(rr) for rr in updated_race_results]
 
-async def record_athlete_finish(
-    db: AsyncSession, 
-    event_id: int, 
-    dorsal_number: int, 
-    finish_time: datetime
-) -> Optional[RaceResultRead]:
-    # Find RaceResult by dorsal_number and event_id
-    race_result_stmt = (
+def _finish_line_stmt(event_id: int):
+    """RaceResults of an event, with everything a finish needs (response, leaderboards, live push) loaded."""
+    return (
         select(RaceResult)
         .join(RaceResult.registration)
         .where(Registration.event_id == event_id)
-        .where(RaceResult.dorsal_number == dorsal_number)
-        .options(joinedload(RaceResult.registration).joinedload(Registration.user)) # For context in response
+        .options(
+            joinedload(RaceResult.registration).joinedload(Registration.user), # For context in response
+            joinedload(RaceResult.registration).joinedload(Registration.event), # For the leaderboard entry
+            joinedload(RaceResult.registration).joinedload(Registration.distance),
+            joinedload(RaceResult.registration).joinedload(Registration.category), # For the category boards
+        )
     )
-    race_result = (await db.execute(race_result_stmt)).scalar_one_or_none()
 
-    if not race_result:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Race result for dorsal {dorsal_number} in this event not found.")
+async def _finish_line_rows(db: AsyncSession, event_id: int, dorsal_numbers) -> Dict[int, RaceResult]:
+    """
+    The RaceResults wearing these dorsals, keyed by dorsal and loaded like _finish_line_stmt.
+    The dorsal index gives the ids, and each row must still wear the dorsal it was found
+    by: the index is per worker, so another worker or a direct edit may have moved a
+    dorsal since it loaded. Any dorsal not confirmed that way reloads the index once.
+    """
+    dorsal_numbers = set(dorsal_numbers)
 
-    if race_result.finish_time is not None:
-        # Or allow update? For now, raise error if already set.
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Finish time for dorsal {dorsal_number} already recorded.")
+    async def wearing(race_result_ids) -> Dict[int, RaceResult]:
+        stmt = (
+            _finish_line_stmt(event_id)
+            .where(RaceResult.id.in_(race_result_ids), RaceResult.dorsal_number.in_(dorsal_numbers))
+            .execution_options(populate_existing=True) # The dorsals as stored now, not as this session last saw them
+        )
+        return {rr.dorsal_number: rr for rr in (await db.execute(stmt)).unique().scalars().all()}
 
+    loads = dorsal_index.loads
+    by_dorsal = await wearing((await dorsal_index.lookup_many(db, event_id, dorsal_numbers)).values())
+    if len(by_dorsal) < len(dorsal_numbers) and dorsal_index.loads == loads: # Not just reloaded by the lookup
+        dorsals = await dorsal_index.load(db, event_id)
+        by_dorsal = await wearing([dorsals[dorsal_number] for dorsal_number in dorsal_numbers if dorsal_number in dorsals])
+    return by_dorsal
+
+async def _apply_finish(db: AsyncSession, race_result: RaceResult, finish_time: datetime) -> None:
+    """Sets the finish and net time and updates the leaderboards. Does not commit."""
     race_result.finish_time = finish_time
 
     if race_result.start_time:
@@ -144,11 +359,448 @@ async def record_athlete_finish(
         pass 
         # Or: raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Start time not recorded for this athlete. Cannot calculate net time.")
 
+    if race_result.net_time_seconds is not None:
+        registration = race_result.registration
+        await leaderboard_service.record_leaderboard_result(
+            db,
+            user_strava_id=registration.user_strava_id,
+            distance_km=registration.distance.distance_km,
+            time_seconds=race_result.net_time_seconds,
+            activity_date=registration.event.date,
+            event_name=registration.event.name,
+            source=leaderboard_service.RACE_SOURCE,
+            source_id=race_result.id,
+            category=registration.category.name,
+        )
+
+async def _commit_finishes(db: AsyncSession, event_id: int, race_results: List[RaceResult]) -> None:
+    """Updates the standings for the newly timed results, commits, then announces them."""
+    repositioned = await standings_service.place_finishes(db, race_results)
+    try:
+        await db.commit()
+    except Exception:
+        standings_service.standings.invalidate(event_id) # The boards hold finishes the database doesn't
+        raise
+    if race_results:
+        await _finishes_committed(db, event_id, race_results, repositioned)
 
-    await db.commit()
+async def _finishes_committed(db: AsyncSession, event_id: int, race_results: List[RaceResult], repositioned: Set[int]) -> None:
+    # Drop cached pages and push live rows only once the write is durable
+    result_service.invalidate_event_results(event_id)
+    timed = [rr for rr in race_results if rr.net_time_seconds is not None]
+    if timed:
+        result_service.invalidate_leaderboards(years={rr.registration.event.date.year for rr in timed})
+    for race_result in timed: # Spectators only see rows with a net time
+        live_results_service.publish_result(event_id, race_result)
+    # Athletes the new finishes moved down (or whose gap changed) are pushed too
+    moved = repositioned - {rr.id for rr in timed}
+    if moved:
+        await _publish_live_rows(db, event_id, RaceResult.id.in_(moved))
+
+async def _publish_live_rows(db: AsyncSession, event_id: int, *criteria) -> None:
+    """Pushes the committed state of the event's timed rows matching criteria to live spectators."""
+    if not live_results_service.results_hub.subscriber_count(event_id):
+        return # Nobody watching: skip the query
+    rows = await db.execute(
+        select(RaceResult)
+        .where(RaceResult.event_id == event_id, RaceResult.net_time_seconds.isnot(None), *criteria)
+        .options(
+            selectinload(RaceResult.registration).selectinload(Registration.user),
+            selectinload(RaceResult.registration).selectinload(Registration.category),
+            selectinload(RaceResult.registration).selectinload(Registration.distance),
+        )
+        .order_by(RaceResult.overall_position)
+        .execution_options(populate_existing=True) # Positions were written with Core UPDATEs
+    )
+    for race_result in rows.scalars():
+        live_results_service.publish_result(event_id, race_result)
+
+async def record_athlete_finish(
+    db: AsyncSession, 
+    event_id: int, 
+    dorsal_number: int, 
+    finish_time: datetime,
+    journal: bool = True
+) -> Optional[RaceResultRead]:
+    if journal:
+        await timing_journal.append(timing_journal_service.FINISH, event_id=event_id, dorsal_number=dorsal_number, finish_time=finish_time)
+
+    # Find RaceResult by dorsal_number and event_id: dorsal index, then a primary key lookup
+    race_result = (await _finish_line_rows(db, event_id, [dorsal_number])).get(dorsal_number)
+
+    if not race_result:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Race result for dorsal {dorsal_number} in this event not found.")
+
+    if race_result.finish_time is not None:
+        # Or allow update? For now, raise error if already set.
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Finish time for dorsal {dorsal_number} already recorded.")
+
+    await _apply_finish(db, race_result, finish_time)
+    await _commit_finishes(db, event_id, [race_result])
     await db.refresh(race_result, attribute_names=['registration'])
     return RaceResultRead.model_validate(race_result)
 
-async def update_event_distance_start_time(db: AsyncSession, event_id: int, distance_id: int, new_start_time: datetime) -> List[RaceResultRead]:
-    # Implementation in next sub-task
-    pass
+async def record_finishes_bulk(
+    db: AsyncSession,
+    event_id: int,
+    finishes: List[FinishRecord],
+    journal: bool = True
+) -> BulkFinishResponse:
+    """
+    Records a batch of finish-line crossings: the dorsal index resolves every dorsal, one
+    primary key IN query loads them and one commit stores them all. A dorsal that already has a finish, or crosses again later
+    in the same batch, is reported as a duplicate; the earliest crossing wins.
+    """
+    if journal: # The whole batch is one journal line and one fsync
+        await timing_journal.append(
+            timing_journal_service.FINISHES, event_id=event_id,
+            finishes=[(finish.dorsal_number, finish.finish_time) for finish in finishes],
+        )
+
+    event = await db.get(Event, event_id)
+    if not event:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found.")
+
+    by_dorsal = await _finish_line_rows(db, event_id, {finish.dorsal_number for finish in finishes})
+
+    # Earliest crossing per dorsal; ties keep the first one sent
+    first_crossing: Dict[int, int] = {}
+    for index, finish in enumerate(finishes):
+        current = first_crossing.get(finish.dorsal_number)
+        if current is None or finish.finish_time < finishes[current].finish_time:
+            first_crossing[finish.dorsal_number] = index
+
+    outcomes = [] # (finish, outcome, race_result) in request order
+    recorded: List[RaceResult] = []
+    for index, finish in enumerate(finishes):
+        race_result = by_dorsal.get(finish.dorsal_number)
+        if race_result is None:
+            outcome = FinishOutcome.UNKNOWN_DORSAL
+        elif first_crossing[finish.dorsal_number] != index or race_result.finish_time is not None:
+            outcome = FinishOutcome.DUPLICATE
+        else:
+            outcome = FinishOutcome.RECORDED
+            await _apply_finish(db, race_result, finish.finish_time)
+            recorded.append(race_result)
+        outcomes.append((finish, outcome, race_result))
+
+    if recorded:
+        await _commit_finishes(db, event_id, recorded)
+
+    results = [
+        BulkFinishResult(
+            dorsal_number=finish.dorsal_number,
+            finish_time=finish.finish_time,
+            outcome=outcome,
+            race_result_id=race_result.id if race_result is not None else None,
+            net_time_seconds=race_result.net_time_seconds if outcome is FinishOutcome.RECORDED else None,
+        )
+        for finish, outcome, race_result in outcomes
+    ]
+    return BulkFinishResponse(
+        results=results,
+        recorded=len(recorded),
+        duplicates=sum(result.outcome is FinishOutcome.DUPLICATE for result in results),
+        unknown_dorsals=sum(result.outcome is FinishOutcome.UNKNOWN_DORSAL for result in results),
+    )
+
+def _station_batch_response(batch: StationBatchRequest, results: List[StationCrossingResult], replayed: bool) -> StationBatchResponse:
+    return StationBatchResponse(
+        station_id=batch.station_id,
+        batch_id=batch.batch_id,
+        replayed=replayed,
+        results=results,
+        recorded=sum(result.outcome is StationCrossingOutcome.RECORDED for result in results),
+        superseded=sum(result.outcome is StationCrossingOutcome.SUPERSEDED for result in results),
+        duplicates=sum(result.outcome is StationCrossingOutcome.DUPLICATE for result in results),
+        unknown_dorsals=sum(result.outcome is StationCrossingOutcome.UNKNOWN_DORSAL for result in results),
+    )
+
+async def sync_station_batch(
+    db: AsyncSession,
+    event_id: int,
+    batch: StationBatchRequest,
+    journal: bool = True
+) -> StationBatchResponse:
+    """
+    Applies a batch of crossings buffered by a timing station, in one transaction.
+    Retries are safe: a batch_id already applied gets its stored results back, and a
+    crossing_id already received (in any batch of the station) is a duplicate.
+    Several stations may time the same dorsal; its finish is the earliest crossing, ties
+    going to a manual finish, then to the lowest station_id. An earlier crossing uploaded
+    later replaces the finish (and net time), so the outcome doesn't depend on upload order.
+    """
+    if journal:
+        await timing_journal.append(
+            timing_journal_service.STATION_BATCH, event_id=event_id, station_id=batch.station_id, batch_id=batch.batch_id,
+            crossings=[(crossing.crossing_id, crossing.dorsal_number, crossing.finish_time) for crossing in batch.crossings],
+        )
+
+    event = await db.get(Event, event_id)
+    if not event:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found.")
+
+    stored_batch = (await db.execute(
+        select(StationCrossing, RaceResult.net_time_seconds)
+        .outerjoin(RaceResult, StationCrossing.race_result_id == RaceResult.id)
+        .where(StationCrossing.station_id == batch.station_id, StationCrossing.batch_id == batch.batch_id)
+    )).all()
+    if stored_batch:
+        stored = {crossing.crossing_id: (crossing, net_time_seconds) for crossing, net_time_seconds in stored_batch}
+        if any(crossing.crossing_id not in stored for crossing in batch.crossings):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Batch {batch.batch_id} was already applied with different crossings."
+            )
+        results = []
+        for crossing in batch.crossings:
+            row, net_time_seconds = stored[crossing.crossing_id]
+            outcome = StationCrossingOutcome(row.outcome)
+            results.append(StationCrossingResult(
+                crossing_id=row.crossing_id, dorsal_number=row.dorsal_number, outcome=outcome, race_result_id=row.race_result_id,
+                net_time_seconds=net_time_seconds if outcome is StationCrossingOutcome.RECORDED else None,
+            ))
+        return _station_batch_response(batch, results, replayed=True)
+
+    received = set((await db.execute(
+        select(StationCrossing.crossing_id)
+        .where(StationCrossing.station_id == batch.station_id)
+        .where(StationCrossing.crossing_id.in_({crossing.crossing_id for crossing in batch.crossings}))
+    )).scalars())
+    new_crossings = []
+    for crossing in batch.crossings:
+        if crossing.crossing_id not in received:
+            received.add(crossing.crossing_id) # A crossing repeated within the batch counts once
+            new_crossings.append(crossing)
+
+    by_dorsal = await _finish_line_rows(db, event_id, {crossing.dorsal_number for crossing in new_crossings})
+    holders = {
+        crossing.race_result_id: crossing
+        for crossing in (await db.execute(
+            select(StationCrossing)
+            .where(StationCrossing.race_result_id.in_([rr.id for rr in by_dorsal.values()]))
+            .where(StationCrossing.outcome == StationCrossingOutcome.RECORDED.value)
+        )).scalars()
+    }
+
+    # Best new crossing per dorsal
+    best: Dict[int, StationCrossing] = {}
+    rows: Dict[str, StationCrossing] = {}
+    for crossing in new_crossings:
+        race_result = by_dorsal.get(crossing.dorsal_number)
+        row = StationCrossing(
+            event_id=event_id, station_id=batch.station_id, batch_id=batch.batch_id, crossing_id=crossing.crossing_id,
+            dorsal_number=crossing.dorsal_number, finish_time=crossing.finish_time,
+            race_result_id=race_result.id if race_result is not None else None,
+            outcome=(StationCrossingOutcome.SUPERSEDED if race_result is not None else StationCrossingOutcome.UNKNOWN_DORSAL).value,
+        )
+        rows[crossing.crossing_id] = row
+        current = best.get(crossing.dorsal_number)
+        if race_result is not None and (current is None or crossing.finish_time < current.finish_time):
+            best[crossing.dorsal_number] = row # Same station, same time: the first one sent
+
+    recorded: List[RaceResult] = []
+    for dorsal_number, row in best.items():
+        race_result = by_dorsal[dorsal_number]
+        if race_result.finish_time is not None:
+            holder = holders.get(race_result.id)
+            if holder is not None and holder.finish_time == race_result.finish_time:
+                held_by = (race_result.finish_time, holder.station_id)
+            else:
+                held_by = (race_result.finish_time,) # Manual finish: sorts before any station at the same time
+            if (row.finish_time, row.station_id) >= held_by:
+                continue
+            if holder is not None:
+                holder.outcome = StationCrossingOutcome.SUPERSEDED.value
+        row.outcome = StationCrossingOutcome.RECORDED.value
+        await _apply_finish(db, race_result, row.finish_time)
+        recorded.append(race_result)
+
+    db.add_all(rows.values())
+    try:
+        await _commit_finishes(db, event_id, recorded)
+    except IntegrityError: # A concurrent retry of the same crossings got there first
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Crossings were uploaded concurrently; retry the batch.")
+
+    results = []
+    for crossing in batch.crossings:
+        row = rows.pop(crossing.crossing_id, None)
+        if row is None:
+            results.append(StationCrossingResult(
+                crossing_id=crossing.crossing_id, dorsal_number=crossing.dorsal_number, outcome=StationCrossingOutcome.DUPLICATE,
+            ))
+            continue
+        outcome = StationCrossingOutcome(row.outcome)
+        results.append(StationCrossingResult(
+            crossing_id=row.crossing_id, dorsal_number=row.dorsal_number, outcome=outcome, race_result_id=row.race_result_id,
+            net_time_seconds=by_dorsal[row.dorsal_number].net_time_seconds if outcome is StationCrossingOutcome.RECORDED else None,
+        ))
+    return _station_batch_response(batch, results, replayed=False)
+
+async def replay_timing_journal(db: AsyncSession, path: str, event_id: Optional[int] = None) -> Dict[str, int]:
+    """
+    Re-applies every journaled timing input (optionally of one event) in write order,
+    without journaling it again. Idempotent: a start only fills empty start times, a wave
+    correction sets the same start again, a finish never overwrites one and a station
+    batch already applied is recognised by its batch_id, so inputs the database already
+    reflects change nothing.
+    Returns counts of entries replayed, finishes recorded and entries the service rejected.
+    """
+    counts = {"entries": 0, "recorded": 0, "rejected": 0}
+    for entry in timing_journal_service.read_journal(path):
+        if event_id is not None and entry.get("event_id") != event_id:
+            continue
+        counts["entries"] += 1
+        kind = entry["kind"]
+        try:
+            if kind == timing_journal_service.START:
+                await start_event_distance_timer(
+                    db, event_id=entry["event_id"], distance_id=entry["distance_id"],
+                    start_time=datetime.fromisoformat(entry["start_time"]), journal=False,
+                )
+            elif kind == timing_journal_service.WAVE_START:
+                await update_event_distance_start_time(
+                    db, event_id=entry["event_id"], distance_id=entry["distance_id"],
+                    new_start_time=datetime.fromisoformat(entry["start_time"]),
+                    category_id=entry.get("category_id"), journal=False,
+                )
+            elif kind == timing_journal_service.FINISH:
+                await record_athlete_finish(
+                    db, event_id=entry["event_id"], dorsal_number=entry["dorsal_number"],
+                    finish_time=datetime.fromisoformat(entry["finish_time"]), journal=False,
+                )
+                counts["recorded"] += 1
+            elif kind == timing_journal_service.FINISHES:
+                finishes = [
+                    FinishRecord(dorsal_number=dorsal_number, finish_time=datetime.fromisoformat(finish_time))
+                    for dorsal_number, finish_time in entry["finishes"]
+                ]
+                response = await record_finishes_bulk(db, event_id=entry["event_id"], finishes=finishes, journal=False)
+                counts["recorded"] += response.recorded
+            elif kind == timing_journal_service.STATION_BATCH:
+                batch = StationBatchRequest(
+                    station_id=entry["station_id"], batch_id=entry["batch_id"],
+                    crossings=[
+                        {"crossing_id": crossing_id, "dorsal_number": dorsal_number, "finish_time": finish_time}
+                        for crossing_id, dorsal_number, finish_time in entry["crossings"]
+                    ],
+                )
+                response = await sync_station_batch(db, event_id=entry["event_id"], batch=batch, journal=False)
+                counts["recorded"] += 0 if response.replayed else response.recorded
+            elif kind == timing_journal_service.CHIP_READS:
+                chip_dorsals = await get_chip_dorsal_map(db, entry["event_id"])
+                finishes = [
+                    FinishRecord(dorsal_number=chip_dorsals[chip_id], finish_time=datetime.fromisoformat(timestamp))
+                    for chip_id, timestamp, _mat_id in entry["reads"] if chip_id in chip_dorsals
+                ]
+                if finishes:
+                    response = await record_finishes_bulk(db, event_id=entry["event_id"], finishes=finishes, journal=False)
+                    counts["recorded"] += response.recorded
+        except HTTPException:
+            # Already applied (409), or rejected the first time too (unknown event/dorsal).
+            # The services raise these before writing anything, so there is nothing to roll back.
+            counts["rejected"] += 1
+    return counts
+
+async def _find_wave(db: AsyncSession, distance_id: int, category_id: Optional[int]) -> Optional[StartWave]:
+    stmt = select(StartWave).where(StartWave.event_distance_id == distance_id)
+    if category_id is None:
+        stmt = stmt.where(StartWave.event_category_id.is_(None))
+    else:
+        stmt = stmt.where(StartWave.event_category_id == category_id)
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+def _wave_registration_ids(distance_id: int, category_id: Optional[int]):
+    """Registrations a wave starts: one category, or every category of the distance without a wave of its own."""
+    stmt = select(Registration.id).where(Registration.event_distance_id == distance_id)
+    if category_id is not None:
+        return stmt.where(Registration.event_category_id == category_id)
+    category_waves = (
+        select(StartWave.event_category_id)
+        .where(StartWave.event_distance_id == distance_id)
+        .where(StartWave.event_category_id.isnot(None))
+    )
+    return stmt.where(Registration.event_category_id.not_in(category_waves))
+
+def _net_time_seconds_expr(start_time: datetime):
+    """
+    net_time_seconds of a row for a new start time, in SQL (julianday differences in days),
+    truncated to whole seconds like _apply_finish. NULL while the athlete has not finished.
+    """
+    elapsed_days = func.julianday(RaceResult.finish_time) - func.julianday(literal(start_time, DateTime(timezone=True)))
+    # Rounded to milliseconds first: julianday is a float and would turn 1500 s into 1499.99999
+    return case(
+        (RaceResult.finish_time.is_(None), None),
+        else_=cast(func.round(elapsed_days * 86400, 3), Integer),
+    )
+
+async def update_event_distance_start_time(
+    db: AsyncSession,
+    event_id: int,
+    distance_id: int,
+    new_start_time: datetime,
+    category_id: Optional[int] = None,
+    journal: bool = True
+) -> StartWaveUpdateResult:
+    """
+    Sets or corrects the start of a wave: the whole distance, or one category of it
+    (category waves take precedence over the distance-wide wave for their athletes).
+    One set-based UPDATE moves the start of every RaceResult in the wave and recomputes
+    net_time_seconds of those already finished. The finished athletes' leaderboard rows
+    are re-derived in the same transaction, then cached pages are dropped.
+    """
+    if journal:
+        await timing_journal.append(
+            timing_journal_service.WAVE_START, event_id=event_id, distance_id=distance_id,
+            category_id=category_id, start_time=new_start_time,
+        )
+
+    event = await db.get(Event, event_id)
+    if not event:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found.")
+    event_distance = await db.get(EventDistance, distance_id)
+    if not event_distance or event_distance.event_id != event_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event distance not found or not related to this event.")
+    if category_id is not None:
+        event_category = await db.get(EventCategory, category_id)
+        if not event_category or event_category.event_id != event_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event category not found or not related to this event.")
+
+    wave = await _find_wave(db, distance_id, category_id)
+    if wave is None:
+        wave = StartWave(event_distance_id=distance_id, event_category_id=category_id, start_time=new_start_time)
+        db.add(wave)
+    else:
+        wave.start_time = new_start_time
+    await db.flush() # A new category wave takes its athletes out of the distance-wide wave
+
+    in_wave = RaceResult.registration_id.in_(_wave_registration_ids(distance_id, category_id))
+    finished_athletes = (await db.execute(
+        select(Registration.user_strava_id)
+        .join(Registration.race_result)
+        .where(in_wave)
+        .where(RaceResult.finish_time.isnot(None))
+    )).scalars().all()
+    update_stmt = (
+        update(RaceResult)
+        .where(in_wave)
+        .values(start_time=new_start_time, net_time_seconds=_net_time_seconds_expr(new_start_time))
+        .execution_options(synchronize_session=False) # Set-based; nothing in this session holds these rows
+    )
+    results_updated = (await db.execute(update_stmt)).rowcount
+    await leaderboard_service.refresh_athlete_leaderboards(db, finished_athletes)
+    await standings_service.recompute_positions(db, event_id, distance_id) # Every net time of the wave moved
+    await db.commit()
+
+    result_service.invalidate_event_results(event_id)
+    if finished_athletes:
+        result_service.invalidate_leaderboards(years=[event.date.year])
+        # Every finished row of the distance may have a new net time, place or gap
+        await _publish_live_rows(
+            db, event_id, RaceResult.registration_id.in_(select(Registration.id).where(Registration.event_distance_id == distance_id)),
+        )
+    return StartWaveUpdateResult(
+        id=wave.id, event_distance_id=wave.event_distance_id, event_category_id=wave.event_category_id,
+        start_time=wave.start_time, results_updated=results_updated,
+    )
@@ -68,7 +68,7 @@ async def create_registration(
     # await db.refresh(db_registration) # Refresh to get ID if needed for RaceResult, but commit does this.
 
     # Create a corresponding RaceResult entry
-    new_race_result = RaceResult(registration_id=db_registration.id)
+    new_race_result = RaceResult(registration_id=db_registration.id, event_id=db_registration.event_id)
     db.add(new_race_result)
     await db.commit()
     
@@ -93,7 +93,7 @@ async def create_registration(
         .where(Registration.id == db_registration.id)
     )
     loaded_reg_result = await db.execute(loaded_reg_stmt)
-    final_registration = loaded_reg_result.scalar_one_or_none()
+    final_registration = loaded_reg_result.unique().scalar_one_or_none()
     
     if not final_registration: # Should not happen
        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve registration details after creation.")
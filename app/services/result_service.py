@@ -1,8 +1,9 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import joinedload
-from typing import List, Dict, Any, Optional 
-from collections import defaultdict
+from typing import List, Dict, Any, Optional, Callable, Hashable, Iterable, Tuple
+from collections import defaultdict, OrderedDict
+import time
 
 from app.models.race_result import RaceResult
 from app.models.registration import Registration
@@ -13,10 +14,114 @@ from app.models.event import Event
 from app.schemas.race_result import RaceResultRead
 from app.schemas.registration import RegistrationReadMinimal # For RaceResultRead
 from app.schemas.strava_user import UserRead as UserSchema # For RegistrationReadMinimal
+from app.config import Settings
+from fastapi import HTTPException, status
+import base64
+import json
+
+settings = Settings()
+
+# --- Results cache ---
+
+_MISSING = object()
+
+class ResultsCache:
+    """
+    Size-bounded LRU cache with a per-key TTL for computed results pages.
+    Single-process and asyncio-only (no locking); each worker process has its own.
+    """
+
+    def __init__(self, max_entries: int, default_ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.default_ttl_seconds = default_ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict() # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Returns the cached value, or _MISSING if absent or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return _MISSING
+        self._entries.move_to_end(key) # Most recently used
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.default_ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (self._clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False) # Least recently used
+            self.evictions += 1
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drops every key matching predicate. Returns how many were dropped."""
+        stale_keys = [key for key in self._entries if predicate(key)]
+        for key in stale_keys:
+            del self._entries[key]
+        self.invalidations += len(stale_keys)
+        return len(stale_keys)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+results_cache = ResultsCache(
+    max_entries=settings.RESULTS_CACHE_MAX_ENTRIES,
+    default_ttl_seconds=settings.RESULTS_CACHE_TTL_SECONDS,
+)
+
+# Cache keys: ("event_results", event_id) and ("leaderboard", year_or_None, top_n, category, sex, age_band)
+EVENT_RESULTS_KEY = "event_results"
+LEADERBOARD_KEY = "leaderboard"
+
+def invalidate_event_results(event_id: int) -> None:
+    """Call after a write that changes an event's classification (finish, start, corrections)."""
+    results_cache.invalidate(lambda key: key[0] == EVENT_RESULTS_KEY and key[1] == event_id)
+
+def invalidate_leaderboards(years: Optional[Iterable[int]] = None) -> None:
+    """
+    Call after results for the given years change. The overall (all years) board is
+    always dropped too; years=None drops every cached leaderboard.
+    """
+    if years is None:
+        results_cache.invalidate(lambda key: key[0] == LEADERBOARD_KEY)
+        return
+    affected = set(years) | {None}
+    results_cache.invalidate(lambda key: key[0] == LEADERBOARD_KEY and key[1] in affected)
 
 async def get_event_results_classified(
     db: AsyncSession, event_id: int
 ) -> Dict[str, Dict[str, List[RaceResultRead]]]:
+    cache_key = (EVENT_RESULTS_KEY, event_id)
+    cached = results_cache.get(cache_key)
+    if cached is not _MISSING:
+        return cached
+
     stmt = (
         select(RaceResult)
         .join(RaceResult.registration)
@@ -25,7 +130,7 @@ async def get_event_results_classified(
         .join(Registration.user) 
         .where(Registration.event_id == event_id)
         .where(RaceResult.net_time_seconds.isnot(None)) 
-        .order_by(EventCategory.name, EventDistance.distance_km, RaceResult.net_time_seconds.asc())
+        .order_by(EventCategory.name, EventDistance.distance_km, RaceResult.category_position, RaceResult.id) # Positions are stored; nothing to rank here
         .options(
             joinedload(RaceResult.registration).joinedload(Registration.user),
             joinedload(RaceResult.registration).joinedload(Registration.category),
@@ -54,9 +159,8 @@ async def get_event_results_classified(
                 update_data_reg['user'] = user_schema
             
             reg_minimal_schema = RegistrationReadMinimal.model_validate(
-                rr_model.registration, 
-                update=update_data_reg 
-            )
+                rr_model.registration
+            ).model_copy(update=update_data_reg)
 
         # Pass populated registration schema to RaceResultRead
         update_data_rr = {}
@@ -64,12 +168,14 @@ async def get_event_results_classified(
             update_data_rr['registration'] = reg_minimal_schema
 
         rr_schema = RaceResultRead.model_validate(
-            rr_model,
-            update=update_data_rr 
-        )
+            rr_model
+        ).model_copy(update=update_data_rr)
         classified_results[category_name][distance_km_str].append(rr_schema)
            
-    return dict(classified_results)
+    classified_results = dict(classified_results)
+    results_cache.set(cache_key, classified_results)
+    return classified_results
+
 
 # --- Leaderboard specific imports and constants ---
 from app.models.virtual_result import VirtualResult
@@ -77,189 +183,173 @@ from app.models.virtual_result import VirtualResult
 from datetime import datetime, timedelta
 from sqlalchemy import and_, or_, func, extract # Ensure extract is imported
 
-# Define standard distances for leaderboards (in km)
-STANDARD_DISTANCES_KM = [1.0, 3.0, 5.0, 7.0, 10.0, 12.0]
-# Define a tolerance for matching activity distances to standard distances
-DISTANCE_TOLERANCE_KM = 0.1 # e.g., 5km +/- 0.1km
+# Standard distances and tolerance live in app.core.distances; re-exported here for routers/templates
+from app.core.distances import (
+    STANDARD_DISTANCES_KM,
+    DISTANCE_TOLERANCE_KM,
+)
+from app.core.age_groups import AGE_BANDS
+from app.services import leaderboard_service, leaderboard_engine
+
+
+def _leaderboard_entry(row) -> Dict[str, Any]:
+    return {
+        "athlete_name": f"{row['firstname'] or ''} {row['lastname'] or ''}".strip(),
+        "user_strava_id": row['user_strava_id'],
+        "time_seconds": row['time_seconds'],
+        "actual_distance_km": row['distance_km'],
+        "pace_seconds_per_km": row['best_pace_seconds_per_km'],
+        "event_name": row['event_name'],
+        "activity_date": row['activity_date'].strftime('%Y-%m-%d') if row['activity_date'] else 'N/A',
+        "source": row['source'],
+    }
+
 
 async def get_yearly_leaderboard(
     db: AsyncSession, 
     year: Optional[int] = None, 
-    top_n: int = 10
+    top_n: int = 10,
+    streaming: bool = False,
+    vectorized: bool = False, # NumPy engine over raw results; needs numpy installed
+    category: Optional[str] = None, # EventCategory name; race results only
+    sex: Optional[str] = None, # "M" / "F", as reported by Strava
+    age_band: Optional[str] = None, # One of the AGE_BANDS labels, e.g. "40-49"
 ) -> Dict[str, List[Dict[str, Any]]]:
-    leaderboard: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-
-    processed_results_for_leaderboard = []
-
-    # --- Query RaceResults ---
-    race_results_query = (
-        select(
-            RaceResult.net_time_seconds,
-            Registration.user_strava_id,
-            EventDistance.distance_km,
-            Event.name.label("event_name"),
-            Event.date.label("activity_date"),
-            StravaUserDB.firstname,
-            StravaUserDB.lastname
-        )
-        .join(RaceResult.registration)
-        .join(Registration.user)
-        .join(Registration.event)  # Join to Event through Registration
-        .join(Registration.distance)  # Join to EventDistance through Registration
-        .where(RaceResult.net_time_seconds.isnot(None))
-    )
-    if year:
-        race_results_query = race_results_query.where(
-            extract('year', Event.date) == year
+    if age_band and age_band not in [label for label, _, _ in AGE_BANDS]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown age group {age_band!r}. Use one of {[label for label, _, _ in AGE_BANDS]}."
         )
-    
-    race_results_db = (await db.execute(race_results_query)).mappings().all()
-    for res_data in race_results_db:
-        processed_results_for_leaderboard.append({**res_data, 'source': 'Race'})
-
-
-    # --- Query VirtualResults ---
-    virtual_results_query = (
-        select(
-            VirtualResult.elapsed_time_seconds.label("net_time_seconds"),
-            VirtualResult.user_strava_id,
-            VirtualResult.distance_km,
-            VirtualResult.name.label("event_name"), # Using activity name as event_name
-            VirtualResult.activity_date,
-            StravaUserDB.firstname,
-            StravaUserDB.lastname
+    filtered = bool(category or sex or age_band)
+    if (streaming or vectorized) and filtered:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only the stored leaderboards can be filtered; drop streaming/vectorized."
         )
-        .join(VirtualResult.user) # Assuming VirtualResult.user is the relationship to StravaUserDB
-        .where(VirtualResult.elapsed_time_seconds.isnot(None))
+
+    # Every standard distance gets a key, even when nobody qualifies for it yet
+    leaderboard: Dict[str, List[Dict[str, Any]]] = {
+        f"{std_dist_km} km": [] for std_dist_km in STANDARD_DISTANCES_KM
+    }
+
+    if streaming or vectorized:
+        # Computed from raw results, e.g. before the tables are backfilled or to cross-check them:
+        # streamed with bounded memory, or loaded into NumPy arrays
+        if vectorized:
+            rows = await leaderboard_engine.get_top_leaderboard_rows_vectorized(db, year=year, top_n=top_n)
+        else:
+            rows = await leaderboard_service.stream_top_leaderboard_rows(db, year=year, top_n=top_n)
+        for row in rows:
+            leaderboard[f"{row['bucket_km']} km"].append(_leaderboard_entry(row))
+        return leaderboard
+
+    cache_key = (LEADERBOARD_KEY, year or None, top_n, category, sex, age_band)
+    cached = results_cache.get(cache_key)
+    if cached is not _MISSING:
+        return cached
+
+    # Reads the incrementally maintained leaderboard_entries / personal_bests / leaderboard_rollups tables
+    rows = await leaderboard_service.get_top_leaderboard_rows(
+        db, year=year, top_n=top_n, category=category, sex=sex, age_band=age_band
     )
-    if year:
-        virtual_results_query = virtual_results_query.where(
-            extract('year', VirtualResult.activity_date) == year
+    for row in rows:
+        leaderboard[f"{row['bucket_km']} km"].append(_leaderboard_entry(row))
+
+    results_cache.set(cache_key, leaderboard, ttl_seconds=settings.LEADERBOARD_CACHE_TTL_SECONDS)
+    return leaderboard
+
+
+def encode_leaderboard_cursor(position: int, row) -> str:
+    """Opaque cursor for the row that ended a page: its position plus its rank key."""
+    payload = [position, row['best_pace_seconds_per_km'], row['time_seconds'], row['user_strava_id']]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_leaderboard_cursor(cursor: str) -> Tuple[int, Tuple[float, int, int]]:
+    try:
+        position, pace, time_seconds, user_strava_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(position), (float(pace), int(time_seconds), int(user_strava_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid leaderboard cursor.")
+
+
+def _standard_bucket(distance_km: float) -> float:
+    if distance_km not in STANDARD_DISTANCES_KM:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{distance_km} km is not a standard distance. Use one of {STANDARD_DISTANCES_KM}."
         )
-    
-    virtual_results_db = (await db.execute(virtual_results_query)).mappings().all()
-    for res_data in virtual_results_db:
-        processed_results_for_leaderboard.append({**res_data, 'source': 'Virtual'})
-    
-    # Process results for each standard distance
-    for std_dist_km in STANDARD_DISTANCES_KM:
-        candidate_results = []
-        for res_data in processed_results_for_leaderboard:
-            # Check if res_data['distance_km'] is not None before comparison
-            if res_data['distance_km'] is not None and \
-               abs(res_data['distance_km'] - std_dist_km) <= DISTANCE_TOLERANCE_KM:
-                
-                pace_seconds_per_km = None
-                if res_data['distance_km'] > 0 and res_data['net_time_seconds'] is not None:
-                    pace_seconds_per_km = res_data['net_time_seconds'] / res_data['distance_km']
-                
-                candidate_results.append({
-                    "athlete_name": f"{res_data.get('firstname', '') or ''} {res_data.get('lastname', '') or ''}".strip(),
-                    "user_strava_id": res_data['user_strava_id'],
-                    "time_seconds": res_data['net_time_seconds'],
-                    "actual_distance_km": res_data['distance_km'],
-                    "pace_seconds_per_km": pace_seconds_per_km,
-                    "event_name": res_data['event_name'],
-                    "activity_date": res_data['activity_date'].strftime('%Y-%m-%d') if res_data['activity_date'] else 'N/A',
-                    "source": res_data['source']
-                })
-
-        # Sort by pace (handling None), then by time as a tie-breaker
-        candidate_results.sort(key=lambda x: (x['pace_seconds_per_km'] is None, x['pace_seconds_per_km'], x['time_seconds']))
-
-        best_user_results = {} # Store the best result for each user for this distance
-        for res in candidate_results:
-            user_id = res['user_strava_id']
-            # Only consider results with a valid pace for comparison, unless user has no paced results yet
-            if res['pace_seconds_per_km'] is not None:
-                if user_id not in best_user_results or \
-                   best_user_results[user_id]['pace_seconds_per_km'] is None or \
-                   res['pace_seconds_per_km'] < best_user_results[user_id]['pace_seconds_per_km']:
-                    best_user_results[user_id] = res
-            elif user_id not in best_user_results: # If user has no paced result yet, store this one (even if unpaced for now)
-                 best_user_results[user_id] = res
-
-        # Get the top N results from the best user results
-        top_results_for_distance = sorted(
-            list(best_user_results.values()), 
-            key=lambda x: (x['pace_seconds_per_km'] is None, x['pace_seconds_per_km'], x['time_seconds'])
-        )[:top_n]
-        
-        leaderboard[f"{std_dist_km} km"] = top_results_for_distance
-           
-    return dict(leaderboard)
+    return distance_km
 
 
-async def get_user_personal_bests(
+async def get_leaderboard_page(
     db: AsyncSession,
-    user_strava_id: int
-) -> Dict[str, Dict[str, Any]]: # Key: "5.0 km", Value: best result dict
-    # Calculates a user's personal best performances for standard distances.
-    # Considers both their RaceResult and VirtualResult.
-    personal_bests: Dict[str, Dict[str, Any]] = {}
+    distance_km: float,
+    year: Optional[int] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    One page of the full board for a standard distance. Pass the returned next_cursor
+    to get the following page; it is None on the last page.
+    """
+    bucket_km = _standard_bucket(distance_km)
+    position, after = decode_leaderboard_cursor(cursor) if cursor else (0, None)
 
-    # --- Query RaceResults for the user ---
-    race_results_query = (
-        select(
-            RaceResult.net_time_seconds,
-            EventDistance.distance_km,
-            Event.name.label("event_name"),
-            Event.date.label("activity_date")
-        )
-        .join(RaceResult.registration)
-        .join(Registration.event) # Event is joined from Registration
-        .join(Registration.distance) # EventDistance is joined from Registration
-        .where(Registration.user_strava_id == user_strava_id)
-        .where(RaceResult.net_time_seconds.isnot(None))
+    rows = await leaderboard_service.get_leaderboard_page_rows(
+        db, bucket_km=bucket_km, year=year, limit=limit + 1, after=after
     )
-    user_race_results = (await db.execute(race_results_query)).mappings().all()
-
-    # --- Query VirtualResults for the user ---
-    virtual_results_query = (
-        select(
-            VirtualResult.elapsed_time_seconds.label("net_time_seconds"),
-            VirtualResult.distance_km,
-            VirtualResult.name.label("event_name"),
-            VirtualResult.activity_date
-        )
-        .where(VirtualResult.user_strava_id == user_strava_id)
-        .where(VirtualResult.elapsed_time_seconds.isnot(None))
+    entries = []
+    for row in rows[:limit]:
+        position += 1
+        entries.append({"position": position, **_leaderboard_entry(row)})
+
+    next_cursor = encode_leaderboard_cursor(position, rows[limit - 1]) if len(rows) > limit else None
+    return {"distance": f"{bucket_km} km", "year": year, "entries": entries, "next_cursor": next_cursor}
+
+
+async def get_user_leaderboard_ranks(
+    db: AsyncSession,
+    user_strava_id: int,
+    year: Optional[int] = None,
+    distance_km: Optional[float] = None,
+) -> Dict[str, Dict[str, int]]: # Key: "5.0 km", Value: {"position": 3, "total": 42}
+    # Position of the athlete on each board they appear on (overall board when year is None)
+    bucket_km = _standard_bucket(distance_km) if distance_km is not None else None
+    rows = await leaderboard_service.get_athlete_rank_rows(
+        db, user_strava_id=user_strava_id, year=year, bucket_km=bucket_km
     )
-    user_virtual_results = (await db.execute(virtual_results_query)).mappings().all()
+    return {f"{row['bucket_km']} km": {"position": row['position'], "total": row['total']} for row in rows}
 
-    all_user_activities = []
-    for res_data in user_race_results:
-        all_user_activities.append({**res_data, 'source': 'Race'})
-    for res_data in user_virtual_results:
-        all_user_activities.append({**res_data, 'source': 'Virtual'})
-    
-    for std_dist_km in STANDARD_DISTANCES_KM:
-        best_result_for_std_dist = None
-        current_best_pace = float('inf')
-
-        for activity in all_user_activities:
-            activity_dist_km = activity.get('distance_km')
-            activity_time_sec = activity.get('net_time_seconds')
-
-            if activity_dist_km is None or activity_time_sec is None:
-                continue
-
-            if abs(activity_dist_km - std_dist_km) <= DISTANCE_TOLERANCE_KM:
-                if activity_dist_km > 0: # Avoid division by zero
-                    pace_seconds_per_km = activity_time_sec / activity_dist_km
-                    
-                    if pace_seconds_per_km < current_best_pace:
-                        current_best_pace = pace_seconds_per_km
-                        best_result_for_std_dist = {
-                            "time_seconds": activity_time_sec,
-                            "actual_distance_km": activity_dist_km,
-                            "pace_seconds_per_km": pace_seconds_per_km,
-                            "event_name": activity['event_name'],
-                            "activity_date": activity['activity_date'].strftime('%Y-%m-%d') if activity['activity_date'] else 'N/A',
-                            "source": activity['source']
-                        }
-        
-        if best_result_for_std_dist:
-            personal_bests[f"{std_dist_km} km"] = best_result_for_std_dist
+
+async def get_user_personal_bests(
+    db: AsyncSession,
+    user_strava_id: int,
+    vectorized: bool = False # Recompute from raw results with the NumPy engine
+) -> Dict[str, Dict[str, Any]]: # Key: "5.0 km", Value: best result dict
+    # A user's personal best performances for standard distances, across RaceResult and VirtualResult.
+    # Read from the materialized personal_bests table (one indexed lookup), which is updated
+    # whenever a result beats the stored best; see leaderboard_service.recompute_personal_bests
+    # for corrections.
+    personal_bests: Dict[str, Dict[str, Any]] = {}
+
+    if vectorized:
+        rows = await leaderboard_engine.get_personal_best_rows_vectorized(db, user_strava_id=user_strava_id)
+    else:
+        rows = [
+            {"bucket_km": pb.bucket_km, "time_seconds": pb.time_seconds, "distance_km": pb.distance_km,
+             "best_pace_seconds_per_km": pb.best_pace_seconds_per_km, "event_name": pb.event_name,
+             "activity_date": pb.activity_date, "source": pb.source}
+            for pb in await leaderboard_service.get_personal_best_rows(db, user_strava_id=user_strava_id)
+        ]
+    for pb in rows:
+        personal_bests[f"{pb['bucket_km']} km"] = {
+            "time_seconds": pb['time_seconds'],
+            "actual_distance_km": pb['distance_km'],
+            "pace_seconds_per_km": pb['best_pace_seconds_per_km'],
+            "event_name": pb['event_name'],
+            "activity_date": pb['activity_date'].strftime('%Y-%m-%d') if pb['activity_date'] else 'N/A',
+            "source": pb['source']
+        }
             
     return personal_bests
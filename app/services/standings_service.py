@@ -0,0 +1,229 @@
+"""
+Live standings: keeps the denormalized position columns of RaceResult (overall,
+category and sex position, gap to the leader; see app/core/positions.py) current as
+finishes are recorded, so the results page reads them instead of ranking the field.
+
+Each timed (event, distance) has an in-memory board of bisect-sorted lists: one for the
+whole distance, one per category and one per sex. A finish is inserted in O(log n) and
+only the rows from its insertion point on can change position; those are compared with
+the positions last written and only the differences are updated. Most finishers arrive
+slower than everyone already in, so a finish usually writes just its own row.
+
+Per process, like race_service.dorsal_index: a board is loaded from the database on
+first use and dropped on anything it cannot follow (set-based start time corrections,
+failed commits); recompute_positions rebuilds the columns in SQL. Before each use the
+board's count and total of net times are checked against the database with one
+aggregate query, so finishes another worker (or process) recorded trigger a reload
+instead of positions computed from a stale field.
+"""
+from bisect import bisect_left, insort
+from typing import Any, Collection, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.positions import POSITION_COLUMNS, position_sort_key, positions_update_stmts
+from app.models.race_result import RaceResult
+from app.models.registration import Registration
+from app.models.strava_user import StravaUserDB
+
+OVERALL = ("overall",)
+
+
+class _Entry:
+    __slots__ = ("key", "category_id", "sex", "positions")
+
+    def __init__(self, key: tuple, category_id: int, sex: Optional[str], positions: Dict[str, Optional[int]]):
+        self.key = key
+        self.category_id = category_id
+        self.sex = sex
+        self.positions = positions # As last written to the database
+
+
+class StandingsBoard:
+    """Sorted finishers of one event distance, overall and per category and sex."""
+
+    def __init__(self):
+        self._lists: Dict[tuple, List[tuple]] = {OVERALL: []}
+        self._entries: Dict[int, _Entry] = {}
+        self._dirty_from: Dict[tuple, int] = {}
+        self.net_total = 0 # Sum of the net times on the board, to check it against the database
+
+    def _groups(self, entry: _Entry) -> List[tuple]:
+        groups = [OVERALL, ("category", entry.category_id)]
+        if entry.sex is not None:
+            groups.append(("sex", entry.sex))
+        return groups
+
+    def _mark(self, group: tuple, index: int) -> None:
+        self._dirty_from[group] = min(index, self._dirty_from.get(group, index))
+
+    def add_stored(self, race_result_id: int, net_time_seconds: int, category_id: int, sex: Optional[str], positions: Dict[str, Optional[int]]) -> None:
+        """Loads a row as the database has it (no changes pending)."""
+        entry = _Entry(position_sort_key(net_time_seconds, race_result_id), category_id, sex, positions)
+        self._entries[race_result_id] = entry
+        self.net_total += net_time_seconds
+        for group in self._groups(entry):
+            insort(self._lists.setdefault(group, []), entry.key)
+
+    def place(self, race_result_id: int, net_time_seconds: int, category_id: int, sex: Optional[str]) -> None:
+        """Inserts a finish, or moves it if the result was already on the board."""
+        entry = self._entries.get(race_result_id)
+        if entry is not None:
+            for group in self._groups(entry):
+                ranked = self._lists[group]
+                index = bisect_left(ranked, entry.key)
+                del ranked[index]
+                self._mark(group, index)
+            self.net_total -= entry.key[0]
+            entry.key, entry.category_id, entry.sex = position_sort_key(net_time_seconds, race_result_id), category_id, sex
+        else:
+            entry = _Entry(position_sort_key(net_time_seconds, race_result_id), category_id, sex, dict.fromkeys(POSITION_COLUMNS))
+            self._entries[race_result_id] = entry
+        self.net_total += net_time_seconds
+        for group in self._groups(entry):
+            ranked = self._lists.setdefault(group, [])
+            index = bisect_left(ranked, entry.key)
+            ranked.insert(index, entry.key)
+            self._mark(group, index)
+
+    def totals(self, excluding: Collection[int] = ()) -> Tuple[int, int]:
+        """(count, sum of net times) of the finishes on the board, leaving out the given results."""
+        count, net_total = len(self._entries), self.net_total
+        for race_result_id in excluding:
+            entry = self._entries.get(race_result_id)
+            if entry is not None:
+                count, net_total = count - 1, net_total - entry.key[0]
+        return count, net_total
+
+    def changes(self) -> Dict[int, Dict[str, Optional[int]]]:
+        """Positions that differ from the last written ones, per race result id; marks them written."""
+        computed: Dict[int, Dict[str, Optional[int]]] = {}
+        column_for = {"overall": "overall_position", "category": "category_position", "sex": "sex_position"}
+        for group, start in self._dirty_from.items():
+            for index, (_, race_result_id) in enumerate(self._lists[group][start:], start=start):
+                computed.setdefault(race_result_id, {})[column_for[group[0]]] = index + 1
+        overall = self._lists[OVERALL]
+        if OVERALL in self._dirty_from and overall:
+            leader_net = overall[0][0]
+            # A new leader changes every gap; otherwise only the rows that moved
+            for net_time_seconds, race_result_id in overall[self._dirty_from[OVERALL]:]:
+                computed[race_result_id]["gap_to_leader_seconds"] = net_time_seconds - leader_net
+        self._dirty_from.clear()
+
+        changed = {}
+        for race_result_id, positions in computed.items():
+            entry = self._entries[race_result_id]
+            if entry.sex is None:
+                positions["sex_position"] = None
+            if any(entry.positions[column] != value for column, value in positions.items()):
+                entry.positions.update(positions)
+                changed[race_result_id] = dict(entry.positions)
+        return changed
+
+
+class Standings:
+    """The boards of every event distance timed in this process."""
+
+    def __init__(self):
+        self._boards: Dict[Tuple[int, int], StandingsBoard] = {}
+        self.loads = 0
+        self.stale_reloads = 0
+
+    @staticmethod
+    def _timed(event_id: int, distance_id: int):
+        return (
+            Registration.event_id == event_id, Registration.event_distance_id == distance_id,
+            RaceResult.net_time_seconds.isnot(None),
+        )
+
+    async def _in_step(self, db: AsyncSession, board: StandingsBoard, event_id: int, distance_id: int, placing: Collection[int]) -> bool:
+        """Whether the database holds the same finishes as the board, apart from the ones being placed."""
+        stmt = (
+            select(func.count(RaceResult.id), func.coalesce(func.sum(RaceResult.net_time_seconds), 0))
+            .join(RaceResult.registration)
+            .where(*self._timed(event_id, distance_id))
+        )
+        if placing:
+            stmt = stmt.where(RaceResult.id.not_in(placing))
+        count, net_total = (await db.execute(stmt)).one()
+        return board.totals(excluding=placing) == (count, net_total)
+
+    async def board(self, db: AsyncSession, event_id: int, distance_id: int, placing: Collection[int] = ()) -> StandingsBoard:
+        """The event distance's board, (re)loaded if it isn't in step with the database. `placing`: results about to be placed."""
+        board = self._boards.get((event_id, distance_id))
+        if board is not None and not await self._in_step(db, board, event_id, distance_id, placing):
+            board = None
+            self.stale_reloads += 1
+        if board is None:
+            board = StandingsBoard()
+            rows = await db.execute(
+                select(
+                    RaceResult.id, RaceResult.net_time_seconds, Registration.event_category_id, StravaUserDB.sex,
+                    *(getattr(RaceResult, column) for column in POSITION_COLUMNS),
+                )
+                .join(RaceResult.registration)
+                .join(Registration.user)
+                .where(*self._timed(event_id, distance_id))
+                .where(RaceResult.id.not_in(placing))
+            )
+            for race_result_id, net_time_seconds, category_id, sex, *positions in rows:
+                board.add_stored(race_result_id, net_time_seconds, category_id, sex, dict(zip(POSITION_COLUMNS, positions)))
+            self._boards[(event_id, distance_id)] = board
+            self.loads += 1
+        return board
+
+    def invalidate(self, event_id: Optional[int] = None) -> None:
+        if event_id is None:
+            self._boards.clear()
+            return
+        for key in [key for key in self._boards if key[0] == event_id]:
+            del self._boards[key]
+
+
+standings = Standings()
+
+
+async def place_finishes(db: AsyncSession, race_results: Iterable[RaceResult]) -> Set[int]:
+    """
+    Puts newly timed results on their boards and writes every position that changed:
+    on the given rows directly, on the rest of the field with one UPDATE by primary key.
+    Expects registration.user to be loaded. Does not commit. Returns the ids of every row
+    written, so the rows of the field that moved can be published along with the new ones.
+    """
+    timed = [rr for rr in race_results if rr.net_time_seconds is not None]
+    by_id = {rr.id: rr for rr in timed}
+    changed: Dict[int, Dict[str, Any]] = {}
+    boards = {}
+    for race_result in timed:
+        registration = race_result.registration
+        key = (registration.event_id, registration.event_distance_id)
+        if key not in boards:
+            boards[key] = await standings.board(db, *key, placing=by_id.keys())
+        boards[key].place(
+            race_result.id, race_result.net_time_seconds, registration.event_category_id,
+            registration.user.sex if registration.user else None,
+        )
+    for board in boards.values():
+        changed.update(board.changes())
+
+    others = []
+    for race_result_id, positions in changed.items():
+        race_result = by_id.get(race_result_id)
+        if race_result is not None:
+            for column, value in positions.items():
+                setattr(race_result, column, value)
+        else:
+            others.append({"id": race_result_id, **positions})
+    if others:
+        await db.execute(update(RaceResult), others)
+    return set(changed)
+
+
+async def recompute_positions(db: AsyncSession, event_id: int, distance_id: Optional[int] = None) -> None:
+    """Rewrites the position columns of an event (or one distance) in SQL. Does not commit."""
+    for stmt in positions_update_stmts(
+        RaceResult.__table__, Registration.__table__, StravaUserDB.__table__, event_id=event_id, distance_id=distance_id,
+    ):
+        await db.execute(stmt)
+    standings.invalidate(event_id)
@@ -1,17 +1,21 @@
+import asyncio
 import httpx
-from typing import List, Dict, Optional, Any
+from typing import AsyncIterator, List, Dict, Optional, Any, Tuple
 from datetime import datetime, timedelta, timezone
 from sqlalchemy import select # Use select from sqlalchemy
 
 from sqlalchemy.ext.asyncio import AsyncSession # Use standard import
 from app.models.strava_user import StravaUserDB, StravaTokenData # StravaTokenData for refresh response
 from app.core.security import decrypt_token, encrypt_token # Assuming these exist and work
+from app.core.rate_limit import RateLimitBudget
 from app.config import Settings
 
 settings = Settings()
 
-STRAVA_API_BASE_URL = "https://www.strava.com/api/v3"
-STRAVA_OAUTH_URL = "https://www.strava.com/oauth/token"
+STRAVA_API_BASE_URL = f"{settings.STRAVA_BASE_URL}/api/v3"
+STRAVA_OAUTH_URL = f"{settings.STRAVA_BASE_URL}/oauth/token"
+STRAVA_AUTHORIZE_URL = f"{settings.STRAVA_BASE_URL}/oauth/authorize"
+STRAVA_DEAUTHORIZE_URL = f"{settings.STRAVA_BASE_URL}/oauth/deauthorize"
 
 # Define relevant activity types for virtual events
 # Based on Strava's documentation: https://developers.strava.com/docs/reference/#api-models-ActivityType
@@ -26,6 +30,10 @@ RELEVANT_STRAVA_ACTIVITY_TYPES = [
 ]
 
 
+class StravaAuthorizationError(Exception):
+    """The athlete has no usable Strava token (deauthorized, or the refresh was refused)."""
+
+
 async def _refresh_strava_token(db: AsyncSession, user: StravaUserDB, client: httpx.AsyncClient) -> Optional[str]:
     """Helper function to refresh Strava access token."""
     payload = {
@@ -61,7 +69,10 @@ async def _refresh_strava_token(db: AsyncSession, user: StravaUserDB, client: ht
 
 async def get_strava_access_token(db: AsyncSession, user: StravaUserDB, client: httpx.AsyncClient) -> Optional[str]:
     """Gets a valid Strava access token, refreshing if necessary."""
-    if user.token_expires_at <= datetime.now(timezone.utc) + timedelta(minutes=5):
+    expires_at = user.token_expires_at
+    if expires_at.tzinfo is None: # SQLite hands timezone-aware columns back naive; stored as UTC
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    if expires_at <= datetime.now(timezone.utc) + timedelta(minutes=5):
         access_token = await _refresh_strava_token(db, user, client)
         if not access_token:
             return None 
@@ -118,3 +129,158 @@ async def get_strava_activities(
     except Exception as e:
         # print(f"Unexpected error fetching activities: {e}")
         return []
+
+
+async def _get_activities_page(
+    client: httpx.AsyncClient,
+    access_token: str,
+    page: int,
+    per_page: int,
+    after: Optional[int],
+    before: Optional[int],
+) -> List[Dict[str, Any]]:
+    params = {"page": page, "per_page": per_page}
+    if after:
+        params["after"] = after
+    if before:
+        params["before"] = before
+    response = await client.get(
+        f"{STRAVA_API_BASE_URL}/athlete/activities", headers={"Authorization": f"Bearer {access_token}"}, params=params
+    )
+    response.raise_for_status()
+    return response.json()
+
+async def iter_strava_activity_pages(
+    db: AsyncSession,
+    user_strava_id: int,
+    client: httpx.AsyncClient,
+    per_page: int = 200,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    max_in_flight: int = 3,
+    budget: Optional[RateLimitBudget] = None,
+) -> AsyncIterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Yields (page number, activities) for every page of a user's activities, in page order,
+    until Strava returns a short page. Strava doesn't say how many pages there are, so the
+    first page is fetched alone; once a page comes back full, the next max_in_flight pages
+    are requested while the caller stores it. Stops at the first page that fails: the
+    pages yielded until then are complete. With a budget, every page request waits for it.
+    """
+    user_stmt = select(StravaUserDB).where(StravaUserDB.strava_id == user_strava_id)
+    user = (await db.execute(user_stmt)).scalar_one_or_none()
+    if not user:
+        return
+    access_token = await get_strava_access_token(db, user, client)
+    if not access_token:
+        return
+
+    in_flight: Dict[int, asyncio.Task] = {}
+
+    async def fetch(page: int) -> List[Dict[str, Any]]:
+        if budget is not None:
+            await budget.acquire()
+        return await _get_activities_page(client, access_token, page, per_page, after, before)
+
+    def request(page: int) -> None:
+        in_flight[page] = asyncio.create_task(fetch(page))
+
+    async def cancel_in_flight() -> None:
+        for task in in_flight.values():
+            task.cancel()
+        await asyncio.gather(*in_flight.values(), return_exceptions=True)
+        in_flight.clear()
+
+    page = 1
+    refreshed = False
+    request(page)
+    try:
+        while True:
+            try:
+                activities = await in_flight.pop(page)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 401 and not refreshed:
+                    # Refresh once and start over from this page; the pages ahead used the old token too
+                    refreshed = True
+                    await cancel_in_flight()
+                    access_token = await _refresh_strava_token(db, user, client)
+                    if access_token:
+                        request(page)
+                        continue
+                return
+            except (httpx.HTTPError, ValueError):
+                return
+
+            full = len(activities) >= per_page
+            if full:
+                for ahead in range(page + 1, page + 1 + max_in_flight):
+                    if ahead not in in_flight:
+                        request(ahead)
+            yield page, activities
+            if not full:
+                return
+            page += 1
+    finally:
+        await cancel_in_flight()
+
+async def get_strava_activity(
+    db: AsyncSession,
+    user_strava_id: int,
+    activity_id: int,
+    client: httpx.AsyncClient,
+    budget: Optional[RateLimitBudget] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Fetches one activity of the athlete. Returns None if Strava doesn't have it (deleted,
+    or no longer visible to us); raises StravaAuthorizationError without a usable token
+    and httpx errors on any other failure, so the caller can retry later.
+    """
+    user_stmt = select(StravaUserDB).where(StravaUserDB.strava_id == user_strava_id)
+    user = (await db.execute(user_stmt)).scalar_one_or_none()
+    if not user or not user.encrypted_refresh_token:
+        raise StravaAuthorizationError(f"Athlete {user_strava_id} is not connected to Strava.")
+    access_token = await get_strava_access_token(db, user, client)
+    if not access_token:
+        raise StravaAuthorizationError(f"No valid Strava token for athlete {user_strava_id}.")
+    if budget is not None:
+        await budget.acquire()
+    response = await client.get(f"{STRAVA_API_BASE_URL}/activities/{activity_id}", headers={"Authorization": f"Bearer {access_token}"})
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+async def confirm_strava_deauthorization(
+    db: AsyncSession,
+    user_strava_id: int,
+    client: httpx.AsyncClient,
+    budget: Optional[RateLimitBudget] = None,
+) -> bool:
+    """
+    Checks with Strava that the athlete revoked our access, by refreshing their token: True
+    if Strava refuses it (400/401). A successful refresh means access is still granted;
+    the new tokens are stored and False is returned. Raises httpx errors on any other
+    failure, so the caller can retry later.
+    """
+    user_stmt = select(StravaUserDB).where(StravaUserDB.strava_id == user_strava_id)
+    user = (await db.execute(user_stmt)).scalar_one_or_none()
+    if not user or not user.encrypted_refresh_token:
+        return False # Unknown, or already forgotten
+    if budget is not None:
+        await budget.acquire()
+    payload = {
+        "client_id": settings.STRAVA_CLIENT_ID,
+        "client_secret": settings.STRAVA_CLIENT_SECRET,
+        "grant_type": "refresh_token",
+        "refresh_token": decrypt_token(user.encrypted_refresh_token),
+    }
+    response = await client.post(STRAVA_OAUTH_URL, data=payload)
+    if response.status_code in (400, 401):
+        return True
+    response.raise_for_status()
+    token_data_dict = response.json()
+    user.encrypted_access_token = encrypt_token(token_data_dict["access_token"])
+    user.encrypted_refresh_token = encrypt_token(token_data_dict["refresh_token"])
+    user.token_expires_at = datetime.fromtimestamp(token_data_dict["expires_at"], tz=timezone.utc)
+    await db.commit()
+    return False
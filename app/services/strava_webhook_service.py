@@ -0,0 +1,233 @@
+"""
+Strava webhook ingestion (see routers/webhooks.py). Strava POSTs an event whenever one of
+our athletes creates, updates or deletes an activity, or revokes our access, and expects
+a reply within two seconds. The route only stores the event in strava_webhook_events and
+wakes the workers, so a burst of events costs one INSERT each on the request path.
+
+Workers claim pending events oldest first (one UPDATE ... RETURNING, so two workers
+never take the same one) and apply them. The endpoint can't authenticate Strava beyond
+the subscription id, so an event is only a hint of what to check:
+
+- activity create/update/delete: fetch that one activity with the owner's token and
+  upsert its VirtualResult if it is the owner's, or delete the owner's VirtualResult
+  of it if Strava answers 404;
+- athlete update with authorized=false: forget the athlete's tokens once a token
+  refresh confirms Strava revoked them, which also takes them out of the background sync.
+
+Each applied change re-derives the athlete's leaderboards. A failed event is retried
+with exponential backoff up to STRAVA_WEBHOOK_MAX_ATTEMPTS times, then left `failed`.
+Events a stopped app left `processing` are pending again at the next start.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import Settings
+from app.core.http_client import http_client
+from app.core.rate_limit import RateLimitBudget
+from app.models.strava_user import StravaUserDB
+from app.models.strava_webhook_event import StravaWebhookEvent
+from app.schemas.strava_webhook import StravaWebhookEventIn
+from app.services import virtual_event_service
+from app.services.strava_service import StravaAuthorizationError, confirm_strava_deauthorization, get_strava_activity
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+
+async def enqueue_event(db: AsyncSession, event: StravaWebhookEventIn) -> StravaWebhookEvent:
+    """Stores an incoming event (committed before Strava gets its 200) and wakes the workers."""
+    queued = StravaWebhookEvent(
+        object_type=event.object_type, object_id=event.object_id, aspect_type=event.aspect_type,
+        owner_id=event.owner_id, updates=json.dumps(event.updates) if event.updates else None,
+        event_time=event.event_time, status=PENDING,
+    )
+    db.add(queued)
+    await db.commit()
+    if webhook_workers is not None:
+        webhook_workers.notify()
+    return queued
+
+
+async def apply_webhook_event(
+    db: AsyncSession, event: StravaWebhookEvent, client: httpx.AsyncClient, budget: Optional[RateLimitBudget] = None,
+) -> str:
+    """
+    Applies one event to the athlete's data and commits. Returns what was done, for the logs.
+    Anyone can POST an event, so none is taken at its word: the outcome depends only on
+    what Strava answers for the athlete named as owner.
+    """
+    updates = json.loads(event.updates) if event.updates else {}
+
+    if event.object_type == "athlete":
+        if event.aspect_type == "update" and updates.get("authorized") == "false":
+            if not await confirm_strava_deauthorization(db, event.owner_id, client, budget=budget):
+                return "ignored" # Strava still honours the athlete's token
+            await db.execute(
+                update(StravaUserDB)
+                .where(StravaUserDB.strava_id == event.owner_id)
+                .values(encrypted_access_token="", encrypted_refresh_token="")
+            )
+            await db.commit()
+            return "deauthorized"
+        return "ignored"
+
+    # Create, update (a rename too) or delete: fetch the activity with the owner's token
+    strava_activity_id = str(event.object_id)
+    activity = await get_strava_activity(db, event.owner_id, event.object_id, client, budget=budget)
+    if activity is None: # Strava has no such activity for this athlete (any more)
+        removed = await virtual_event_service.remove_strava_activity(db, event.owner_id, strava_activity_id)
+        return "deleted" if removed else "ignored"
+    if (activity.get("athlete") or {}).get("id") != event.owner_id:
+        return "ignored" # Someone else's activity, visible to this athlete
+    stored = await virtual_event_service.apply_strava_activity(db, event.owner_id, activity)
+    return "stored" if stored else "removed"
+
+
+class WebhookWorkers:
+    def __init__(
+        self,
+        session_factory: Callable,
+        workers: int = 2,
+        max_attempts: int = 5,
+        retry_seconds: float = 30.0,
+        poll_seconds: float = 5.0,
+        client: Optional[httpx.AsyncClient] = None,
+        budget: Optional[RateLimitBudget] = None,
+    ):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.poll_seconds = poll_seconds # Also picks up events whose retry time has come
+        self.client = client # None: the app-wide pooled client
+        self.budget = budget
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.stats: Dict[str, Any] = {"applied": 0, "retried": 0, "failed": 0}
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    async def claim(self) -> Optional[int]:
+        """Marks the oldest due pending event as processing and returns its id."""
+        now = time.time()
+        oldest_due = (
+            select(func.min(StravaWebhookEvent.id))
+            .where(StravaWebhookEvent.status == PENDING)
+            .where((StravaWebhookEvent.retry_at.is_(None)) | (StravaWebhookEvent.retry_at <= now))
+            .scalar_subquery()
+        )
+        async with self.session_factory() as db:
+            event_id = (await db.execute(
+                update(StravaWebhookEvent)
+                .where(StravaWebhookEvent.id == oldest_due, StravaWebhookEvent.status == PENDING)
+                .values(status=PROCESSING, attempts=StravaWebhookEvent.attempts + 1)
+                .returning(StravaWebhookEvent.id)
+            )).scalar_one_or_none()
+            await db.commit()
+        return event_id
+
+    async def process(self, event_id: int) -> None:
+        error: Optional[Exception] = None
+        async with self.session_factory() as db:
+            event = await db.get(StravaWebhookEvent, event_id, populate_existing=True) # Claimed by a Core UPDATE
+            attempts = event.attempts
+            try:
+                outcome = await apply_webhook_event(db, event, self.client or http_client.get(), budget=self.budget)
+            except Exception as exc:
+                error = exc
+
+        values: Dict[str, Any] = {"processed_at": datetime.now(timezone.utc), "last_error": None}
+        if error is None:
+            values["status"] = DONE
+            self.stats["applied"] += 1
+            logger.debug("Strava webhook event %s: %s", event_id, outcome)
+        elif isinstance(error, StravaAuthorizationError) or attempts >= self.max_attempts:
+            values.update(status=FAILED, last_error=str(error)[:500])
+            self.stats["failed"] += 1
+            logger.warning("Strava webhook event %s failed: %s", event_id, error)
+        else:
+            values.update(status=PENDING, last_error=str(error)[:500], retry_at=time.time() + self.retry_seconds * 2 ** (attempts - 1))
+            self.stats["retried"] += 1
+        # A fresh session: the one above may hold a failed transaction, discarded as it closed
+        async with self.session_factory() as db:
+            await db.execute(update(StravaWebhookEvent).where(StravaWebhookEvent.id == event_id).values(**values))
+            await db.commit()
+
+    async def drain(self) -> int:
+        """Applies every event that is due now; returns how many were taken."""
+        taken = 0
+        while (event_id := await self.claim()) is not None:
+            await self.process(event_id)
+            taken += 1
+        return taken
+
+    async def _work(self) -> None:
+        while True:
+            self._wake.clear()
+            event_id = await self.claim()
+            if event_id is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.process(event_id)
+            except Exception: # e.g. the database went away; the event is recovered at the next start
+                logger.exception("Strava webhook worker could not process event %s", event_id)
+
+    async def start(self) -> None:
+        async with self.session_factory() as db:
+            await db.execute(
+                update(StravaWebhookEvent).where(StravaWebhookEvent.status == PROCESSING).values(status=PENDING)
+            )
+            await db.commit()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stops the workers; an event interrupted mid-way is retried at the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def queue_stats(self) -> Dict[str, Any]:
+        async with self.session_factory() as db:
+            counts = dict((await db.execute(
+                select(StravaWebhookEvent.status, func.count(StravaWebhookEvent.id)).group_by(StravaWebhookEvent.status)
+            )).all())
+        return {"queue": counts, "workers": len(self._tasks), **self.stats}
+
+
+webhook_workers: Optional[WebhookWorkers] = None
+
+
+async def start_webhook_workers(settings: Settings, session_factory: Callable, budget: RateLimitBudget) -> WebhookWorkers:
+    """Starts the app-wide webhook workers (called from app startup)."""
+    global webhook_workers
+    webhook_workers = WebhookWorkers(
+        session_factory, workers=settings.STRAVA_WEBHOOK_WORKERS, max_attempts=settings.STRAVA_WEBHOOK_MAX_ATTEMPTS,
+        retry_seconds=settings.STRAVA_WEBHOOK_RETRY_SECONDS, budget=budget,
+    )
+    await webhook_workers.start()
+    return webhook_workers
+
+
+async def stop_webhook_workers() -> None:
+    global webhook_workers
+    if webhook_workers is not None:
+        await webhook_workers.stop()
+        webhook_workers = None
@@ -0,0 +1,110 @@
+"""
+Background Strava sync: every STRAVA_SYNC_SCHEDULER_INTERVAL_SECONDS, a round syncs
+every connected athlete through virtual_event_service.sync_strava_activities_for_user,
+so leaderboards don't wait for athletes to press "Sync".
+
+Athletes go in order of their latest synced activity, newest first (the ones who paddle
+most are likeliest to have something new), after the ones never synced yet. Every page
+request waits for app/core/rate_limit.strava_rate_limit, so a round that would overrun
+Strava's quota slows down and, if need be, finishes in the next window instead of
+failing; what it didn't reach waits for the next round.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy import func, select
+
+from app.config import Settings
+from app.core.rate_limit import RateLimitBudget
+from app.models.strava_user import StravaUserDB
+from app.models.virtual_result import VirtualResult
+from app.services import virtual_event_service
+
+logger = logging.getLogger(__name__)
+
+
+class SyncScheduler:
+    def __init__(
+        self,
+        session_factory: Callable,
+        budget: RateLimitBudget,
+        interval_seconds: float = 900.0,
+        client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.session_factory = session_factory
+        self.budget = budget
+        self.interval_seconds = interval_seconds
+        self.client = client # None: the app-wide pooled client
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, Any] = {"rounds": 0, "athletes_synced": 0, "new_activities": 0, "failures": 0, "last_round_seconds": None}
+
+    async def athletes_by_priority(self) -> List[int]:
+        last_activity = func.max(VirtualResult.activity_date)
+        stmt = (
+            select(StravaUserDB.strava_id)
+            .outerjoin(VirtualResult, VirtualResult.user_strava_id == StravaUserDB.strava_id)
+            .where(StravaUserDB.encrypted_refresh_token != "") # Connected to Strava
+            .group_by(StravaUserDB.strava_id)
+            .order_by(last_activity.is_(None).desc(), last_activity.desc(), StravaUserDB.strava_id)
+        )
+        async with self.session_factory() as db:
+            return list((await db.execute(stmt)).scalars())
+
+    async def run_round(self) -> None:
+        """Syncs every connected athlete once, one at a time."""
+        started = time.perf_counter()
+        for user_strava_id in await self.athletes_by_priority():
+            try:
+                async with self.session_factory() as db:
+                    synced, _ = await virtual_event_service.sync_strava_activities_for_user(
+                        db, user_strava_id, client=self.client, budget=self.budget,
+                    )
+            except Exception:
+                self.stats["failures"] += 1
+                logger.exception("Background Strava sync failed for athlete %s", user_strava_id)
+                continue
+            self.stats["athletes_synced"] += 1
+            self.stats["new_activities"] += synced
+        self.stats["rounds"] += 1
+        self.stats["last_round_seconds"] = round(time.perf_counter() - started, 1)
+
+    async def run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await self.run_round()
+            await asyncio.sleep(max(0.0, self.interval_seconds - (time.monotonic() - started)))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Cancels the running round; each athlete's pages are committed as they arrive."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+sync_scheduler: Optional[SyncScheduler] = None
+
+
+def start_sync_scheduler(settings: Settings, session_factory: Callable, budget: RateLimitBudget) -> SyncScheduler:
+    """Starts the app-wide background sync (called from app startup)."""
+    global sync_scheduler
+    sync_scheduler = SyncScheduler(session_factory, budget, interval_seconds=settings.STRAVA_SYNC_SCHEDULER_INTERVAL_SECONDS)
+    sync_scheduler.start()
+    return sync_scheduler
+
+
+async def stop_sync_scheduler() -> None:
+    global sync_scheduler
+    if sync_scheduler is not None:
+        await sync_scheduler.stop()
+        sync_scheduler = None
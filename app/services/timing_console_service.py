@@ -0,0 +1,180 @@
+"""
+Admin timing console: a WebSocket channel for the finish-line timer (see
+event_admin.timing_console_socket). The timer types dorsals as athletes cross; each
+entry is a JSON message
+
+    {"seq": 17, "dorsal_number": 12, "finish_time": "2024-06-01T10:42:07.310"}
+
+with finish_time optional (the server stamps the time it received the entry). Entries
+are micro-batched: whatever arrived within TIMING_CONSOLE_FLUSH_INTERVAL_SECONDS of the
+first one goes through race_service.record_finishes_bulk (same validation, one commit)
+and is answered with one message:
+
+    {"type": "ack", "acks": [{"seq": 17, "dorsal_number": 12, "outcome": "recorded", ...}],
+     "rows": [<live_result_payload of each recorded row>]}
+
+so the console updates its table from the row deltas instead of reloading the page.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.models.race_result import RaceResult
+from app.models.registration import Registration
+from app.schemas.race_result import FinishOutcome, FinishRecord
+from app.services import race_service
+from app.services.live_results_service import live_result_payload
+
+logger = logging.getLogger(__name__)
+
+INVALID = "invalid" # Malformed entry, never reached race_service
+ERROR = "error" # The batch was rejected (e.g. unknown event) or failed
+
+
+class ConsoleEntry(BaseModel):
+    seq: int # Chosen by the console; echoed in the ack
+    dorsal_number: int = Field(..., ge=1)
+    finish_time: Optional[datetime] = None
+
+
+class _Pending(NamedTuple):
+    seq: int
+    finish: FinishRecord
+
+
+class TimingConsole:
+    """One timer's connection: queues entries, writes them in batches, acks each batch."""
+
+    def __init__(
+        self,
+        event_id: int,
+        session_factory: Callable,
+        send: Callable[[Dict[str, Any]], Awaitable[None]],
+        batch_size: int = 100,
+        flush_interval_seconds: float = 0.01,
+    ):
+        self.event_id = event_id
+        self.session_factory = session_factory
+        self.send = send
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"entries": 0, "invalid": 0, "batches": 0, "failed_batches": 0, "max_batch_ms": 0.0}
+
+    def submit_text(self, text: str) -> None:
+        """Queues one message as received from the socket; malformed ones are acked as invalid."""
+        self.stats["entries"] += 1
+        try:
+            message = json.loads(text)
+        except ValueError:
+            message = None # Not JSON; fails validation below
+        try:
+            entry = ConsoleEntry.model_validate(message)
+        except ValidationError as exc:
+            self.stats["invalid"] += 1
+            seq = message.get("seq") if isinstance(message, dict) else None
+            self._queue.put_nowait({"seq": seq, "outcome": INVALID, "detail": exc.errors()[0]["msg"]})
+            return
+        finish = FinishRecord(dorsal_number=entry.dorsal_number, finish_time=entry.finish_time or datetime.now())
+        self._queue.put_nowait(_Pending(entry.seq, finish))
+
+    async def _next_batch(self) -> List[Any]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval_seconds
+        while len(batch) < self.batch_size and batch[-1] is not None: # None: stop() was called
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def flush(self, items: List[Any]) -> Dict[str, Any]:
+        """Records the batch's finishes and sends (and returns) its ack message."""
+        started = time.perf_counter()
+        self.stats["batches"] += 1
+        pending = [item for item in items if isinstance(item, _Pending)]
+        acks: List[Dict[str, Any]] = []
+        rows = []
+        if pending:
+            try:
+                async with self.session_factory() as db:
+                    response = await race_service.record_finishes_bulk(
+                        db, event_id=self.event_id, finishes=[entry.finish for entry in pending],
+                    )
+                    recorded_ids = []
+                    for entry, result in zip(pending, response.results): # Same order as sent
+                        acks.append({
+                            "seq": entry.seq, "dorsal_number": result.dorsal_number, "outcome": result.outcome.value,
+                            "race_result_id": result.race_result_id, "net_time_seconds": result.net_time_seconds,
+                        })
+                        if result.outcome is FinishOutcome.RECORDED:
+                            recorded_ids.append(result.race_result_id)
+                    if recorded_ids:
+                        # One query for the row deltas; the commit may have expired the relationships
+                        loaded = await db.execute(
+                            select(RaceResult)
+                            .where(RaceResult.id.in_(recorded_ids))
+                            .options(
+                                selectinload(RaceResult.registration).selectinload(Registration.user),
+                                selectinload(RaceResult.registration).selectinload(Registration.category),
+                                selectinload(RaceResult.registration).selectinload(Registration.distance),
+                            )
+                            .execution_options(populate_existing=True)
+                        )
+                        by_id = {race_result.id: race_result for race_result in loaded.scalars()}
+                        rows = [live_result_payload(by_id[race_result_id]) for race_result_id in recorded_ids]
+            except Exception as exc:
+                self.stats["failed_batches"] += 1
+                if isinstance(exc, HTTPException):
+                    detail = exc.detail
+                else:
+                    detail = "Server error"
+                    logger.exception("Timing console batch of %d entries failed for event %s", len(pending), self.event_id)
+                acks = [{"seq": entry.seq, "dorsal_number": entry.finish.dorsal_number, "outcome": ERROR, "detail": detail} for entry in pending]
+                rows = []
+
+        batch_acks = iter(acks)
+        message = {
+            "type": "ack",
+            "acks": [next(batch_acks) if isinstance(item, _Pending) else item for item in items], # Arrival order
+            "rows": rows,
+        }
+        self.stats["max_batch_ms"] = max(self.stats["max_batch_ms"], (time.perf_counter() - started) * 1000)
+        try:
+            await self.send(message)
+        except Exception: # The console went away; its finishes are recorded regardless
+            logger.info("Timing console for event %s disconnected before its ack", self.event_id)
+        return message
+
+    async def run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            stopping = batch[-1] is None
+            items = [item for item in batch if item is not None]
+            if items:
+                await self.flush(items)
+            if stopping:
+                return
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stops once every entry received so far has been written and acked."""
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
@@ -1,21 +1,42 @@
 import httpx # For type hinting client, if passed through
-from typing import List, Dict, Tuple, Optional # Added Optional
+from contextlib import aclosing
+from typing import Callable, List, Dict, NamedTuple, Tuple, Optional # Added Optional
 from datetime import datetime, timezone, timedelta # Added timedelta
-from sqlalchemy import select, func # Added func for func.max
+from sqlalchemy import Row, delete, select, func # Added func for func.max
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession # Use standard import
+from app.core.distances import distance_bucket_for
 from app.models.virtual_result import VirtualResult
 # from app.models.strava_user import StravaUserDB # Not directly used in this file's logic after prompt refinement
-from app.services.strava_service import get_strava_activities, RELEVANT_STRAVA_ACTIVITY_TYPES
+from app.services.strava_service import iter_strava_activity_pages, RELEVANT_STRAVA_ACTIVITY_TYPES
 from app.schemas.virtual_result import VirtualResultCreate # For creating records
+from app.services import leaderboard_service, result_service
+from app.config import Settings
+from app.core.http_client import http_client
+from app.core.rate_limit import RateLimitBudget
+
+settings = Settings()
+
+
+class SyncProgress(NamedTuple):
+    page: int
+    page_activities: int # Activities on this page
+    processed: int # Activities seen so far, all pages
+    synced: int # VirtualResults created so far
+
 
 async def sync_strava_activities_for_user(
     db: AsyncSession,
     user_strava_id: int,
-    # client: httpx.AsyncClient # Prompt indicates client is created within this service now
+    client: Optional[httpx.AsyncClient] = None, # Defaults to the app-wide pooled client
+    progress: Optional[Callable[[SyncProgress], None]] = None,
+    budget: Optional[RateLimitBudget] = None, # Background syncs wait for Strava quota
 ) -> Tuple[int, int]: # (new_activities_synced_count, total_activities_processed_count)
     """
-    Fetches new Strava activities for a user and saves relevant ones as VirtualResults.
+    Fetches every page of new Strava activities for a user and saves relevant ones as
+    VirtualResults, one commit per page. `progress` is called after each page is stored.
     """
     last_vr_stmt = select(func.max(VirtualResult.activity_date)).where(VirtualResult.user_strava_id == user_strava_id)
     last_activity_date_db = (await db.execute(last_vr_stmt)).scalar_one_or_none()
@@ -32,56 +53,54 @@ async def sync_strava_activities_for_user(
         # If no virtual results, fetch activities from e.g., last 30 days
         after_timestamp = int((datetime.now(timezone.utc) - timedelta(days=30)).timestamp())
 
-    # get_strava_activities expects an httpx.AsyncClient to be passed.
-    # The prompt for this service function implies it can create its own, or it can be passed.
-    # The prompt for the router calling this service says "The current implementation of virtual_event_service creates its own client."
-    # This means get_strava_activities needs to be callable without an explicit client from here,
-    # or this service needs to create one and pass it.
-    # The implementation of get_strava_activities in strava_service.py *requires* a client.
-    # So, this function must create it.
-    async with httpx.AsyncClient() as client:
-        strava_activities = await get_strava_activities(
-            db=db, user_strava_id=user_strava_id, client=client, after=after_timestamp, per_page=50 # Fetch up to 50 recent
-        )
+    newly_synced_count = 0
+    processed_count = 0
+    # With `after`, Strava lists activities oldest first: if a page fails, the pages stored
+    # before it leave no gap and the next sync resumes after the newest of them.
+    async with aclosing(iter_strava_activity_pages(
+        db, user_strava_id, client or http_client.get(), per_page=settings.STRAVA_SYNC_PER_PAGE, after=after_timestamp,
+        max_in_flight=settings.STRAVA_SYNC_MAX_PAGES_IN_FLIGHT, budget=budget,
+    )) as pages:
+        async for page, strava_activities in pages:
+            processed_count += len(strava_activities)
+            new_virtual_results = await _store_activities(db, user_strava_id, strava_activities)
+            newly_synced_count += len(new_virtual_results)
+            if progress is not None:
+                progress(SyncProgress(page, len(strava_activities), processed_count, newly_synced_count))
 
-    if not strava_activities:
-        return 0, 0
+    return newly_synced_count, processed_count
 
-    newly_synced_count = 0
-    processed_count = len(strava_activities)
+def virtual_result_row(user_strava_id: int, activity_data: Dict) -> Optional[Dict]:
+    """
+    The virtual_results row for a Strava activity, or None if it doesn't count (type
+    not relevant, unparseable date, no distance or time).
+    """
+    activity_id_str = str(activity_data["id"]) # Strava activity IDs are integers but can be large
 
-    for activity_data in strava_activities:
-        activity_id_str = str(activity_data["id"]) # Strava activity IDs are integers but can be large
-
-        # Check if activity already synced
-        existing_vr_stmt = select(VirtualResult.id).where(VirtualResult.strava_activity_id == activity_id_str)
-        existing_vr = (await db.execute(existing_vr_stmt)).scalar_one_or_none()
-        if existing_vr:
-            continue
-
-        # Filter by type
-        activity_type = activity_data.get("type")
-        if activity_type not in RELEVANT_STRAVA_ACTIVITY_TYPES:
-            continue
-        
-        try:
-            activity_datetime_str = activity_data["start_date"]
-            # Ensure it's timezone-aware, Strava typically provides UTC.
-            # Handle Z (Zulu time) if present, which means UTC.
-            if activity_datetime_str.endswith("Z"):
-                activity_datetime = datetime.fromisoformat(activity_datetime_str.replace("Z", "+00:00"))
+    # Filter by type
+    activity_type = activity_data.get("type")
+    if activity_type not in RELEVANT_STRAVA_ACTIVITY_TYPES:
+        return None
+    
+    try:
+        activity_datetime_str = activity_data["start_date"]
+        # Ensure it's timezone-aware, Strava typically provides UTC.
+        # Handle Z (Zulu time) if present, which means UTC.
+        if activity_datetime_str.endswith("Z"):
+            activity_datetime = datetime.fromisoformat(activity_datetime_str.replace("Z", "+00:00"))
+        else:
+            # If no timezone info, assume UTC as per Strava's general practice or parse as needed
+            # For robustness, one might need to check format more carefully or make timezone explicit
+            temp_dt = datetime.fromisoformat(activity_datetime_str)
+            if temp_dt.tzinfo is None:
+                activity_datetime = temp_dt.replace(tzinfo=timezone.utc)
             else:
-                # If no timezone info, assume UTC as per Strava's general practice or parse as needed
-                # For robustness, one might need to check format more carefully or make timezone explicit
-                temp_dt = datetime.fromisoformat(activity_datetime_str)
-                if temp_dt.tzinfo is None:
-                    activity_datetime = temp_dt.replace(tzinfo=timezone.utc)
-                else:
-                    activity_datetime = temp_dt
-        except (ValueError, TypeError) as e:
-            # print(f"Could not parse activity date: {activity_data.get('start_date', 'N/A')}. Error: {e}")
-            continue # Skip if date is invalid
+                activity_datetime = temp_dt
+    except (KeyError, ValueError, TypeError) as e:
+        # print(f"Could not parse activity date: {activity_data.get('start_date', 'N/A')}. Error: {e}")
+        return None # Skip if date is invalid
 
+    try:
         vr_create_data = VirtualResultCreate(
             user_strava_id=user_strava_id,
             strava_activity_id=activity_id_str,
@@ -91,15 +110,89 @@ async def sync_strava_activities_for_user(
             activity_date=activity_datetime,
             # event_id can be null if not tied to a specific virtual event in our system yet
         )
-        
-        if vr_create_data.distance_km <= 0 or vr_create_data.elapsed_time_seconds <= 0:
-            continue
-
-        db_virtual_result = VirtualResult(**vr_create_data.model_dump())
-        db.add(db_virtual_result)
-        newly_synced_count += 1
+    except ValidationError: # e.g. a manual activity with no distance
+        return None
     
-    if newly_synced_count > 0:
+    if vr_create_data.distance_km <= 0 or vr_create_data.elapsed_time_seconds <= 0:
+        return None
+
+    # Core inserts skip the model's validators, so the derived columns are set here
+    return {
+        **vr_create_data.model_dump(),
+        "distance_bucket": distance_bucket_for(vr_create_data.distance_km),
+        "activity_year": vr_create_data.activity_date.year,
+    }
+
+async def _store_activities(db: AsyncSession, user_strava_id: int, strava_activities: List[Dict]) -> List[Row]:
+    """
+    Saves the relevant, not yet synced activities of one page as VirtualResults and commits
+    them, in a constant number of statements: one INSERT ... ON CONFLICT DO NOTHING skips
+    activities already stored (by strava_activity_id) and returns the rows it inserted,
+    then only those rows are merged into the leaderboards (a new activity can only make
+    a best effort faster, so the athlete's history is not re-derived).
+    """
+    rows: Dict[str, Dict] = {} # By activity id; a repeat within the page is dropped too
+    for activity_data in strava_activities:
+        row = virtual_result_row(user_strava_id, activity_data)
+        if row is not None:
+            rows.setdefault(row["strava_activity_id"], row)
+
+    if not rows:
+        return []
+    insert_stmt = (
+        sqlite_insert(VirtualResult)
+        .values(list(rows.values()))
+        .on_conflict_do_nothing(index_elements=[VirtualResult.strava_activity_id])
+        .returning(VirtualResult.id, VirtualResult.activity_year)
+    )
+    inserted = (await db.execute(insert_stmt)).all()
+    if inserted:
+        await leaderboard_service.record_virtual_results(db, [row.id for row in inserted])
         await db.commit()
-        
-    return newly_synced_count, processed_count
+        result_service.invalidate_leaderboards(years={row.activity_year for row in inserted})
+    return inserted
+
+async def apply_strava_activity(db: AsyncSession, user_strava_id: int, activity_data: Dict) -> bool:
+    """
+    Brings one of the athlete's activities in line with Strava (webhook create/update):
+    inserts or updates its VirtualResult, or removes it if the activity no longer counts
+    (e.g. its type was changed). The caller checks the activity is the athlete's; a
+    VirtualResult of the same activity id stored for another athlete is left alone.
+    Refreshes the athlete's leaderboards (names included) and commits. Returns whether
+    the athlete now has a VirtualResult for it.
+    """
+    row = virtual_result_row(user_strava_id, activity_data)
+    if row is None:
+        await remove_strava_activity(db, user_strava_id, str(activity_data["id"]))
+        return False
+    owned = (VirtualResult.strava_activity_id == row["strava_activity_id"], VirtualResult.user_strava_id == user_strava_id)
+    previous_year = (await db.execute(select(VirtualResult.activity_year).where(*owned))).scalar_one_or_none()
+    upsert = sqlite_insert(VirtualResult).values(row)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[VirtualResult.strava_activity_id],
+        set_={
+            column: upsert.excluded[column]
+            for column in ("name", "distance_km", "elapsed_time_seconds", "activity_date", "distance_bucket", "activity_year")
+        },
+        where=VirtualResult.user_strava_id == upsert.excluded.user_strava_id,
+    ).returning(VirtualResult.id)
+    if (await db.execute(upsert)).first() is None:
+        return False
+    await leaderboard_service.refresh_athlete_leaderboards(db, [user_strava_id])
+    await db.commit()
+    result_service.invalidate_leaderboards(years={row["activity_year"], previous_year} - {None})
+    return True
+
+async def remove_strava_activity(db: AsyncSession, user_strava_id: int, strava_activity_id: str) -> bool:
+    """Deletes the athlete's VirtualResult of an activity, if any, and what it contributed to the leaderboards. Commits."""
+    removed = (await db.execute(
+        delete(VirtualResult)
+        .where(VirtualResult.strava_activity_id == strava_activity_id, VirtualResult.user_strava_id == user_strava_id)
+        .returning(VirtualResult.activity_year)
+    )).all()
+    if not removed:
+        return False
+    await leaderboard_service.refresh_athlete_leaderboards(db, [user_strava_id])
+    await db.commit()
+    result_service.invalidate_leaderboards(years={row.activity_year for row in removed})
+    return True
@@ -0,0 +1,96 @@
+"""
+Benchmark: per-row Python leaderboard computation vs the NumPy engine kernels
+(app/services/leaderboard_engine.py) on synthetic results. No database involved;
+both sides get the same in-memory columns and must produce the same boards.
+
+    pip install numpy
+    python -m benchmarks.bench_leaderboard_engine [--rows 1000000] [--users 20000] [--top-n 10]
+"""
+import argparse
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import app.db.base # noqa: F401  Registers the models before app.services imports them
+from app.core.distances import STANDARD_DISTANCES_KM, distance_bucket_for
+from app.services.leaderboard_engine import bucket_indices, best_effort_indices, top_n_per_bucket
+
+
+def synthetic_results(rows: int, users: int, seed: int):
+    rng = np.random.default_rng(seed)
+    user_ids = rng.integers(1, users + 1, size=rows)
+    # Half the activities land near a standard distance, the rest anywhere between 0.5 and 20 km
+    near_standard = rng.choice(STANDARD_DISTANCES_KM, size=rows) + rng.uniform(-0.15, 0.15, size=rows)
+    anywhere = rng.uniform(0.5, 20.0, size=rows)
+    distances_km = np.round(np.where(rng.random(rows) < 0.5, near_standard, anywhere), 3)
+    seconds = np.round(distances_km * rng.uniform(240, 480, size=rows)).astype(np.int64) + 1
+    return user_ids, distances_km, seconds
+
+
+def python_leaderboard(user_ids, distances_km, seconds, top_n: int):
+    """The per-row dict approach: bucket, pace and best effort per (bucket, user), then sort."""
+    best = {}
+    for user_id, distance_km, time_seconds in zip(user_ids, distances_km, seconds):
+        bucket_km = distance_bucket_for(distance_km)
+        if bucket_km is None:
+            continue
+        pace = time_seconds / distance_km
+        key = (bucket_km, user_id)
+        current = best.get(key)
+        if current is None or (pace, time_seconds) < current[:2]:
+            best[key] = (pace, time_seconds, user_id)
+    per_bucket = defaultdict(list)
+    for (bucket_km, _), effort in best.items():
+        per_bucket[bucket_km].append(effort)
+    return {
+        bucket_km: [(user_id, time_seconds) for _, time_seconds, user_id in sorted(efforts)[:top_n]]
+        for bucket_km, efforts in sorted(per_bucket.items())
+    }
+
+
+def numpy_leaderboard(user_ids, distances_km, seconds, top_n: int):
+    bucket_idx = bucket_indices(distances_km)
+    qualifying = bucket_idx >= 0
+    bucket_idx, users, times = bucket_idx[qualifying], user_ids[qualifying], seconds[qualifying]
+    pace = times / distances_km[qualifying]
+
+    best = best_effort_indices([bucket_idx, users], pace, times)
+    top, _ = top_n_per_bucket(bucket_idx[best], pace[best], times[best], users[best], top_n)
+    return best[top], bucket_idx, users, times
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    user_ids, distances_km, seconds = synthetic_results(args.rows, args.users, args.seed)
+    # The Python path gets plain Python scalars, as it would from database rows
+    py_columns = (user_ids.tolist(), distances_km.tolist(), seconds.tolist())
+
+    started = time.perf_counter()
+    expected = python_leaderboard(*py_columns, top_n=args.top_n)
+    python_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    selected, bucket_idx, users, times = numpy_leaderboard(user_ids, distances_km, seconds, args.top_n)
+    numpy_seconds = time.perf_counter() - started
+
+    standard = np.sort(np.asarray(STANDARD_DISTANCES_KM))
+    got = defaultdict(list)
+    for i in selected:
+        got[float(standard[bucket_idx[i]])].append((int(users[i]), int(times[i])))
+    assert dict(got) == expected, "NumPy engine and per-row Python disagree"
+
+    print(f"{args.rows:,} results, {args.users:,} athletes, top {args.top_n} per distance")
+    print(f"  per-row Python: {python_seconds:8.3f} s")
+    print(f"  NumPy engine:   {numpy_seconds:8.3f} s")
+    print(f"  speedup:        {python_seconds / numpy_seconds:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Benchmark: race-day timing load. Seeds a throwaway SQLite database with an event and
+thousands of athletes registered through registration_service.create_registration,
+numbers them with race_service.allocate_dorsals and fires the start gun. Then it replays
+a realistic finish distribution against race_service.record_athlete_finish (one session
+per finish, as one request each) while public clients poll the results page query.
+
+Finishes are open-loop: each is sent at its (sped-up) crossing time whether or not the
+previous ones have completed, so latency includes any queueing behind slow writes.
+
+    python -m benchmarks.bench_race_day [--athletes 2000] [--speedup 30] [--pollers 20] [--no-journal]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base # Registers the models before app.services imports them
+from app.models.event import Event, EventType
+from app.models.event_category import EventCategory
+from app.models.event_distance import EventDistance
+from app.models.strava_user import StravaUserDB
+from app.schemas.race_result import DorsalAllocationRequest
+from app.schemas.registration import RegistrationCreate
+from app.services import race_service, registration_service, result_service
+from app.services.timing_journal_service import timing_journal
+
+CATEGORIES = ("Open", "Junior", "Master")
+
+
+def percentiles(samples: List[float]) -> str:
+    if len(samples) < 2:
+        return "n/a"
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return f"p50 {cuts[49] * 1000:8.1f} ms   p95 {cuts[94] * 1000:8.1f} ms   p99 {cuts[98] * 1000:8.1f} ms   max {max(samples) * 1000:8.1f} ms"
+
+
+def finish_offsets(athletes: int, mean_minutes: float, sd_minutes: float, seed: int) -> List[float]:
+    """Net times in seconds: a bell around the mean, so finishers bunch up mid-race like a real field."""
+    rng = random.Random(seed)
+    fastest = mean_minutes * 0.6 * 60
+    return sorted(max(fastest, rng.gauss(mean_minutes * 60, sd_minutes * 60)) for _ in range(athletes))
+
+
+async def seed_event(session_factory, athletes: int) -> tuple:
+    """The event, its categories and distance, and one registration per athlete via the registration service."""
+    async with session_factory() as db:
+        event = Event(name="Race Day Benchmark", type=EventType.ON_SITE, date=datetime(2024, 6, 1), strava_sync_enabled=False)
+        db.add(event)
+        await db.flush()
+        categories = [EventCategory(name=name, event_id=event.id) for name in CATEGORIES]
+        distance = EventDistance(distance_km=10.0, event_id=event.id)
+        db.add_all([*categories, distance])
+        db.add_all([
+            StravaUserDB(
+                strava_id=100_000 + athlete, username=f"athlete{athlete}", firstname="Athlete", lastname=str(athlete),
+                encrypted_access_token="benchmark", encrypted_refresh_token="benchmark",
+                token_expires_at=datetime.now(timezone.utc) + timedelta(days=1),
+            )
+            for athlete in range(athletes)
+        ])
+        await db.commit()
+        event_id, distance_id, category_ids = event.id, distance.id, [category.id for category in categories]
+
+        for athlete in range(athletes):
+            await registration_service.create_registration(db, 100_000 + athlete, RegistrationCreate(
+                user_strava_id=100_000 + athlete, event_id=event_id,
+                event_category_id=category_ids[athlete % len(category_ids)], event_distance_id=distance_id,
+            ))
+    return event_id, distance_id
+
+
+async def poll_results(session_factory, event_id: int, interval: float, stop: asyncio.Event, latencies: List[float], seed: int) -> None:
+    """One spectator refreshing the public results page."""
+    rng = random.Random(seed)
+    await asyncio.sleep(rng.uniform(0, interval)) # Spread the pollers out
+    while not stop.is_set():
+        started = time.perf_counter()
+        async with session_factory() as db:
+            await result_service.get_event_results_classified(db, event_id)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(rng.uniform(0.5 * interval, 1.5 * interval))
+
+
+async def run(args: argparse.Namespace) -> None:
+    workdir = tempfile.mkdtemp(prefix="race_day_")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(workdir, 'race_day.db')}")
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    timing_journal.path = None if args.no_journal else os.path.join(workdir, "timing_journal.jsonl")
+
+    started = time.perf_counter()
+    event_id, distance_id = await seed_event(session_factory, args.athletes)
+    seeded_seconds = time.perf_counter() - started
+
+    async with session_factory() as db:
+        started = time.perf_counter()
+        allocation = await race_service.allocate_dorsals(db, event_id, DorsalAllocationRequest(include_pending=True))
+        allocation_seconds = time.perf_counter() - started
+        gun = datetime.now() - timedelta(hours=2)
+        started = time.perf_counter()
+        await race_service.start_event_distance_timer(db, event_id=event_id, distance_id=distance_id, start_time=gun)
+        start_seconds = time.perf_counter() - started
+    dorsals = [assignment.dorsal_number for assignment in allocation.assigned]
+    random.Random(args.seed).shuffle(dorsals) # Finishing order has nothing to do with dorsal order
+
+    net_times = finish_offsets(len(dorsals), args.mean_minutes, args.sd_minutes, args.seed)
+    first_finish = net_times[0]
+    # Wall-clock send time of each finish, relative to the first finisher
+    send_at = [(net - first_finish) / args.speedup if args.speedup > 0 else 0.0 for net in net_times]
+
+    finish_latencies: List[float] = []
+    poll_latencies: List[float] = []
+    errors: List[str] = []
+    completed_at: List[float] = []
+
+    async def finish(dorsal_number: int, net_seconds: float, due: float) -> None:
+        try:
+            async with session_factory() as db:
+                await race_service.record_athlete_finish(
+                    db, event_id=event_id, dorsal_number=dorsal_number, finish_time=gun + timedelta(seconds=net_seconds),
+                )
+        except Exception as exc: # Reported, not fatal: a locked database under load is a result too
+            errors.append(type(exc).__name__)
+            return
+        now = time.perf_counter()
+        finish_latencies.append(now - due)
+        completed_at.append(now)
+
+    stop_polling = asyncio.Event()
+    pollers = [
+        asyncio.create_task(poll_results(session_factory, event_id, args.poll_interval, stop_polling, poll_latencies, args.seed + client))
+        for client in range(args.pollers)
+    ]
+
+    origin = time.perf_counter()
+    tasks: List[asyncio.Task] = []
+    for dorsal_number, net_seconds, offset in zip(dorsals, net_times, send_at):
+        delay = origin + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(finish(dorsal_number, net_seconds, origin + offset)))
+    await asyncio.gather(*tasks)
+    finished = time.perf_counter()
+    stop_polling.set()
+    await asyncio.gather(*pollers)
+    timing_journal.close()
+    await engine.dispose()
+
+    # Busiest simulated race minute, and the finish rate it asks of the timing path once sped up
+    peak_minute = Counter(int(net // 60) for net in net_times).most_common(1)[0][1]
+    wall_seconds = finished - origin
+
+    print(f"athletes:    {args.athletes} (seeded in {seeded_seconds:.1f} s, dorsals in {allocation_seconds:.2f} s, start gun in {start_seconds:.2f} s)")
+    print(f"journal:     {'off' if args.no_journal else 'fsync per input'}   pollers: {args.pollers} every ~{args.poll_interval:g} s")
+    print(f"race:        finishes spread over {(net_times[-1] - first_finish) / 60:.1f} race minutes, peak {peak_minute} finishers/minute, replayed at {args.speedup:g}x")
+    print(f"finishes:    {len(finish_latencies)} recorded, {len(errors)} failed{' (' + ', '.join(sorted(set(errors))) + ')' if errors else ''}")
+    print(f"  latency    {percentiles(finish_latencies)}")
+    if completed_at:
+        print(f"  throughput {len(completed_at) / wall_seconds:8.1f} finishes/s sustained over {wall_seconds:.1f} s "
+              f"(offered peak {peak_minute * max(args.speedup, 1) / 60:.1f}/s)")
+    print(f"polls:       {len(poll_latencies)}")
+    print(f"  latency    {percentiles(poll_latencies)}")
+    print(f"database:    {workdir}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--athletes", type=int, default=2000)
+    parser.add_argument("--mean-minutes", type=float, default=60.0, help="Mean net time")
+    parser.add_argument("--sd-minutes", type=float, default=8.0, help="Spread of net times")
+    parser.add_argument("--speedup", type=float, default=30.0, help="Race minutes replayed per wall-clock minute; 0 sends every finish at once")
+    parser.add_argument("--pollers", type=int, default=20, help="Public clients polling the results page")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between a client's polls")
+    parser.add_argument("--no-journal", action="store_true", help="Skip the fsync'd timing journal")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
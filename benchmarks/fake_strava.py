@@ -0,0 +1,126 @@
+"""
+A local stand-in for Strava's API: token refresh, the paginated activity list and single activities, with
+Strava's fixed-window rate limits (X-RateLimit-Limit / X-RateLimit-Usage headers, 429
+once a window is spent). Each access token gets its own deterministic set of paddles,
+so any athlete in the database has something to sync; a token ending in "-<number>"
+(e.g. token-9001, or fake-refresh-9001 after a refresh) belongs to athlete <number>.
+
+    python -m benchmarks.fake_strava [--port 8765] [--short-limit 200] [--daily-limit 2000] [--activities 300]
+    STRAVA_BASE_URL=http://127.0.0.1:8765 STRAVA_SYNC_SCHEDULER_ENABLED=true uvicorn app.main:app
+"""
+import argparse
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Form, Header, Request
+from fastapi.responses import JSONResponse
+
+SHORT_WINDOW_SECONDS = 15 * 60
+
+
+def create_fake_strava(short_limit: int = 200, daily_limit: int = 2000, activities_per_athlete: int = 300) -> FastAPI:
+    app = FastAPI(title="Fake Strava")
+    app.state.usage = {"short_window": None, "day": None, "short": 0, "daily": 0}
+    app.state.requests = [] # Path, token and page of every activity request, for tests
+    app.state.edits = {} # Activity id -> fields changed since it was generated
+    app.state.deleted = set() # Activity ids deleted since
+    app.state.revoked = set() # Refresh tokens of athletes who revoked access (refused with a 400)
+
+    def limit_headers() -> Dict[str, str]:
+        usage = app.state.usage
+        return {"X-RateLimit-Limit": f"{short_limit},{daily_limit}", "X-RateLimit-Usage": f"{usage['short']},{usage['daily']}"}
+
+    def count_request() -> bool:
+        """Counts a request in the current windows; False once either is spent."""
+        now = time.time()
+        usage = app.state.usage
+        short_window, day = now - now % SHORT_WINDOW_SECONDS, int(now // 86400)
+        if usage["short_window"] != short_window:
+            usage["short_window"], usage["short"] = short_window, 0
+        if usage["day"] != day:
+            usage["day"], usage["daily"] = day, 0
+        if usage["short"] >= short_limit or usage["daily"] >= daily_limit:
+            return False
+        usage["short"] += 1
+        usage["daily"] += 1
+        return True
+
+    def athlete_activities(token: str) -> List[Dict[str, Any]]:
+        seed = zlib.crc32(token.encode())
+        suffix = token.rsplit("-", 1)[-1]
+        athlete_id = int(suffix) if suffix.isdigit() else seed
+        first = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=25)
+        return [
+            {
+                "id": seed * 10_000 + n, "athlete": {"id": athlete_id}, "name": f"Paddle {n}", "type": "StandUpPaddling",
+                "distance": (1000.0, 3000.0, 5000.0, 10000.0)[(seed + n) % 4],
+                "elapsed_time": 420 + (seed + 37 * n) % 3600,
+                "start_date": (first + timedelta(hours=2 * n)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+            for n in range(activities_per_athlete)
+        ]
+
+    @app.post("/oauth/token")
+    async def token(refresh_token: str = Form(...)):
+        if not count_request():
+            return JSONResponse({"message": "Rate Limit Exceeded"}, status_code=429, headers=limit_headers())
+        if refresh_token in app.state.revoked:
+            return JSONResponse({"message": "Bad Request", "errors": [{"field": "refresh_token", "code": "invalid"}]}, status_code=400, headers=limit_headers())
+        expires_at = int(time.time()) + 6 * 3600
+        return JSONResponse(
+            {"access_token": f"fake-{refresh_token}", "refresh_token": refresh_token, "expires_at": expires_at, "expires_in": 6 * 3600},
+            headers=limit_headers(),
+        )
+
+    @app.get("/api/v3/athlete/activities")
+    async def activities(
+        request: Request, page: int = 1, per_page: int = 30,
+        after: Optional[int] = None, before: Optional[int] = None,
+        authorization: str = Header(""),
+    ):
+        token = authorization.removeprefix("Bearer ")
+        app.state.requests.append({"path": request.url.path, "token": token, "page": page})
+        if not count_request():
+            return JSONResponse({"message": "Rate Limit Exceeded"}, status_code=429, headers=limit_headers())
+        listed = [
+            {**a, **app.state.edits.get(a["id"], {})} for a in athlete_activities(token) if a["id"] not in app.state.deleted
+        ]
+        if after is not None: # Oldest first, like Strava with `after`
+            listed = [a for a in listed if datetime.fromisoformat(a["start_date"].replace("Z", "+00:00")).timestamp() > after]
+        else:
+            listed.reverse()
+        if before is not None:
+            listed = [a for a in listed if datetime.fromisoformat(a["start_date"].replace("Z", "+00:00")).timestamp() < before]
+        return JSONResponse(listed[(page - 1) * per_page:page * per_page], headers=limit_headers())
+
+    @app.get("/api/v3/activities/{activity_id}")
+    async def activity(activity_id: int, authorization: str = Header("")):
+        token = authorization.removeprefix("Bearer ")
+        app.state.requests.append({"path": f"/api/v3/activities/{activity_id}", "token": token, "page": None})
+        if not count_request():
+            return JSONResponse({"message": "Rate Limit Exceeded"}, status_code=429, headers=limit_headers())
+        found = [a for a in athlete_activities(token) if a["id"] == activity_id and a["id"] not in app.state.deleted]
+        if not found:
+            return JSONResponse({"message": "Record Not Found"}, status_code=404, headers=limit_headers())
+        return JSONResponse({**found[0], **app.state.edits.get(activity_id, {})}, headers=limit_headers())
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--short-limit", type=int, default=200, help="Requests per 15 minutes")
+    parser.add_argument("--daily-limit", type=int, default=2000)
+    parser.add_argument("--activities", type=int, default=300, help="Activities per athlete")
+    args = parser.parse_args(argv)
+    uvicorn.run(create_fake_strava(args.short_limit, args.daily_limit, args.activities), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
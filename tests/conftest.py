@@ -138,3 +138,25 @@ def monkeypatch_session():
     m = MonkeyPatch()
     yield m
     m.undo()
+
+
+# Keep the timing journal (appended to on every start/finish) out of the working directory
+@pytest.fixture(autouse=True)
+def isolated_timing_journal(tmp_path, monkeypatch):
+    from app.services.timing_journal_service import timing_journal
+    timing_journal.close()
+    monkeypatch.setattr(timing_journal, "path", str(tmp_path / "timing_journal.jsonl"))
+    yield timing_journal
+    timing_journal.close()
+
+
+# The dorsal index and standings boards are per process; ids are reused once a test's transaction rolls back
+@pytest.fixture(autouse=True)
+def clear_dorsal_index():
+    from app.services.race_service import dorsal_index
+    from app.services.standings_service import standings
+    dorsal_index.invalidate()
+    standings.invalidate()
+    yield
+    dorsal_index.invalidate()
+    standings.invalidate()
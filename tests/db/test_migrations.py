@@ -0,0 +1,135 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.db.migrations import run_migrations
+from app.models.virtual_result import VirtualResult
+from app.models.event_distance import EventDistance
+
+def _legacy_engine():
+    # Tables as they were created before distance buckets existed
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE virtual_results (id INTEGER PRIMARY KEY, user_strava_id INTEGER NOT NULL, event_id INTEGER, "
+            "strava_activity_id VARCHAR NOT NULL, name VARCHAR, distance_km FLOAT NOT NULL, "
+            "elapsed_time_seconds INTEGER NOT NULL, activity_date DATETIME NOT NULL)"
+        )
+        conn.exec_driver_sql(
+            "CREATE TABLE event_distances (id INTEGER PRIMARY KEY, distance_km FLOAT NOT NULL, event_id INTEGER NOT NULL)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO virtual_results (user_strava_id, strava_activity_id, distance_km, elapsed_time_seconds, activity_date) "
+            "VALUES (1, 'legacy-1', 5.04, 1500, '2024-03-01 10:00:00.000000'), (1, 'legacy-2', 8.0, 2400, '2023-03-01 10:00:00.000000')"
+        )
+        conn.exec_driver_sql("INSERT INTO event_distances (distance_km, event_id) VALUES (10.0, 1), (4.2, 1)")
+    return engine
+
+def test_distance_bucket_migration_backfills_and_is_idempotent():
+    engine = _legacy_engine()
+    with engine.begin() as conn:
+        run_migrations(conn)
+    with engine.begin() as conn:
+        run_migrations(conn) # Second run is a no-op
+
+    with engine.connect() as conn:
+        virtual_rows = conn.execute(
+            text("SELECT strava_activity_id, distance_bucket, activity_year FROM virtual_results ORDER BY id")
+        ).all()
+        distance_rows = conn.execute(text("SELECT distance_bucket FROM event_distances ORDER BY id")).all()
+        index_names = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+
+    assert virtual_rows == [("legacy-1", 5.0, 2024), ("legacy-2", None, 2023)]
+    assert distance_rows == [(10.0,), (None,)]
+    assert "ix_virtual_results_bucket_year_pace" in index_names
+
+def test_bucket_columns_derived_on_models():
+    distance = EventDistance(distance_km=2.95, event_id=1)
+    assert distance.distance_bucket == 3.0
+
+    activity = VirtualResult(distance_km=12.3, activity_date=None)
+    assert activity.distance_bucket is None
+    assert activity.activity_year is None
+
+def test_leaderboard_rank_index_migration_replaces_old_index():
+    engine = _legacy_engine()
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE personal_bests (id INTEGER PRIMARY KEY, user_strava_id INTEGER NOT NULL, bucket_km FLOAT NOT NULL, "
+            "best_pace_seconds_per_km FLOAT NOT NULL, time_seconds INTEGER NOT NULL, distance_km FLOAT NOT NULL, "
+            "source VARCHAR NOT NULL, source_id INTEGER NOT NULL, event_name VARCHAR, activity_date DATETIME)"
+        )
+        conn.exec_driver_sql(
+            "CREATE INDEX ix_personal_bests_bucket_pace ON personal_bests (bucket_km, best_pace_seconds_per_km, time_seconds)"
+        )
+        run_migrations(conn)
+
+    with engine.connect() as conn:
+        index_names = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+
+    assert "ix_personal_bests_bucket_pace" not in index_names
+    assert "ix_personal_bests_bucket_rank" in index_names
+
+def test_race_result_event_id_migration_backfills_and_adds_unique_dorsal_index():
+    engine = _legacy_engine()
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE registrations (id INTEGER PRIMARY KEY, event_id INTEGER NOT NULL)")
+        conn.exec_driver_sql(
+            "CREATE TABLE race_results (id INTEGER PRIMARY KEY, registration_id INTEGER NOT NULL, dorsal_number INTEGER, "
+            "start_time DATETIME, finish_time DATETIME, net_time_seconds INTEGER)"
+        )
+        conn.exec_driver_sql("INSERT INTO registrations (id, event_id) VALUES (1, 7), (2, 8)")
+        conn.exec_driver_sql("INSERT INTO race_results (registration_id, dorsal_number) VALUES (1, 5), (2, 5)")
+        run_migrations(conn)
+    with engine.begin() as conn:
+        run_migrations(conn)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT registration_id, event_id, chip_id FROM race_results ORDER BY id")).all()
+        index_names = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    assert rows == [(1, 7, None), (2, 8, None)] # Same dorsal in two events is fine
+    assert {"uq_race_results_event_dorsal", "ix_race_results_chip_id"} <= index_names
+
+def test_race_result_event_id_migration_reports_duplicate_dorsals():
+    engine = _legacy_engine()
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE registrations (id INTEGER PRIMARY KEY, event_id INTEGER NOT NULL)")
+        conn.exec_driver_sql(
+            "CREATE TABLE race_results (id INTEGER PRIMARY KEY, registration_id INTEGER NOT NULL, dorsal_number INTEGER, "
+            "start_time DATETIME, finish_time DATETIME, net_time_seconds INTEGER)"
+        )
+        conn.exec_driver_sql("INSERT INTO registrations (id, event_id) VALUES (1, 7), (2, 7), (3, 7)")
+        conn.exec_driver_sql("INSERT INTO race_results (registration_id, dorsal_number) VALUES (1, 5), (2, 5), (3, NULL)")
+
+    with pytest.raises(RuntimeError, match=r"event 7 dorsal 5 \(race_results 1,2\)"):
+        with engine.begin() as conn:
+            run_migrations(conn)
+
+def test_race_result_positions_migration_backfills_standings():
+    engine = _legacy_engine()
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE strava_users (strava_id INTEGER PRIMARY KEY, sex VARCHAR)")
+        conn.exec_driver_sql(
+            "CREATE TABLE registrations (id INTEGER PRIMARY KEY, user_strava_id INTEGER NOT NULL, event_id INTEGER NOT NULL, "
+            "event_category_id INTEGER NOT NULL, event_distance_id INTEGER NOT NULL)"
+        )
+        conn.exec_driver_sql(
+            "CREATE TABLE race_results (id INTEGER PRIMARY KEY, registration_id INTEGER NOT NULL, dorsal_number INTEGER, "
+            "start_time DATETIME, finish_time DATETIME, net_time_seconds INTEGER)"
+        )
+        conn.exec_driver_sql("INSERT INTO strava_users (strava_id, sex) VALUES (1, 'F'), (2, 'M'), (3, NULL), (4, 'F')")
+        # Athletes 1-3 on distance 10 (athlete 2 in another category), athlete 4 alone on distance 11
+        conn.exec_driver_sql(
+            "INSERT INTO registrations (id, user_strava_id, event_id, event_category_id, event_distance_id) "
+            "VALUES (1, 1, 7, 1, 10), (2, 2, 7, 2, 10), (3, 3, 7, 1, 10), (4, 4, 7, 1, 11)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO race_results (registration_id, net_time_seconds) VALUES (1, 1500), (2, 1440), (3, 1600), (4, 2000)"
+        )
+        run_migrations(conn)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT registration_id, overall_position, category_position, sex_position, gap_to_leader_seconds "
+            "FROM race_results ORDER BY registration_id"
+        )).all()
+    assert rows == [(1, 2, 1, 1, 60), (2, 1, 1, 1, 0), (3, 3, 2, None, 160), (4, 1, 1, 1, 0)]
@@ -0,0 +1,149 @@
+import pytest
+import asyncio
+from fastapi import HTTPException
+from contextlib import asynccontextmanager
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from datetime import datetime, timezone, timedelta
+
+from app.services.chip_timing_service import (
+    ChipRead, parse_chip_read, RepeatReadFilter, ChipTimingIngestor, ChipReaderServer, simulate_reader,
+)
+from app.services.race_service import assign_chip_ids
+from app.schemas.race_result import ChipAssignment
+from app.models.strava_user import StravaUserDB
+from app.models.event import Event, EventType
+from app.models.event_category import EventCategory
+from app.models.event_distance import EventDistance
+from app.models.registration import Registration
+from app.models.race_result import RaceResult
+
+RACE_START = datetime(2024, 7, 6, 9, 0, 0)
+
+@pytest.fixture
+async def chipped_race(db_session: AsyncSession):
+    """An on-site event with two started paddlers wearing chips CHIP-1 and CHIP-2 (dorsals 1-2)."""
+    event = Event(name="Chip Classic", type=EventType.ON_SITE, date=datetime(2024, 7, 6), strava_sync_enabled=False)
+    db_session.add(event)
+    await db_session.flush()
+    category = EventCategory(name="Open", event_id=event.id)
+    distance = EventDistance(distance_km=10.0, event_id=event.id)
+    db_session.add_all([category, distance])
+    await db_session.flush()
+
+    for dorsal in (1, 2):
+        user = StravaUserDB(
+            strava_id=800 + dorsal, username=f"chipper{dorsal}", firstname="Chip", lastname=str(dorsal),
+            encrypted_access_token="dummy_token", encrypted_refresh_token="dummy_refresh",
+            token_expires_at=datetime.now(timezone.utc) + timedelta(days=1)
+        )
+        db_session.add(user)
+        registration = Registration(
+            user_strava_id=user.strava_id, event_id=event.id,
+            event_category_id=category.id, event_distance_id=distance.id
+        )
+        db_session.add(registration)
+        await db_session.flush()
+        db_session.add(RaceResult(registration_id=registration.id, event_id=event.id, dorsal_number=dorsal, start_time=RACE_START))
+    await db_session.commit()
+    await assign_chip_ids(db_session, event.id, [
+        ChipAssignment(dorsal_number=1, chip_id="CHIP-1"), ChipAssignment(dorsal_number=2, chip_id="CHIP-2"),
+    ])
+    return event
+
+def session_factory_for(db_session: AsyncSession):
+    @asynccontextmanager
+    async def session_factory():
+        yield db_session
+    return session_factory
+
+async def net_times(db_session: AsyncSession):
+    rows = await db_session.execute(select(RaceResult.dorsal_number, RaceResult.net_time_seconds).order_by(RaceResult.dorsal_number))
+    return dict(rows.all())
+
+def test_parse_chip_read():
+    assert parse_chip_read("CHIP-1,2024-07-06T09:50:00,mat-2\n") == ChipRead("CHIP-1", datetime(2024, 7, 6, 9, 50), "mat-2")
+    assert parse_chip_read(f"CHIP-1,{datetime(2024, 7, 6, 9, 50).timestamp()}").timestamp == datetime(2024, 7, 6, 9, 50)
+    for line in ("CHIP-1", "CHIP-1,yesterday", ",2024-07-06T09:50:00", "a,b,c,d", "CHIP-1,1e400", "CHIP-1,99999999999999999"):
+        with pytest.raises(ValueError):
+            parse_chip_read(line)
+
+def test_repeat_read_filter_window():
+    repeat_filter = RepeatReadFilter(window_seconds=5)
+    crossing = datetime(2024, 7, 6, 9, 50)
+
+    assert repeat_filter.accept(ChipRead("CHIP-1", crossing, "mat-1"))
+    assert not repeat_filter.accept(ChipRead("CHIP-1", crossing + timedelta(seconds=0.2), "mat-1"))
+    assert not repeat_filter.accept(ChipRead("CHIP-1", crossing - timedelta(seconds=0.1), "mat-2")) # Other mat, same crossing
+    assert repeat_filter.accept(ChipRead("CHIP-2", crossing, "mat-1"))
+    assert repeat_filter.accept(ChipRead("CHIP-1", crossing + timedelta(seconds=6), "mat-1"))
+
+@pytest.mark.asyncio
+async def test_ingestor_batches_crossings(db_session: AsyncSession, chipped_race: Event):
+    ingestor = ChipTimingIngestor(
+        chipped_race.id, session_factory_for(db_session), batch_size=50, flush_interval_seconds=0.05, dedup_window_seconds=5
+    )
+    ingestor.start()
+    finish_1 = RACE_START + timedelta(minutes=50)
+    finish_2 = RACE_START + timedelta(minutes=55)
+    for mat in ("mat-1", "mat-2"):
+        for repeat in range(3):
+            ingestor.submit_line(f"CHIP-1,{(finish_1 + timedelta(milliseconds=10 * repeat)).isoformat()},{mat}")
+    ingestor.submit_line(f"CHIP-2,{finish_2.isoformat()},mat-1")
+    ingestor.submit_line(f"CHIP-9,{finish_2.isoformat()},mat-1")
+    ingestor.submit_line("garbage")
+    await ingestor.stop()
+
+    assert await net_times(db_session) == {1: 3000, 2: 3300}
+    stats = ingestor.stats
+    assert (stats["reads"], stats["repeat_reads"], stats["malformed"]) == (8, 5, 1)
+    assert (stats["recorded"], stats["unknown_chips"], stats["failed_batches"]) == (2, 1, 0)
+
+@pytest.mark.asyncio
+async def test_ingestor_writes_failed_batches_again(db_session: AsyncSession, chipped_race: Event):
+    attempts = []
+
+    @asynccontextmanager
+    async def flaky_session_factory():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise ConnectionError("database is restarting")
+        yield db_session
+
+    ingestor = ChipTimingIngestor(chipped_race.id, flaky_session_factory, flush_interval_seconds=0.01, retry_seconds=0.01)
+    ingestor.start()
+    ingestor.submit_line(f"CHIP-1,{(RACE_START + timedelta(minutes=50)).isoformat()},mat-1")
+    await asyncio.sleep(0.1) # The first batch fails, then is written again without any new read
+    await ingestor.stop()
+
+    assert await net_times(db_session) == {1: 3000, 2: None}
+    assert (ingestor.stats["failed_batches"], ingestor.stats["recorded"], ingestor.pending()) == (1, 1, 0)
+
+@pytest.mark.asyncio
+async def test_simulated_reader_over_tcp(db_session: AsyncSession, chipped_race: Event):
+    ingestor = ChipTimingIngestor(chipped_race.id, session_factory_for(db_session), flush_interval_seconds=0.05)
+    server = ChipReaderServer(ingestor, host="127.0.0.1", tcp_port=0, udp_port=None)
+    await server.start()
+    try:
+        sent = await simulate_reader("127.0.0.1", server.tcp_port, ["CHIP-1", "CHIP-2"], mats=2, reads_per_crossing=3, crossings_per_second=0)
+    finally:
+        await server.stop()
+
+    assert sent == 12
+    assert ingestor.stats["recorded"] == 2
+    assert all(net_time is not None for net_time in (await net_times(db_session)).values())
+
+@pytest.mark.asyncio
+async def test_assign_chip_ids_rejects_conflicts(db_session: AsyncSession, chipped_race: Event):
+    with pytest.raises(HTTPException) as exc_info: # CHIP-1 is worn by dorsal 1
+        await assign_chip_ids(db_session, chipped_race.id, [ChipAssignment(dorsal_number=2, chip_id="CHIP-1")])
+    assert exc_info.value.status_code == 409
+
+    with pytest.raises(HTTPException) as exc_info:
+        await assign_chip_ids(db_session, chipped_race.id, [ChipAssignment(dorsal_number=7, chip_id="CHIP-7")])
+    assert exc_info.value.status_code == 404
+
+    # Swapping two chips in one batch is fine
+    assert await assign_chip_ids(db_session, chipped_race.id, [
+        ChipAssignment(dorsal_number=1, chip_id="CHIP-2"), ChipAssignment(dorsal_number=2, chip_id="CHIP-1"),
+    ]) == 2
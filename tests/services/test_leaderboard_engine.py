@@ -0,0 +1,28 @@
+import pytest
+
+np = pytest.importorskip("numpy") # The vectorized engine is optional
+
+from app.core.distances import STANDARD_DISTANCES_KM, distance_bucket_for
+from app.services.leaderboard_engine import bucket_indices, best_effort_indices, top_n_per_bucket
+
+def test_bucket_indices_match_distance_bucket_for():
+    distances = np.array([0.0, -1.0, 0.9, 0.95, 1.1, 1.11, 2.0, 4.9, 5.0, 5.1, 6.0, 11.95, 12.1, 12.2, 50.0])
+    standard = sorted(STANDARD_DISTANCES_KM)
+
+    got = [standard[i] if i >= 0 else None for i in bucket_indices(distances)]
+
+    assert got == [distance_bucket_for(d) for d in distances.tolist()]
+
+def test_best_effort_and_top_n():
+    buckets = np.array([0, 0, 0, 0, 1, 1])
+    users = np.array([7, 7, 8, 9, 7, 8])
+    seconds = np.array([300, 280, 280, 310, 900, 900])
+    pace = seconds / np.array([1.0, 1.0, 1.0, 1.0, 3.0, 3.0])
+
+    best = best_effort_indices([buckets, users], pace, seconds)
+    assert sorted(best.tolist()) == [1, 2, 3, 4, 5] # User 7's slower 1 km effort is dropped
+
+    top, positions = top_n_per_bucket(buckets[best], pace[best], seconds[best], users[best], top_n=2)
+    # Exact ties are broken by user id, like the SQL boards
+    assert [(int(buckets[best][i]), int(users[best][i])) for i in top] == [(0, 7), (0, 8), (1, 7), (1, 8)]
+    assert positions.tolist() == [1, 2, 1, 2]
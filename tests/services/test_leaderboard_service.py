@@ -0,0 +1,122 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from datetime import datetime, timezone, timedelta
+
+from app.services.leaderboard_service import record_leaderboard_result, recompute_personal_bests, VIRTUAL_SOURCE
+from app.models.virtual_result import VirtualResult
+from app.models.strava_user import StravaUserDB
+from app.models.leaderboard_entry import LeaderboardEntry
+from app.models.personal_best import PersonalBest
+from app.models.leaderboard_rollup import LeaderboardRollup, ALL_YEARS, ALL_CATEGORIES
+
+@pytest.fixture
+async def athlete(db_session: AsyncSession):
+    user = StravaUserDB(
+        strava_id=601, username="upsert_tester", firstname="Up", lastname="Sert",
+        encrypted_access_token="dummy_token", encrypted_refresh_token="dummy_refresh",
+        token_expires_at=datetime.now(timezone.utc) + timedelta(days=1)
+    )
+    db_session.add(user)
+    await db_session.commit()
+    return user
+
+async def _record(db_session: AsyncSession, user_strava_id: int, seconds: int, source_id: int, distance_km: float = 5.0):
+    return await record_leaderboard_result(
+        db_session,
+        user_strava_id=user_strava_id,
+        distance_km=distance_km,
+        time_seconds=seconds,
+        activity_date=datetime(2024, 7, source_id, tzinfo=timezone.utc),
+        event_name=f"Paddle {source_id}",
+        source=VIRTUAL_SOURCE,
+        source_id=source_id,
+    )
+
+@pytest.mark.asyncio
+async def test_record_leaderboard_result_keeps_fastest(db_session: AsyncSession, athlete):
+    assert await _record(db_session, athlete.strava_id, 1600, source_id=1)
+    assert await _record(db_session, athlete.strava_id, 1500, source_id=2) # Faster, replaces
+    assert await _record(db_session, athlete.strava_id, 1700, source_id=3) # Slower, ignored
+    await db_session.commit()
+
+    entries = (await db_session.execute(
+        select(LeaderboardEntry).where(LeaderboardEntry.user_strava_id == athlete.strava_id)
+    )).scalars().all()
+    assert len(entries) == 1
+    assert entries[0].bucket_km == 5.0
+    assert entries[0].year == 2024
+    assert entries[0].time_seconds == 1500
+    assert entries[0].source_id == 2
+
+@pytest.mark.asyncio
+async def test_record_leaderboard_result_ignores_non_standard_distance(db_session: AsyncSession, athlete):
+    assert not await _record(db_session, athlete.strava_id, 2000, source_id=4, distance_km=6.0)
+
+@pytest.mark.asyncio
+async def test_personal_best_updated_only_when_beaten(db_session: AsyncSession, athlete):
+    await _record(db_session, athlete.strava_id, 1500, source_id=1)
+    await _record(db_session, athlete.strava_id, 1550, source_id=2)
+    await db_session.commit()
+
+    personal_best = (await db_session.execute(
+        select(PersonalBest).where(PersonalBest.user_strava_id == athlete.strava_id)
+    )).scalar_one()
+    assert personal_best.time_seconds == 1500
+    assert personal_best.source_id == 1
+
+@pytest.mark.asyncio
+async def test_recompute_personal_bests_after_correction(db_session: AsyncSession, athlete):
+    activity = VirtualResult(
+        user_strava_id=athlete.strava_id, strava_activity_id="pb-1", name="Short course",
+        distance_km=3.0, elapsed_time_seconds=600, activity_date=datetime(2024, 8, 1, tzinfo=timezone.utc)
+    )
+    db_session.add(activity)
+    await db_session.flush()
+    await record_leaderboard_result(
+        db_session, user_strava_id=athlete.strava_id, distance_km=3.0, time_seconds=600,
+        activity_date=activity.activity_date, event_name=activity.name,
+        source=VIRTUAL_SOURCE, source_id=activity.id,
+    )
+    await db_session.commit()
+
+    # The activity turns out to be mis-measured and is corrected to a slower time
+    activity.elapsed_time_seconds = 900
+    await db_session.commit()
+    assert await recompute_personal_bests(db_session, user_strava_id=athlete.strava_id) == 1
+
+    personal_best = (await db_session.execute(
+        select(PersonalBest).where(PersonalBest.user_strava_id == athlete.strava_id)
+    )).scalar_one()
+    assert personal_best.time_seconds == 900
+
+@pytest.mark.asyncio
+async def test_record_result_fills_rollup_slices(db_session: AsyncSession, athlete: StravaUserDB):
+    athlete.sex = "F"
+    athlete.birth_year = 1990
+    await db_session.commit()
+
+    for seconds, category in [(1600, "Open"), (1500, None)]:
+        await record_leaderboard_result(
+            db_session,
+            user_strava_id=athlete.strava_id,
+            distance_km=5.0,
+            time_seconds=seconds,
+            activity_date=datetime(2024, 7, 1, tzinfo=timezone.utc),
+            event_name="Slice test",
+            source=VIRTUAL_SOURCE,
+            source_id=seconds,
+            category=category,
+        )
+    await db_session.commit()
+
+    rows = (await db_session.execute(
+        select(LeaderboardRollup).order_by(LeaderboardRollup.year, LeaderboardRollup.category)
+    )).scalars().all()
+    slices = {(row.year, row.category): row.time_seconds for row in rows}
+    # The uncategorised effort is faster, so it wins the all-category slices only
+    assert slices == {
+        (ALL_YEARS, ALL_CATEGORIES): 1500, (ALL_YEARS, "Open"): 1600,
+        (2024, ALL_CATEGORIES): 1500, (2024, "Open"): 1600,
+    }
+    assert {(row.sex, row.birth_year) for row in rows} == {("F", 1990)}
@@ -0,0 +1,28 @@
+import pytest
+
+from app.services.live_results_service import ResultsBroadcastHub, format_sse
+
+def test_format_sse():
+    assert format_sse('{"id": 1}', event="result", event_id="1") == 'id: 1\nevent: result\ndata: {"id": 1}\n\n'
+    assert format_sse("a\nb") == "data: a\ndata: b\n\n"
+
+@pytest.mark.asyncio
+async def test_hub_fans_out_and_drops_oldest_for_slow_subscribers():
+    hub = ResultsBroadcastHub(max_queue_size=2)
+    first, second = hub.subscribe(1), hub.subscribe(1)
+    other_event = hub.subscribe(2)
+
+    assert hub.publish(1, "frame-1") == 2
+    assert first.get_nowait() == "frame-1"
+    assert other_event.empty()
+
+    hub.publish(1, "frame-2")
+    hub.publish(1, "frame-3") # second was full with frame-1 and frame-2
+    hub.publish(1, "frame-4")
+    assert [second.get_nowait() for _ in range(second.qsize())] == ["frame-3", "frame-4"]
+    assert hub.dropped == 3 # Two from second, one from first
+
+    hub.unsubscribe(1, first)
+    hub.unsubscribe(1, second)
+    assert hub.subscriber_count(1) == 0
+    assert hub.subscriber_count() == 1
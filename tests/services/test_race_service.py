@@ -0,0 +1,451 @@
+import pytest
+import json
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, func
+from datetime import datetime, timezone, timedelta
+
+from app.services.race_service import (
+    record_athlete_finish, record_finishes_bulk, replay_timing_journal, assign_dorsal_number, dorsal_index,
+    update_event_distance_start_time, allocate_dorsals, sync_station_batch,
+)
+from app.services.leaderboard_service import get_personal_best_rows
+from app.services.standings_service import standings, recompute_positions
+from fastapi import HTTPException
+from app.services.timing_journal_service import read_journal
+from app.schemas.race_result import FinishRecord, FinishOutcome, DorsalAllocationRequest, CategoryDorsalRange, DorsalOrder
+from app.schemas.race_result import StationBatchRequest, StationCrossingOutcome
+from app.services.live_results_service import results_hub
+from app.models.strava_user import StravaUserDB
+from app.models.event import Event, EventType
+from app.models.event_category import EventCategory
+from app.models.event_distance import EventDistance
+from app.models.registration import Registration, RegistrationStatus
+from app.models.race_result import RaceResult
+from app.models.station_crossing import StationCrossing
+
+RACE_START = datetime(2024, 6, 1, 10, 0, 0)
+
+@pytest.fixture
+async def started_race(db_session: AsyncSession):
+    """An on-site event with three paddlers on the start line, dorsals 1-3."""
+    event = Event(name="Harbour Sprint", type=EventType.ON_SITE, date=datetime(2024, 6, 1), strava_sync_enabled=False)
+    db_session.add(event)
+    await db_session.flush()
+    category = EventCategory(name="Open", event_id=event.id)
+    distance = EventDistance(distance_km=5.0, event_id=event.id)
+    db_session.add_all([category, distance])
+    await db_session.flush()
+
+    for dorsal in (1, 2, 3):
+        user = StravaUserDB(
+            strava_id=700 + dorsal, username=f"paddler{dorsal}", firstname="Paddler", lastname=str(dorsal),
+            encrypted_access_token="dummy_token", encrypted_refresh_token="dummy_refresh",
+            token_expires_at=datetime.now(timezone.utc) + timedelta(days=1)
+        )
+        db_session.add(user)
+        registration = Registration(
+            user_strava_id=user.strava_id, event_id=event.id,
+            event_category_id=category.id, event_distance_id=distance.id
+        )
+        db_session.add(registration)
+        await db_session.flush()
+        db_session.add(RaceResult(registration_id=registration.id, event_id=event.id, dorsal_number=dorsal, start_time=RACE_START))
+    await db_session.commit()
+    return event
+
+@pytest.mark.asyncio
+async def test_record_finish_broadcasts_live_result(db_session: AsyncSession, started_race: Event):
+    spectator = results_hub.subscribe(started_race.id)
+    try:
+        result = await record_athlete_finish(
+            db_session, event_id=started_race.id, dorsal_number=2, finish_time=RACE_START + timedelta(minutes=25)
+        )
+    finally:
+        results_hub.unsubscribe(started_race.id, spectator)
+
+    assert result.net_time_seconds == 1500
+    frame = spectator.get_nowait()
+    assert frame.startswith(f"id: {result.id}\nevent: result\n")
+    payload = json.loads(frame.split("data: ", 1)[1])
+    assert payload["dorsal_number"] == 2
+    assert payload["category"] == "Open"
+    assert payload["distance"] == "5.0 km"
+    assert payload["net_time_seconds"] == 1500
+
+@pytest.mark.asyncio
+async def test_bulk_finishes_report_per_dorsal_outcomes(db_session: AsyncSession, started_race: Event):
+    finishes = [
+        FinishRecord(dorsal_number=3, finish_time=RACE_START + timedelta(minutes=26)),
+        FinishRecord(dorsal_number=1, finish_time=RACE_START + timedelta(minutes=24)),
+        FinishRecord(dorsal_number=99, finish_time=RACE_START + timedelta(minutes=24)),
+        FinishRecord(dorsal_number=3, finish_time=RACE_START + timedelta(minutes=25)), # Earlier read of dorsal 3
+    ]
+
+    response = await record_finishes_bulk(db_session, event_id=started_race.id, finishes=finishes)
+
+    assert [(r.dorsal_number, r.outcome) for r in response.results] == [
+        (3, FinishOutcome.DUPLICATE),
+        (1, FinishOutcome.RECORDED),
+        (99, FinishOutcome.UNKNOWN_DORSAL),
+        (3, FinishOutcome.RECORDED),
+    ]
+    assert [r.net_time_seconds for r in response.results] == [None, 1440, None, 1500]
+    assert (response.recorded, response.duplicates, response.unknown_dorsals) == (2, 1, 1)
+
+    # A second batch cannot overwrite recorded finishes
+    again = await record_finishes_bulk(
+        db_session, event_id=started_race.id,
+        finishes=[FinishRecord(dorsal_number=1, finish_time=RACE_START + timedelta(minutes=30))],
+    )
+    assert again.results[0].outcome == FinishOutcome.DUPLICATE
+    stored = (await db_session.execute(select(RaceResult).where(RaceResult.dorsal_number == 1))).scalar_one()
+    assert stored.net_time_seconds == 1440
+
+@pytest.mark.asyncio
+async def test_replay_restores_lost_finishes(db_session: AsyncSession, started_race: Event, isolated_timing_journal):
+    await record_athlete_finish(db_session, event_id=started_race.id, dorsal_number=1, finish_time=RACE_START + timedelta(minutes=24))
+    await record_finishes_bulk(db_session, event_id=started_race.id, finishes=[
+        FinishRecord(dorsal_number=2, finish_time=RACE_START + timedelta(minutes=25)),
+        FinishRecord(dorsal_number=3, finish_time=RACE_START + timedelta(minutes=26)),
+    ])
+    assert [entry["kind"] for entry in read_journal(isolated_timing_journal.path)] == ["finish", "finishes"]
+
+    # Simulate a crash that lost dorsal 3's commit
+    await db_session.execute(update(RaceResult).where(RaceResult.dorsal_number == 3).values(finish_time=None, net_time_seconds=None))
+    await db_session.commit()
+
+    counts = await replay_timing_journal(db_session, isolated_timing_journal.path, event_id=started_race.id)
+    assert counts == {"entries": 2, "recorded": 1, "rejected": 1} # Dorsal 1's single finish is already there (409)
+
+    rows = await db_session.execute(select(RaceResult.dorsal_number, RaceResult.net_time_seconds).order_by(RaceResult.dorsal_number))
+    assert rows.all() == [(1, 1440), (2, 1500), (3, 1560)]
+    # Replay is not journaled again, and replaying twice changes nothing
+    assert len(list(read_journal(isolated_timing_journal.path))) == 2
+    assert (await replay_timing_journal(db_session, isolated_timing_journal.path))["recorded"] == 0
+
+@pytest.fixture
+async def unnumbered_start_list(db_session: AsyncSession, started_race: Event):
+    """Four more paddlers on the Harbour Sprint without a dorsal: two Open, two Junior (one pending)."""
+    open_category = (await db_session.execute(select(EventCategory).where(EventCategory.event_id == started_race.id))).scalar_one()
+    junior = EventCategory(name="Junior", event_id=started_race.id)
+    db_session.add(junior)
+    await db_session.flush()
+    distance_id = (await db_session.execute(select(EventDistance.id).where(EventDistance.event_id == started_race.id))).scalar_one()
+    registrations = {}
+    for strava_id, lastname, category, registration_status in (
+        (801, "Zubizarreta", open_category, RegistrationStatus.CONFIRMED),
+        (802, "Alonso", open_category, RegistrationStatus.CONFIRMED),
+        (803, "Mendez", junior, RegistrationStatus.CONFIRMED),
+        (804, "Bravo", junior, RegistrationStatus.PENDING),
+    ):
+        db_session.add(StravaUserDB(
+            strava_id=strava_id, username=lastname.lower(), firstname="Paddler", lastname=lastname,
+            encrypted_access_token="dummy_token", encrypted_refresh_token="dummy_refresh",
+            token_expires_at=datetime.now(timezone.utc) + timedelta(days=1)
+        ))
+        registration = Registration(
+            user_strava_id=strava_id, event_id=started_race.id, event_category_id=category.id,
+            event_distance_id=distance_id, status=registration_status.value,
+            registered_at=datetime(2024, 5, 1, tzinfo=timezone.utc) + timedelta(days=strava_id - 800),
+        )
+        db_session.add(registration)
+        await db_session.flush()
+        db_session.add(RaceResult(registration_id=registration.id, event_id=started_race.id))
+        registrations[lastname] = registration.id
+    await db_session.commit()
+    return registrations, junior
+
+@pytest.mark.asyncio
+async def test_allocate_dorsals_shares_numbering_and_skips_taken_numbers(db_session: AsyncSession, started_race: Event, unnumbered_start_list):
+    registrations, _ = unnumbered_start_list
+
+    response = await allocate_dorsals(db_session, started_race.id, DorsalAllocationRequest(order=DorsalOrder.ALPHABETICAL))
+
+    # Dorsals 1-3 are already taken; the pending registration is left out
+    assert [(a.registration_id, a.dorsal_number) for a in response.assigned] == [
+        (registrations["Alonso"], 4), (registrations["Mendez"], 5), (registrations["Zubizarreta"], 6),
+    ]
+    # Nothing left to number: a second run is a no-op
+    assert (await allocate_dorsals(db_session, started_race.id, DorsalAllocationRequest())).assigned == []
+    # The unique index still rejects a manual duplicate
+    with pytest.raises(HTTPException) as exc_info:
+        await assign_dorsal_number(db_session, registration_id=registrations["Bravo"], dorsal_number=5, event_id=started_race.id)
+    assert exc_info.value.status_code == 409
+
+@pytest.mark.asyncio
+async def test_allocate_dorsals_by_category_range(db_session: AsyncSession, started_race: Event, unnumbered_start_list):
+    registrations, junior = unnumbered_start_list
+
+    response = await allocate_dorsals(db_session, started_race.id, DorsalAllocationRequest(
+        category_ranges=[CategoryDorsalRange(event_category_id=junior.id, first_dorsal=4, last_dorsal=5)],
+        include_pending=True,
+    ))
+
+    # Registration order; Open paddlers skip the Junior range 4-5
+    assert [(a.registration_id, a.dorsal_number) for a in response.assigned] == [
+        (registrations["Zubizarreta"], 6), (registrations["Alonso"], 7),
+        (registrations["Mendez"], 4), (registrations["Bravo"], 5),
+    ]
+    numbered = (await db_session.execute(
+        select(RaceResult.registration_id, RaceResult.dorsal_number).where(RaceResult.registration_id == registrations["Bravo"])
+    )).one()
+    assert numbered.dorsal_number == 5
+
+@pytest.mark.asyncio
+async def test_allocate_dorsals_rejects_bad_ranges(db_session: AsyncSession, started_race: Event, unnumbered_start_list):
+    registrations, junior = unnumbered_start_list
+
+    with pytest.raises(HTTPException) as exc_info: # Two Junior paddlers, one number
+        await allocate_dorsals(db_session, started_race.id, DorsalAllocationRequest(
+            category_ranges=[CategoryDorsalRange(event_category_id=junior.id, first_dorsal=3, last_dorsal=4)],
+            include_pending=True,
+        ))
+    assert exc_info.value.status_code == 409
+    with pytest.raises(HTTPException) as exc_info:
+        await allocate_dorsals(db_session, started_race.id, DorsalAllocationRequest(
+            category_ranges=[CategoryDorsalRange(event_category_id=9999, first_dorsal=10, last_dorsal=20)],
+        ))
+    assert exc_info.value.status_code == 400
+
+    # All-or-nothing: the failed runs numbered nobody
+    unnumbered = (await db_session.execute(
+        select(RaceResult.id).where(RaceResult.event_id == started_race.id, RaceResult.dorsal_number.is_(None))
+    )).scalars().all()
+    assert len(unnumbered) == 4
+
+def station_batch(station_id: str, batch_id: str, *crossings) -> StationBatchRequest:
+    return StationBatchRequest(station_id=station_id, batch_id=batch_id, crossings=[
+        {"crossing_id": crossing_id, "dorsal_number": dorsal, "finish_time": RACE_START + timedelta(seconds=seconds)}
+        for crossing_id, dorsal, seconds in crossings
+    ])
+
+@pytest.mark.asyncio
+async def test_station_batch_retries_are_idempotent(db_session: AsyncSession, started_race: Event):
+    batch = station_batch("finish-a", "a-1", ("a-1-1", 1, 1440), ("a-1-2", 2, 1500), ("a-1-3", 99, 1510))
+
+    first = await sync_station_batch(db_session, started_race.id, batch)
+    assert [r.outcome for r in first.results] == [
+        StationCrossingOutcome.RECORDED, StationCrossingOutcome.RECORDED, StationCrossingOutcome.UNKNOWN_DORSAL,
+    ]
+    assert (first.recorded, first.unknown_dorsals, first.replayed) == (2, 1, False)
+    assert first.results[0].net_time_seconds == 1440
+
+    # The response was lost and the station sends the batch again
+    retry = await sync_station_batch(db_session, started_race.id, batch)
+    assert retry.replayed
+    assert retry.results == first.results
+
+    # The station re-batched its buffer: the crossing already received changes nothing
+    rebatched = await sync_station_batch(db_session, started_race.id, station_batch("finish-a", "a-2", ("a-1-2", 2, 1500), ("a-2-1", 3, 1560)))
+    assert [r.outcome for r in rebatched.results] == [StationCrossingOutcome.DUPLICATE, StationCrossingOutcome.RECORDED]
+    assert (await db_session.execute(select(func.count(StationCrossing.id)))).scalar_one() == 4
+
+    with pytest.raises(HTTPException) as exc_info: # Same batch id, different contents
+        await sync_station_batch(db_session, started_race.id, station_batch("finish-a", "a-1", ("a-9-9", 3, 1600)))
+    assert exc_info.value.status_code == 409
+
+@pytest.mark.asyncio
+async def test_station_batches_merge_to_earliest_crossing(db_session: AsyncSession, started_race: Event, isolated_timing_journal):
+    # The backup station's upload arrives first, with a later time
+    await sync_station_batch(db_session, started_race.id, station_batch("finish-b", "b-1", ("b-1", 1, 1442)))
+    earlier = await sync_station_batch(db_session, started_race.id, station_batch("finish-a", "a-1", ("a-1", 1, 1440)))
+    assert earlier.results[0].outcome == StationCrossingOutcome.RECORDED
+    assert earlier.results[0].net_time_seconds == 1440
+    # Same time from a station that sorts later: the finish stays with finish-a
+    tie = await sync_station_batch(db_session, started_race.id, station_batch("finish-c", "c-1", ("c-1", 1, 1440)))
+    assert tie.results[0].outcome == StationCrossingOutcome.SUPERSEDED
+
+    outcomes = dict((await db_session.execute(select(StationCrossing.station_id, StationCrossing.outcome))).all())
+    assert outcomes == {"finish-a": "recorded", "finish-b": "superseded", "finish-c": "superseded"}
+    assert (await db_session.execute(select(RaceResult.net_time_seconds).where(RaceResult.dorsal_number == 1))).scalar_one() == 1440
+
+    # Uploads are journaled, and replaying them is a no-op
+    counts = await replay_timing_journal(db_session, isolated_timing_journal.path, event_id=started_race.id)
+    assert counts == {"entries": 3, "recorded": 0, "rejected": 0}
+
+@pytest.mark.asyncio
+async def test_finishes_maintain_positions_and_gaps(db_session: AsyncSession, started_race: Event):
+    await db_session.execute(update(StravaUserDB).where(StravaUserDB.strava_id.in_([701, 702])).values(sex="F"))
+    await db_session.commit()
+    standings_rows = (
+        select(RaceResult.dorsal_number, RaceResult.overall_position, RaceResult.category_position,
+               RaceResult.sex_position, RaceResult.gap_to_leader_seconds)
+        .order_by(RaceResult.dorsal_number)
+    )
+    loads = standings.loads
+
+    second = await record_athlete_finish(db_session, event_id=started_race.id, dorsal_number=2, finish_time=RACE_START + timedelta(minutes=25))
+    assert (second.overall_position, second.sex_position, second.gap_to_leader_seconds) == (1, 1, 0)
+    # A faster athlete's finish arrives later: dorsal 2 moves down and gets a gap
+    await record_finishes_bulk(db_session, event_id=started_race.id, finishes=[
+        FinishRecord(dorsal_number=3, finish_time=RACE_START + timedelta(minutes=26)),
+        FinishRecord(dorsal_number=1, finish_time=RACE_START + timedelta(minutes=24)),
+    ])
+    db_session.expunge_all()
+    assert (await db_session.execute(standings_rows)).all() == [
+        (1, 1, 1, 1, 0), (2, 2, 2, 2, 60), (3, 3, 3, None, 120),
+    ]
+    assert standings.loads == loads + 1
+
+    # A station's earlier crossing for dorsal 3 makes it the leader: every gap changes
+    await sync_station_batch(db_session, started_race.id, station_batch("finish-a", "a-1", ("a-1", 3, 23 * 60)))
+    db_session.expunge_all()
+    expected = [(1, 2, 2, 1, 60), (2, 3, 3, 2, 120), (3, 1, 1, None, 0)]
+    assert (await db_session.execute(standings_rows)).all() == expected
+
+    # The incremental standings match a full recompute
+    await recompute_positions(db_session, started_race.id)
+    await db_session.commit()
+    assert (await db_session.execute(standings_rows)).all() == expected
+
+def drain_frames(spectator) -> list:
+    frames = []
+    while not spectator.empty():
+        frames.append(json.loads(spectator.get_nowait().split("data: ", 1)[1]))
+    return frames
+
+@pytest.mark.asyncio
+async def test_live_push_includes_rows_the_finish_moved(db_session: AsyncSession, started_race: Event):
+    await record_athlete_finish(db_session, event_id=started_race.id, dorsal_number=2, finish_time=RACE_START + timedelta(minutes=25))
+    spectator = results_hub.subscribe(started_race.id)
+    try:
+        # A faster finish: dorsal 2 drops to second, and its row is pushed as well
+        await record_athlete_finish(db_session, event_id=started_race.id, dorsal_number=1, finish_time=RACE_START + timedelta(minutes=24))
+        frames = drain_frames(spectator)
+        assert [(f["dorsal_number"], f["category_position"], f["gap_to_leader_seconds"]) for f in frames] == [(1, 1, 0), (2, 2, 60)]
+
+        # A wave correction pushes every finished row of the distance
+        distance = (await db_session.execute(select(EventDistance).where(EventDistance.event_id == started_race.id))).scalar_one()
+        await update_event_distance_start_time(db_session, started_race.id, distance.id, RACE_START + timedelta(minutes=1))
+        frames = drain_frames(spectator)
+        assert [(f["dorsal_number"], f["net_time_seconds"]) for f in frames] == [(1, 1380), (2, 1440)]
+    finally:
+        results_hub.unsubscribe(started_race.id, spectator)
+
+@pytest.mark.asyncio
+async def test_standings_reload_after_finishes_written_elsewhere(db_session: AsyncSession, started_race: Event):
+    await record_athlete_finish(db_session, event_id=started_race.id, dorsal_number=2, finish_time=RACE_START + timedelta(minutes=25))
+    loads = standings.loads
+    # Another worker records dorsal 1, faster, and ranks it first: this process's board never saw it
+    await db_session.execute(
+        update(RaceResult).where(RaceResult.dorsal_number == 1)
+        .values(finish_time=RACE_START + timedelta(minutes=24), net_time_seconds=1440, overall_position=1, category_position=1, gap_to_leader_seconds=0)
+    )
+    await db_session.execute(update(RaceResult).where(RaceResult.dorsal_number == 2).values(overall_position=2, category_position=2, gap_to_leader_seconds=60))
+    await db_session.commit()
+
+    third = await record_athlete_finish(db_session, event_id=started_race.id, dorsal_number=3, finish_time=RACE_START + timedelta(minutes=26))
+    assert (third.overall_position, third.gap_to_leader_seconds) == (3, 120) # Not 2nd behind a stale leader
+    assert standings.loads == loads + 1
+    assert standings.stale_reloads >= 1
+
+@pytest.mark.asyncio
+async def test_dorsal_index_serves_finishes_and_follows_assignments(db_session: AsyncSession, started_race: Event):
+    loads = dorsal_index.loads
+    await record_athlete_finish(db_session, event_id=started_race.id, dorsal_number=1, finish_time=RACE_START + timedelta(minutes=24))
+    await record_finishes_bulk(db_session, event_id=started_race.id, finishes=[
+        FinishRecord(dorsal_number=2, finish_time=RACE_START + timedelta(minutes=25)),
+    ])
+    assert dorsal_index.loads == loads + 1 # Both finishes resolved from one load
+
+    with pytest.raises(HTTPException) as exc_info:
+        await assign_dorsal_number(db_session, registration_id=1, dorsal_number=3, event_id=started_race.id)
+    assert exc_info.value.status_code == 409
+
+    # Dorsal 3's athlete switches to dorsal 30: the index follows without a reload
+    paddler_3 = (await db_session.execute(select(RaceResult).where(RaceResult.dorsal_number == 3))).scalar_one()
+    await assign_dorsal_number(db_session, registration_id=paddler_3.registration_id, dorsal_number=30, event_id=started_race.id)
+    assert (await dorsal_index.lookup_many(db_session, started_race.id, [30])) == {30: paddler_3.id}
+    assert dorsal_index.loads == loads + 1
+
+    # A dorsal written behind the index's back is found by the reload on a miss
+    await db_session.execute(update(RaceResult).where(RaceResult.id == paddler_3.id).values(dorsal_number=33))
+    await db_session.commit()
+    db_session.expunge_all() # As a new request's session would see it
+    result = await record_athlete_finish(db_session, event_id=started_race.id, dorsal_number=33, finish_time=RACE_START + timedelta(minutes=26))
+    assert result.net_time_seconds == 1560
+    assert dorsal_index.loads == loads + 2
+
+@pytest.mark.asyncio
+async def test_finishes_follow_dorsals_moved_behind_the_index(db_session: AsyncSession, started_race: Event):
+    await dorsal_index.load(db_session, started_race.id)
+    wearers = dict((await db_session.execute(select(RaceResult.dorsal_number, RaceResult.id))).all())
+    # Another worker swaps dorsals 1 and 2 (through a free number: dorsals are unique per event)
+    for race_result_id, dorsal_number in ((wearers[1], 100), (wearers[2], 1), (wearers[1], 2)):
+        await db_session.execute(update(RaceResult).where(RaceResult.id == race_result_id).values(dorsal_number=dorsal_number))
+    await db_session.commit()
+    loads = dorsal_index.loads
+
+    result = await record_athlete_finish(db_session, event_id=started_race.id, dorsal_number=1, finish_time=RACE_START + timedelta(minutes=24))
+    assert result.id == wearers[2] # The athlete wearing dorsal 1 now, not the index's stale entry
+    assert dorsal_index.loads == loads + 1
+
+    # The bulk path checks the same way (the index is stale again after another swap)
+    for race_result_id, dorsal_number in ((wearers[1], 100), (wearers[3], 2), (wearers[1], 3)):
+        await db_session.execute(update(RaceResult).where(RaceResult.id == race_result_id).values(dorsal_number=dorsal_number))
+    await db_session.commit()
+    response = await record_finishes_bulk(db_session, event_id=started_race.id, finishes=[
+        FinishRecord(dorsal_number=2, finish_time=RACE_START + timedelta(minutes=25)),
+    ])
+    assert [(r.outcome, r.race_result_id) for r in response.results] == [(FinishOutcome.RECORDED, wearers[3])]
+    assert dorsal_index.loads == loads + 2
+
+    for race_result_id, dorsal_number in ((wearers[3], 100), (wearers[1], 2), (wearers[3], 3)):
+        await db_session.execute(update(RaceResult).where(RaceResult.id == race_result_id).values(dorsal_number=dorsal_number))
+    await db_session.commit()
+    batch = await sync_station_batch(db_session, started_race.id, station_batch("finish-a", "a-1", ("a-1-1", 2, 1560)))
+    assert (batch.results[0].outcome, batch.results[0].race_result_id) == (StationCrossingOutcome.RECORDED, wearers[1])
+    net_times = dict((await db_session.execute(select(RaceResult.id, RaceResult.net_time_seconds))).all())
+    assert net_times == {wearers[2]: 1440, wearers[3]: 1500, wearers[1]: 1560}
+
+@pytest.mark.asyncio
+async def test_wave_start_correction_recomputes_net_times(db_session: AsyncSession, started_race: Event):
+    distance = (await db_session.execute(select(EventDistance).where(EventDistance.event_id == started_race.id))).scalar_one()
+    await record_finishes_bulk(db_session, event_id=started_race.id, finishes=[
+        FinishRecord(dorsal_number=1, finish_time=RACE_START + timedelta(minutes=24)),
+        FinishRecord(dorsal_number=2, finish_time=RACE_START + timedelta(minutes=25, seconds=0.7)),
+    ])
+
+    # The gun actually went off a minute late
+    wave = await update_event_distance_start_time(
+        db_session, event_id=started_race.id, distance_id=distance.id, new_start_time=RACE_START + timedelta(minutes=1)
+    )
+    assert wave.results_updated == 3
+    rows = await db_session.execute(
+        select(RaceResult.dorsal_number, RaceResult.net_time_seconds).order_by(RaceResult.dorsal_number)
+        .execution_options(populate_existing=True)
+    )
+    assert rows.all() == [(1, 1380), (2, 1440), (3, None)] # Truncated to whole seconds like a live finish
+    personal_best = (await get_personal_best_rows(db_session, user_strava_id=701))[0]
+    assert personal_best.time_seconds == 1380
+
+    # A category with its own wave no longer follows the distance-wide one
+    juniors = EventCategory(name="Junior", event_id=started_race.id)
+    db_session.add(juniors)
+    await db_session.flush()
+    paddler_1 = (await db_session.execute(select(RaceResult).where(RaceResult.dorsal_number == 1))).scalar_one()
+    registration = await db_session.get(Registration, paddler_1.registration_id)
+    registration.event_category_id = juniors.id
+    await db_session.commit()
+
+    await update_event_distance_start_time(
+        db_session, event_id=started_race.id, distance_id=distance.id, new_start_time=RACE_START, category_id=juniors.id
+    )
+    late_gun = await update_event_distance_start_time(
+        db_session, event_id=started_race.id, distance_id=distance.id, new_start_time=RACE_START + timedelta(minutes=2)
+    )
+    assert late_gun.results_updated == 2
+    rows = await db_session.execute(
+        select(RaceResult.dorsal_number, RaceResult.net_time_seconds).order_by(RaceResult.dorsal_number)
+        .execution_options(populate_existing=True)
+    )
+    assert rows.all() == [(1, 1440), (2, 1380), (3, None)]
+    # Positions are recomputed with them: dorsal 2 now leads the distance, each leads its own category
+    positions = await db_session.execute(
+        select(RaceResult.dorsal_number, RaceResult.overall_position, RaceResult.category_position, RaceResult.gap_to_leader_seconds)
+        .order_by(RaceResult.dorsal_number)
+    )
+    assert positions.all() == [(1, 2, 1, 60), (2, 1, 1, 0), (3, None, None, None)]
+    # Leaderboard rows follow the corrected times, also when they got slower
+    assert (await get_personal_best_rows(db_session, user_strava_id=701))[0].time_seconds == 1440
+    assert (await get_personal_best_rows(db_session, user_strava_id=702))[0].time_seconds == 1380
@@ -0,0 +1,253 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from datetime import datetime, timezone, timedelta
+
+from app.services.result_service import (
+    get_yearly_leaderboard, get_user_personal_bests, STANDARD_DISTANCES_KM,
+    ResultsCache, results_cache, invalidate_leaderboards,
+    get_leaderboard_page, get_user_leaderboard_ranks, get_event_results_classified,
+)
+from app.services.leaderboard_service import rebuild_leaderboard_entries, recompute_personal_bests, rebuild_leaderboard_rollups
+from app.models.strava_user import StravaUserDB
+from app.models.event import Event, EventType
+from app.models.event_category import EventCategory
+from app.models.event_distance import EventDistance
+from app.models.registration import Registration
+from app.models.race_result import RaceResult
+from app.models.virtual_result import VirtualResult
+
+@pytest.fixture(autouse=True)
+def clear_results_cache():
+    # The cache is module-level; don't let one test's pages leak into the next
+    results_cache.clear()
+    yield
+    results_cache.clear()
+
+@pytest.fixture
+async def leaderboard_data(db_session: AsyncSession):
+    fast = StravaUserDB(
+        strava_id=501, username="fast", firstname="Fast", lastname="Paddler", sex="M",
+        encrypted_access_token="dummy_token", encrypted_refresh_token="dummy_refresh",
+        token_expires_at=datetime.now(timezone.utc) + timedelta(days=1)
+    )
+    slow = StravaUserDB(
+        strava_id=502, username="slow", firstname="Slow", lastname="Paddler", sex="F", birth_year=1980,
+        encrypted_access_token="dummy_token", encrypted_refresh_token="dummy_refresh",
+        token_expires_at=datetime.now(timezone.utc) + timedelta(days=1)
+    )
+    db_session.add_all([fast, slow])
+
+    event = Event(name="Lake Race", type=EventType.ON_SITE, date=datetime(2024, 6, 1), strava_sync_enabled=False)
+    db_session.add(event)
+    await db_session.flush()
+
+    category = EventCategory(name="Elite", event_id=event.id)
+    distance = EventDistance(distance_km=5.0, event_id=event.id)
+    db_session.add_all([category, distance])
+    await db_session.flush()
+
+    registration = Registration(
+        user_strava_id=slow.strava_id, event_id=event.id,
+        event_category_id=category.id, event_distance_id=distance.id
+    )
+    db_session.add(registration)
+    await db_session.flush()
+    db_session.add(RaceResult(registration_id=registration.id, net_time_seconds=1800))
+
+    # Two 5 km efforts for the fast athlete (only the best counts) and one off-distance activity
+    db_session.add_all([
+        VirtualResult(
+            user_strava_id=fast.strava_id, strava_activity_id="va-1", name="Morning paddle",
+            distance_km=5.05, elapsed_time_seconds=1500, activity_date=datetime(2024, 5, 1, tzinfo=timezone.utc)
+        ),
+        VirtualResult(
+            user_strava_id=fast.strava_id, strava_activity_id="va-2", name="Easy paddle",
+            distance_km=5.0, elapsed_time_seconds=1700, activity_date=datetime(2024, 5, 2, tzinfo=timezone.utc)
+        ),
+        VirtualResult(
+            user_strava_id=fast.strava_id, strava_activity_id="va-3", name="Long paddle",
+            distance_km=8.0, elapsed_time_seconds=2800, activity_date=datetime(2023, 5, 2, tzinfo=timezone.utc)
+        ),
+    ])
+    await db_session.commit()
+    await rebuild_leaderboard_entries(db_session)
+    await recompute_personal_bests(db_session)
+    await rebuild_leaderboard_rollups(db_session)
+    return fast, slow
+
+@pytest.mark.asyncio
+async def test_yearly_leaderboard_best_per_athlete(db_session: AsyncSession, leaderboard_data):
+    fast, slow = leaderboard_data
+
+    leaderboard = await get_yearly_leaderboard(db_session, year=2024)
+
+    # Every standard distance is present, even without qualifying results
+    assert set(leaderboard.keys()) == {f"{d} km" for d in STANDARD_DISTANCES_KM}
+    five_km = leaderboard["5.0 km"]
+    assert [entry["user_strava_id"] for entry in five_km] == [fast.strava_id, slow.strava_id]
+    assert five_km[0]["time_seconds"] == 1500
+    assert five_km[0]["event_name"] == "Morning paddle"
+    assert five_km[0]["source"] == "Virtual"
+    assert five_km[1]["source"] == "Race"
+    assert five_km[1]["pace_seconds_per_km"] == pytest.approx(360.0)
+
+@pytest.mark.asyncio
+async def test_yearly_leaderboard_respects_year_and_top_n(db_session: AsyncSession, leaderboard_data):
+    fast, _ = leaderboard_data
+
+    assert all(not entries for entries in (await get_yearly_leaderboard(db_session, year=2023)).values())
+
+    top_one = await get_yearly_leaderboard(db_session, year=None, top_n=1)
+    assert [entry["user_strava_id"] for entry in top_one["5.0 km"]] == [fast.strava_id]
+
+@pytest.mark.asyncio
+async def test_vectorized_engine_matches_stored_entries(db_session: AsyncSession, leaderboard_data):
+    pytest.importorskip("numpy")
+    fast, slow = leaderboard_data
+    for year in (None, 2023, 2024):
+        stored = await get_yearly_leaderboard(db_session, year=year)
+        vectorized = await get_yearly_leaderboard(db_session, year=year, vectorized=True)
+        assert vectorized == stored
+    for user in (fast, slow):
+        assert (
+            await get_user_personal_bests(db_session, user_strava_id=user.strava_id, vectorized=True)
+            == await get_user_personal_bests(db_session, user_strava_id=user.strava_id)
+        )
+
+@pytest.mark.asyncio
+async def test_user_personal_bests(db_session: AsyncSession, leaderboard_data):
+    fast, slow = leaderboard_data
+
+    personal_bests = await get_user_personal_bests(db_session, user_strava_id=fast.strava_id)
+
+    assert list(personal_bests.keys()) == ["5.0 km"] # The 8 km activity matches no standard distance
+    assert personal_bests["5.0 km"]["time_seconds"] == 1500
+    assert personal_bests["5.0 km"]["activity_date"] == "2024-05-01"
+    assert personal_bests["5.0 km"]["source"] == "Virtual"
+
+    slow_bests = await get_user_personal_bests(db_session, user_strava_id=slow.strava_id)
+    assert slow_bests["5.0 km"]["event_name"] == "Lake Race"
+    assert slow_bests["5.0 km"]["source"] == "Race"
+
+@pytest.mark.asyncio
+async def test_streaming_leaderboard_matches_stored_entries(db_session: AsyncSession, leaderboard_data):
+    for year in (None, 2023, 2024):
+        stored = await get_yearly_leaderboard(db_session, year=year)
+        streamed = await get_yearly_leaderboard(db_session, year=year, streaming=True)
+        assert streamed == stored
+
+def test_results_cache_lru_and_ttl():
+    now = [0.0]
+    cache = ResultsCache(max_entries=2, default_ttl_seconds=10, clock=lambda: now[0])
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1 # "a" is now the most recently used
+    cache.set("c", 3) # Evicts "b"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+    now[0] = 11.0 # Past the TTL of "a" and "c"
+    cache.set("d", 4)
+    assert cache.get("d") == 4
+    assert cache.stats()["size"] == 2
+    assert cache.invalidate(lambda key: key in ("c", "d")) == 2
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["invalidations"] == 2
+    assert stats["size"] == 0
+
+def test_results_cache_expired_entry_is_a_miss():
+    now = [0.0]
+    cache = ResultsCache(max_entries=8, default_ttl_seconds=10, clock=lambda: now[0])
+    cache.set("page", "cached", ttl_seconds=5)
+
+    now[0] = 6.0
+    assert cache.get("page") != "cached"
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["expirations"] == 1
+    assert stats["size"] == 0
+
+@pytest.mark.asyncio
+async def test_yearly_leaderboard_cached_until_invalidated(db_session: AsyncSession, leaderboard_data):
+    first = await get_yearly_leaderboard(db_session, year=2024)
+    assert await get_yearly_leaderboard(db_session, year=2024) is first
+    await get_yearly_leaderboard(db_session, year=None)
+    await get_yearly_leaderboard(db_session, year=2023)
+
+    invalidate_leaderboards(years=[2024])
+
+    # The 2024 and overall boards are recomputed, 2023 is still served from the cache
+    assert await get_yearly_leaderboard(db_session, year=2024) is not first
+    assert results_cache.stats()["invalidations"] == 2
+
+@pytest.mark.asyncio
+async def test_leaderboard_pages_follow_cursor(db_session: AsyncSession, leaderboard_data):
+    fast, slow = leaderboard_data
+
+    first_page = await get_leaderboard_page(db_session, distance_km=5.0, year=2024, limit=1)
+    assert [(e["position"], e["user_strava_id"]) for e in first_page["entries"]] == [(1, fast.strava_id)]
+    assert first_page["next_cursor"] is not None
+
+    second_page = await get_leaderboard_page(db_session, distance_km=5.0, year=2024, limit=1, cursor=first_page["next_cursor"])
+    assert [(e["position"], e["user_strava_id"]) for e in second_page["entries"]] == [(2, slow.strava_id)]
+    assert second_page["next_cursor"] is None
+
+    whole_board = await get_leaderboard_page(db_session, distance_km=5.0, year=None, limit=50)
+    assert [e["user_strava_id"] for e in whole_board["entries"]] == [fast.strava_id, slow.strava_id]
+
+@pytest.mark.asyncio
+async def test_leaderboard_page_rejects_bad_input(db_session: AsyncSession, leaderboard_data):
+    with pytest.raises(HTTPException) as exc_info:
+        await get_leaderboard_page(db_session, distance_km=5.0, cursor="not-a-cursor")
+    assert exc_info.value.status_code == 400
+
+    with pytest.raises(HTTPException) as exc_info:
+        await get_leaderboard_page(db_session, distance_km=8.0)
+    assert exc_info.value.status_code == 404
+
+@pytest.mark.asyncio
+async def test_user_leaderboard_ranks(db_session: AsyncSession, leaderboard_data):
+    fast, slow = leaderboard_data
+
+    assert await get_user_leaderboard_ranks(db_session, user_strava_id=fast.strava_id) == {"5.0 km": {"position": 1, "total": 2}}
+    assert await get_user_leaderboard_ranks(db_session, user_strava_id=slow.strava_id, year=2024) == {"5.0 km": {"position": 2, "total": 2}}
+    assert await get_user_leaderboard_ranks(db_session, user_strava_id=slow.strava_id, year=2023) == {}
+
+@pytest.mark.asyncio
+async def test_yearly_leaderboard_filters(db_session: AsyncSession, leaderboard_data):
+    fast, slow = leaderboard_data
+
+    async def five_km_athletes(**filters):
+        leaderboard = await get_yearly_leaderboard(db_session, **filters)
+        return [entry["user_strava_id"] for entry in leaderboard["5.0 km"]]
+
+    # Only race results carry a category
+    assert await five_km_athletes(year=2024, category="Elite") == [slow.strava_id]
+    assert await five_km_athletes(year=None, category="Elite") == [slow.strava_id]
+    assert await five_km_athletes(year=2024, category="Junior") == []
+    assert await five_km_athletes(year=2024, sex="M") == [fast.strava_id]
+    assert await five_km_athletes(year=None, sex="F") == [slow.strava_id]
+    # Born 1980: 44 during 2024; the fast athlete has no birth year and is in no age group
+    assert await five_km_athletes(year=2024, age_band="40-49") == [slow.strava_id]
+    assert await five_km_athletes(year=2024, age_band="30-39") == []
+    assert await five_km_athletes(year=2024, sex="F", age_band="40-49", category="Elite") == [slow.strava_id]
+
+    with pytest.raises(HTTPException) as exc_info:
+        await get_yearly_leaderboard(db_session, year=2024, age_band="veterans")
+    assert exc_info.value.status_code == 400
+
+@pytest.mark.asyncio
+async def test_event_results_classified(db_session: AsyncSession, leaderboard_data):
+    _, slow = leaderboard_data
+    event_id = (await db_session.execute(select(Event.id).where(Event.name == "Lake Race"))).scalar_one()
+
+    classified = await get_event_results_classified(db_session, event_id)
+
+    [result] = classified["Elite"]["5.0 km"]
+    assert result.net_time_seconds == 1800
+    assert result.registration.user.strava_id == slow.strava_id
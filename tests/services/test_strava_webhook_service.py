@@ -0,0 +1,165 @@
+import pytest
+import httpx
+from fastapi import HTTPException
+import zlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.security import encrypt_token
+from app.models.leaderboard_entry import LeaderboardEntry
+from app.models.leaderboard_rollup import LeaderboardRollup
+from app.models.personal_best import PersonalBest
+from app.models.strava_user import StravaUserDB
+from app.models.strava_webhook_event import StravaWebhookEvent
+from app.models.virtual_result import VirtualResult
+from app.routers import webhooks
+from app.schemas.strava_webhook import StravaWebhookEventIn
+from app.services import strava_webhook_service
+from app.services.strava_webhook_service import WebhookWorkers
+from benchmarks.fake_strava import create_fake_strava
+
+ATHLETE_ID = 9001
+
+@pytest.fixture
+async def webhook_athlete(db_session: AsyncSession):
+    user = StravaUserDB(
+        strava_id=ATHLETE_ID, username="pushed",
+        encrypted_access_token=encrypt_token("token-9001"), encrypted_refresh_token=encrypt_token("refresh-9001"),
+        token_expires_at=datetime.now(timezone.utc) + timedelta(hours=1)
+    )
+    db_session.add(user)
+    await db_session.commit()
+    return user
+
+def workers_against(fake_strava, db_session: AsyncSession, **options) -> WebhookWorkers:
+    @asynccontextmanager
+    async def session_factory():
+        yield db_session
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_strava))
+    return WebhookWorkers(session_factory, client=client, **options)
+
+def activity_event(activity_id: int, aspect_type: str, **updates) -> StravaWebhookEventIn:
+    return StravaWebhookEventIn(object_type="activity", object_id=activity_id, aspect_type=aspect_type, owner_id=ATHLETE_ID, updates=updates)
+
+async def queued_statuses(db_session: AsyncSession):
+    return list((await db_session.execute(select(StravaWebhookEvent.status).order_by(StravaWebhookEvent.id))).scalars())
+
+FIRST, SECOND = (zlib.crc32(b"token-9001") * 10_000 + n for n in (0, 1)) # Ids the fake gives the athlete's token
+
+async def stored_activities(db_session: AsyncSession, user_strava_id: int = ATHLETE_ID):
+    return [
+        (result.strava_activity_id, result.name) for result in (await db_session.execute(
+            select(VirtualResult).where(VirtualResult.user_strava_id == user_strava_id)
+            .order_by(VirtualResult.id).execution_options(populate_existing=True)
+        )).scalars()
+    ]
+
+@pytest.mark.asyncio
+async def test_workers_apply_creates_renames_and_deletes(db_session: AsyncSession, webhook_athlete: StravaUserDB):
+    fake_strava = create_fake_strava(activities_per_athlete=3)
+    workers = workers_against(fake_strava, db_session)
+
+    for event in (activity_event(FIRST, "create"), activity_event(SECOND, "create")):
+        await strava_webhook_service.enqueue_event(db_session, event)
+    assert await workers.drain() == 2
+    assert await db_session.scalar(select(func.count(PersonalBest.id)).where(PersonalBest.user_strava_id == ATHLETE_ID)) > 0
+
+    fake_strava.state.edits[FIRST] = {"name": "Morning glass"}
+    fake_strava.state.deleted.add(SECOND)
+    for event in (activity_event(FIRST, "update", title="Morning glass"), activity_event(SECOND, "delete")):
+        await strava_webhook_service.enqueue_event(db_session, event)
+    assert await workers.drain() == 2
+
+    assert await queued_statuses(db_session) == ["done"] * 4
+    assert await stored_activities(db_session) == [(str(FIRST), "Morning glass")]
+    # Every event was checked against Strava, one activity fetch each
+    assert [request["path"] for request in fake_strava.state.requests] == [f"/api/v3/activities/{activity_id}" for activity_id in (FIRST, SECOND, FIRST, SECOND)]
+    # The deleted activity no longer counts, and the boards show the new title
+    stored_id = await db_session.scalar(select(VirtualResult.id).where(VirtualResult.strava_activity_id == str(FIRST)))
+    for model in (PersonalBest, LeaderboardEntry, LeaderboardRollup):
+        rows = (await db_session.execute(select(model.source_id, model.event_name).where(model.user_strava_id == ATHLETE_ID))).all()
+        assert rows and set(rows) == {(stored_id, "Morning glass")}
+
+@pytest.mark.asyncio
+async def test_forged_events_change_nothing_strava_does_not_confirm(db_session: AsyncSession, webhook_athlete: StravaUserDB):
+    db_session.add(StravaUserDB(
+        strava_id=9002, username="forger",
+        encrypted_access_token=encrypt_token("token-9002"), encrypted_refresh_token=encrypt_token("refresh-9002"),
+        token_expires_at=datetime.now(timezone.utc) + timedelta(hours=1)
+    ))
+    await db_session.commit()
+    fake_strava = create_fake_strava(activities_per_athlete=3)
+    workers = workers_against(fake_strava, db_session)
+    await strava_webhook_service.enqueue_event(db_session, activity_event(FIRST, "create"))
+    await workers.drain()
+
+    def forged(owner_id: int, **fields) -> StravaWebhookEventIn:
+        return StravaWebhookEventIn(owner_id=owner_id, **{"object_type": "activity", "object_id": FIRST, "aspect_type": "delete", **fields})
+
+    for event in (
+        forged(ATHLETE_ID), # Still on Strava: kept
+        forged(9002), # Not 9002's activity (Strava answers 404 to its token): 9001's row is untouched
+        forged(9002, aspect_type="create"),
+        forged(ATHLETE_ID, aspect_type="update", updates={"title": "Hacked"}), # Strava has the real title
+        forged(ATHLETE_ID, object_type="athlete", object_id=ATHLETE_ID, aspect_type="update", updates={"authorized": "false"}),
+    ):
+        await strava_webhook_service.enqueue_event(db_session, event)
+    assert await workers.drain() == 5
+    assert await stored_activities(db_session) == [(str(FIRST), "Paddle 0")]
+    assert await stored_activities(db_session, 9002) == []
+    await db_session.refresh(webhook_athlete)
+    assert webhook_athlete.encrypted_refresh_token != "" # The token refresh succeeded: access wasn't revoked
+
+    # Another athlete's public activity, seen with the owner's token, isn't attached to the owner
+    fake_strava.state.edits[FIRST] = {"athlete": {"id": 9002}}
+    await strava_webhook_service.enqueue_event(db_session, forged(ATHLETE_ID, aspect_type="update"))
+    await workers.drain()
+    assert await stored_activities(db_session, 9002) == []
+
+    # A real deauthorization: Strava refuses the athlete's refresh token
+    fake_strava.state.revoked.add("refresh-9001")
+    await strava_webhook_service.enqueue_event(db_session, forged(
+        ATHLETE_ID, object_type="athlete", object_id=ATHLETE_ID, aspect_type="update", updates={"authorized": "false"},
+    ))
+    await workers.drain()
+    await db_session.refresh(webhook_athlete)
+    assert webhook_athlete.encrypted_refresh_token == ""
+
+@pytest.mark.asyncio
+async def test_events_are_refused_without_a_configured_subscription(db_session: AsyncSession, monkeypatch):
+    event = activity_event(FIRST, "create")
+    event.subscription_id = 77
+    monkeypatch.setattr(webhooks.settings, "STRAVA_WEBHOOK_SUBSCRIPTION_ID", None)
+    with pytest.raises(HTTPException) as exc_info:
+        await webhooks.strava_webhook_event(event, db_session)
+    assert exc_info.value.status_code == 403
+
+    monkeypatch.setattr(webhooks.settings, "STRAVA_WEBHOOK_SUBSCRIPTION_ID", 78)
+    with pytest.raises(HTTPException):
+        await webhooks.strava_webhook_event(event, db_session)
+    monkeypatch.setattr(webhooks.settings, "STRAVA_WEBHOOK_SUBSCRIPTION_ID", 77)
+    assert await webhooks.strava_webhook_event(event, db_session) == {"status": "queued"}
+    assert await queued_statuses(db_session) == ["pending"]
+
+@pytest.mark.asyncio
+async def test_failed_events_wait_before_being_retried(db_session: AsyncSession, webhook_athlete: StravaUserDB):
+    fake_strava = create_fake_strava(short_limit=0) # Every request draws a 429
+    workers = workers_against(fake_strava, db_session, max_attempts=2, retry_seconds=60)
+    await strava_webhook_service.enqueue_event(db_session, activity_event(123, "create"))
+
+    assert await workers.drain() == 1
+    event = (await db_session.execute(select(StravaWebhookEvent).execution_options(populate_existing=True))).scalar_one()
+    assert (event.status, event.attempts) == ("pending", 1)
+    assert "429" in event.last_error
+    assert event.retry_at > datetime.now().timestamp() + 30
+    assert await workers.claim() is None # Not due yet
+
+    event.retry_at = None
+    await db_session.commit()
+    assert await workers.drain() == 1
+    await db_session.refresh(event)
+    assert (event.status, event.attempts) == ("failed", 2) # Out of attempts
@@ -0,0 +1,73 @@
+import pytest
+import asyncio
+import httpx
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.rate_limit import RateLimitBudget
+from app.core.security import encrypt_token
+from app.services.sync_scheduler_service import SyncScheduler
+from app.models.strava_user import StravaUserDB
+from app.models.virtual_result import VirtualResult
+from benchmarks.fake_strava import create_fake_strava
+
+@pytest.fixture
+async def connected_athletes(db_session: AsyncSession):
+    """Three athletes: one never synced, one who paddled yesterday, one quiet for a month."""
+    for strava_id in (8001, 8002, 8003):
+        db_session.add(StravaUserDB(
+            strava_id=strava_id, username=f"athlete{strava_id}",
+            encrypted_access_token=encrypt_token(f"token-{strava_id}"), encrypted_refresh_token=encrypt_token(f"refresh-{strava_id}"),
+            token_expires_at=datetime.now(timezone.utc) + timedelta(hours=1)
+        ))
+    for strava_id, days_ago in ((8002, 1), (8003, 30)):
+        db_session.add(VirtualResult(
+            user_strava_id=strava_id, strava_activity_id=f"earlier-{strava_id}", name="Earlier",
+            distance_km=5.0, elapsed_time_seconds=1800, activity_date=datetime.now(timezone.utc) - timedelta(days=days_ago),
+        ))
+    await db_session.commit()
+
+def scheduler_against(fake_strava, db_session: AsyncSession, budget: RateLimitBudget) -> SyncScheduler:
+    @asynccontextmanager
+    async def session_factory():
+        yield db_session
+
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=fake_strava),
+        event_hooks={"response": [budget.observe_response]}, # As the app-wide client does
+    )
+    return SyncScheduler(session_factory, budget, client=client)
+
+@pytest.mark.asyncio
+async def test_round_syncs_every_athlete_most_recent_first(db_session: AsyncSession, connected_athletes):
+    fake_strava = create_fake_strava(activities_per_athlete=20)
+    scheduler = scheduler_against(fake_strava, db_session, RateLimitBudget())
+
+    await scheduler.run_round()
+
+    assert [request["token"] for request in fake_strava.state.requests] == ["token-8001", "token-8002", "token-8003"]
+    assert scheduler.stats["athletes_synced"] == 3
+    assert scheduler.stats["failures"] == 0
+    synced = await db_session.scalar(select(func.count(VirtualResult.id)).where(VirtualResult.strava_activity_id.notlike("earlier-%")))
+    assert synced == scheduler.stats["new_activities"] > 0
+
+@pytest.mark.asyncio
+async def test_rounds_stop_spending_at_the_limit_strava_reports(db_session: AsyncSession, connected_athletes):
+    # Strava allows 4 per window; the budget believes 200 until the headers say otherwise
+    fake_strava = create_fake_strava(short_limit=4, activities_per_athlete=20)
+    budget = RateLimitBudget(short_limit=200, reserve_fraction=0.25, pace_from_fraction=1.0) # No pacing: only the hard limit
+    scheduler = scheduler_against(fake_strava, db_session, budget)
+    scheduler.interval_seconds = 0 # Rounds back to back
+    scheduler.start()
+    await asyncio.sleep(0.3)
+    await scheduler.stop()
+
+    # The first round used the 3 usable requests; the second waits for the next window instead of drawing a 429
+    assert budget.short_limit == 4
+    assert scheduler.stats["rounds"] == 1
+    assert len(fake_strava.state.requests) == 3
+    assert fake_strava.state.usage["short"] == 3
+    assert budget.wait_seconds() > 0
@@ -0,0 +1,96 @@
+import pytest
+import json
+from contextlib import asynccontextmanager
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone, timedelta
+
+from app.services.timing_console_service import TimingConsole
+from app.models.strava_user import StravaUserDB
+from app.models.event import Event, EventType
+from app.models.event_category import EventCategory
+from app.models.event_distance import EventDistance
+from app.models.registration import Registration
+from app.models.race_result import RaceResult
+
+RACE_START = datetime(2024, 8, 3, 9, 0, 0)
+
+@pytest.fixture
+async def console_race(db_session: AsyncSession):
+    """An on-site event with two started paddlers, dorsals 1-2."""
+    event = Event(name="Console Cup", type=EventType.ON_SITE, date=datetime(2024, 8, 3), strava_sync_enabled=False)
+    db_session.add(event)
+    await db_session.flush()
+    category = EventCategory(name="Open", event_id=event.id)
+    distance = EventDistance(distance_km=5.0, event_id=event.id)
+    db_session.add_all([category, distance])
+    await db_session.flush()
+
+    for dorsal in (1, 2):
+        user = StravaUserDB(
+            strava_id=900 + dorsal, username=f"timer{dorsal}", firstname="Timed", lastname=str(dorsal),
+            encrypted_access_token="dummy_token", encrypted_refresh_token="dummy_refresh",
+            token_expires_at=datetime.now(timezone.utc) + timedelta(days=1)
+        )
+        db_session.add(user)
+        registration = Registration(
+            user_strava_id=user.strava_id, event_id=event.id,
+            event_category_id=category.id, event_distance_id=distance.id
+        )
+        db_session.add(registration)
+        await db_session.flush()
+        db_session.add(RaceResult(registration_id=registration.id, event_id=event.id, dorsal_number=dorsal, start_time=RACE_START))
+    await db_session.commit()
+    return event
+
+def console_for(db_session: AsyncSession, event_id: int, sent: list) -> TimingConsole:
+    @asynccontextmanager
+    async def session_factory():
+        yield db_session
+
+    async def send(message):
+        sent.append(message)
+
+    return TimingConsole(event_id, session_factory, send, flush_interval_seconds=0.05)
+
+def entry(seq: int, dorsal_number: int, minutes: int) -> str:
+    return json.dumps({"seq": seq, "dorsal_number": dorsal_number, "finish_time": (RACE_START + timedelta(minutes=minutes)).isoformat()})
+
+@pytest.mark.asyncio
+async def test_console_acks_entries_in_one_batch_with_row_deltas(db_session: AsyncSession, console_race: Event):
+    sent = []
+    console = console_for(db_session, console_race.id, sent)
+    console.start()
+    console.submit_text(entry(1, 2, 25))
+    console.submit_text("12") # The timer's client sent something that isn't an entry
+    console.submit_text(entry(3, 1, 24))
+    console.submit_text(entry(4, 1, 26)) # Typed twice
+    console.submit_text(entry(5, 99, 27))
+    await console.stop()
+
+    assert len(sent) == 1 # One ack for the whole burst
+    acks = sent[0]["acks"]
+    assert [(ack["seq"], ack["outcome"]) for ack in acks] == [
+        (1, "recorded"), (None, "invalid"), (3, "recorded"), (4, "duplicate"), (5, "unknown_dorsal"),
+    ]
+    assert acks[0]["net_time_seconds"] == 1500
+    # Row deltas carry what the tables show, positions included
+    rows = {row["dorsal_number"]: row for row in sent[0]["rows"]}
+    assert set(rows) == {1, 2}
+    assert (rows[1]["overall_position"], rows[1]["gap_to_leader_seconds"]) == (1, 0)
+    assert rows[1]["athlete"] == "Timed 1"
+    assert console.stats["batches"] == 1
+    assert console.stats["invalid"] == 1
+
+@pytest.mark.asyncio
+async def test_console_reports_rejected_batches(db_session: AsyncSession, console_race: Event):
+    sent = []
+    console = console_for(db_session, console_race.id + 1000, sent)
+    console.start()
+    console.submit_text(entry(1, 1, 24))
+    await console.stop()
+
+    [ack] = sent[0]["acks"]
+    assert ack["outcome"] == "error"
+    assert ack["detail"] == "Event not found."
+    assert sent[0]["rows"] == []
+    assert console.stats["failed_batches"] == 1
@@ -0,0 +1,30 @@
+import asyncio
+import pytest
+from datetime import datetime
+
+from app.services import timing_journal_service
+from app.services.timing_journal_service import TimingJournal, read_journal
+
+FINISH_TIME = datetime(2024, 6, 1, 10, 25, 0)
+
+@pytest.mark.asyncio
+async def test_concurrent_appends_share_one_fsync(tmp_path):
+    journal = TimingJournal(str(tmp_path / "journal.jsonl"))
+    try:
+        await asyncio.gather(*(
+            journal.append(timing_journal_service.FINISH, event_id=1, dorsal_number=dorsal, finish_time=FINISH_TIME)
+            for dorsal in range(1, 51)
+        ))
+    finally:
+        journal.close()
+
+    entries = list(read_journal(journal.path))
+    assert [entry["dorsal_number"] for entry in entries] == list(range(1, 51))
+    assert entries[0]["finish_time"] == FINISH_TIME.isoformat()
+    assert journal.appended == 50
+    assert journal.syncs < 50 # Group commit: one write + fsync per burst
+
+def test_read_journal_skips_torn_last_line(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    path.write_bytes(b'{"kind":"finish","event_id":1}\n{"kind":"fin')
+    assert list(read_journal(str(path))) == [{"kind": "finish", "event_id": 1}]
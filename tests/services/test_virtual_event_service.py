@@ -0,0 +1,168 @@
+import pytest
+import asyncio
+import re
+import httpx
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import select, func, event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services import virtual_event_service, leaderboard_service
+from app.services.virtual_event_service import SyncProgress
+from app.models.strava_user import StravaUserDB
+from app.models.virtual_result import VirtualResult
+from app.models.personal_best import PersonalBest
+from app.models.leaderboard_entry import LeaderboardEntry
+from app.models.leaderboard_rollup import LeaderboardRollup
+from app.core.security import encrypt_token
+
+ACTIVITIES_URL = re.compile(r"https://www\.strava\.com/api/v3/athlete/activities.*")
+
+@pytest.fixture
+async def strava_paddler(db_session: AsyncSession):
+    user = StravaUserDB(
+        strava_id=7001, username="longhaul", firstname="Long", lastname="Haul",
+        encrypted_access_token=encrypt_token("valid_access_token"), encrypted_refresh_token=encrypt_token("valid_refresh_token"),
+        token_expires_at=datetime.now(timezone.utc) + timedelta(hours=1)
+    )
+    db_session.add(user)
+    await db_session.commit()
+    return user
+
+def strava_activities(count: int):
+    """Oldest first, as Strava lists them when asked for activities `after` a date."""
+    first = datetime.now(timezone.utc) - timedelta(days=20)
+    return [
+        {
+            "id": 5_000_000 + n, "name": f"Paddle {n}", "type": "StandUpPaddling", "distance": 5000.0,
+            "elapsed_time": 1800 + n, "start_date": (first + timedelta(minutes=10 * n)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        for n in range(count)
+    ]
+
+def serve_pages(httpx_mock, activities, failing_page=None):
+    """Answers /athlete/activities by page, slowly enough for requests to overlap; returns the stats."""
+    served = {"pages": [], "in_flight": 0, "max_in_flight": 0}
+
+    async def callback(request: httpx.Request):
+        page, per_page = int(request.url.params["page"]), int(request.url.params["per_page"])
+        served["pages"].append(page)
+        served["in_flight"] += 1
+        served["max_in_flight"] = max(served["max_in_flight"], served["in_flight"])
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            served["in_flight"] -= 1
+        if page == failing_page:
+            return httpx.Response(500, json={"message": "Error"})
+        return httpx.Response(200, json=activities[(page - 1) * per_page:page * per_page])
+
+    httpx_mock.add_callback(callback, url=ACTIVITIES_URL, is_reusable=True)
+    return served
+
+@pytest.mark.asyncio
+async def test_sync_walks_every_page_with_bounded_concurrency(
+    db_session: AsyncSession, strava_paddler: StravaUserDB, httpx_mock, monkeypatch
+):
+    monkeypatch.setattr(virtual_event_service.settings, "STRAVA_SYNC_PER_PAGE", 100)
+    monkeypatch.setattr(virtual_event_service.settings, "STRAVA_SYNC_MAX_PAGES_IN_FLIGHT", 2)
+    served = serve_pages(httpx_mock, strava_activities(250))
+    progress = []
+
+    synced, processed = await virtual_event_service.sync_strava_activities_for_user(
+        db_session, strava_paddler.strava_id, progress=progress.append
+    )
+
+    assert (synced, processed) == (250, 250) # Not just the first page
+    assert progress == [SyncProgress(1, 100, 100, 100), SyncProgress(2, 100, 200, 200), SyncProgress(3, 50, 250, 250)]
+    assert served["pages"][0] == 1
+    assert 1 < served["max_in_flight"] <= 2
+    stored = await db_session.scalar(select(func.count(VirtualResult.id)).where(VirtualResult.user_strava_id == strava_paddler.strava_id))
+    assert stored == 250
+
+@pytest.mark.asyncio
+async def test_sync_keeps_pages_before_a_failed_one(
+    db_session: AsyncSession, strava_paddler: StravaUserDB, httpx_mock, monkeypatch
+):
+    monkeypatch.setattr(virtual_event_service.settings, "STRAVA_SYNC_PER_PAGE", 100)
+    serve_pages(httpx_mock, strava_activities(250), failing_page=2)
+    progress = []
+
+    synced, processed = await virtual_event_service.sync_strava_activities_for_user(
+        db_session, strava_paddler.strava_id, progress=progress.append
+    )
+
+    assert (synced, processed) == (100, 100)
+    assert [update.page for update in progress] == [1]
+    # The next sync picks up after the newest stored activity
+    latest = await db_session.scalar(select(func.max(VirtualResult.activity_date)))
+    assert latest is not None
+
+@pytest.mark.asyncio
+async def test_sync_page_costs_constant_statements_and_skips_stored_activities(
+    db_session: AsyncSession, strava_paddler: StravaUserDB, httpx_mock, monkeypatch
+):
+    activities = strava_activities(199)
+    activities[7]["type"] = "Run" # Relevant too, just not paddling
+    activities[8]["type"] = "Chess" # Not relevant
+    activities.append(dict(activities[3])) # Strava repeats an activity within the page
+    already_synced = activities[5]
+    db_session.add(VirtualResult(
+        user_strava_id=strava_paddler.strava_id, strava_activity_id=str(already_synced["id"]), name="Earlier sync",
+        distance_km=5.0, elapsed_time_seconds=already_synced["elapsed_time"],
+        activity_date=datetime.now(timezone.utc) - timedelta(days=40), # Before the sync window
+    ))
+    await db_session.commit()
+    serve_pages(httpx_mock, activities)
+
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db_session.bind.sync_engine, "before_cursor_execute", count)
+    try:
+        synced, processed = await virtual_event_service.sync_strava_activities_for_user(db_session, strava_paddler.strava_id)
+    finally:
+        event.remove(db_session.bind.sync_engine, "before_cursor_execute", count)
+
+    assert (synced, processed) == (197, 200) # Less the repeat, the stored one and the irrelevant one
+    assert len(statements) < 20 # Not one SELECT and INSERT per activity
+    assert sum(statement.startswith("INSERT INTO virtual_results") for statement in statements) == 1
+    stored = (await db_session.execute(
+        select(VirtualResult).where(VirtualResult.strava_activity_id == str(activities[0]["id"]))
+    )).scalar_one()
+    assert (stored.distance_bucket, stored.activity_year) == (5.0, stored.activity_date.year)
+    fastest = min(activity["elapsed_time"] for activity in activities if activity["type"] != "Chess")
+    best = (await db_session.execute(select(PersonalBest).where(PersonalBest.user_strava_id == strava_paddler.strava_id))).scalar_one()
+    assert best.time_seconds == fastest
+
+@pytest.mark.asyncio
+async def test_sync_merges_each_page_into_the_leaderboards_incrementally(
+    db_session: AsyncSession, strava_paddler: StravaUserDB, httpx_mock, monkeypatch
+):
+    monkeypatch.setattr(virtual_event_service.settings, "STRAVA_SYNC_PER_PAGE", 100)
+    activities = strava_activities(250)
+    activities[180]["elapsed_time"] = 1500 # The best 5 km comes on the second page
+    activities[230]["distance"] = 10000.0 # A first 10 km on the third
+    serve_pages(httpx_mock, activities)
+
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db_session.bind.sync_engine, "before_cursor_execute", count)
+    try:
+        await virtual_event_service.sync_strava_activities_for_user(db_session, strava_paddler.strava_id)
+    finally:
+        event.remove(db_session.bind.sync_engine, "before_cursor_execute", count)
+
+    assert not any(statement.startswith("DELETE") for statement in statements) # No page rebuilds the athlete's history
+    derived = {}
+    for model in (LeaderboardEntry, PersonalBest, LeaderboardRollup):
+        rows = (await db_session.execute(select(model).where(model.user_strava_id == strava_paddler.strava_id))).scalars().all()
+        derived[model] = sorted((row.bucket_km, getattr(row, "year", None), getattr(row, "category", None), row.time_seconds, row.source_id) for row in rows)
+    assert [(bucket, time) for bucket, _, _, time, _ in derived[PersonalBest]] == [(5.0, 1500), (10.0, 1800 + 230)]
+
+    # Same rows as re-deriving the athlete's leaderboards from scratch
+    await leaderboard_service.refresh_athlete_leaderboards(db_session, [strava_paddler.strava_id])
+    for model, rows in derived.items():
+        rederived = (await db_session.execute(select(model).where(model.user_strava_id == strava_paddler.strava_id))).scalars().all()
+        assert sorted((row.bucket_km, getattr(row, "year", None), getattr(row, "category", None), row.time_seconds, row.source_id) for row in rederived) == rows
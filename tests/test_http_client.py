@@ -0,0 +1,26 @@
+import pytest
+import httpx
+
+from app.config import Settings
+from app.core.http_client import SharedHTTPClient
+
+@pytest.mark.asyncio
+async def test_shared_client_is_reused_and_counts_requests(httpx_mock):
+    httpx_mock.add_response(url="https://www.strava.com/api/v3/athlete", json={"id": 1}, is_reusable=True)
+    httpx_mock.add_response(url="https://www.strava.com/oauth/deauthorize", status_code=401)
+    shared = SharedHTTPClient()
+    assert shared.metrics() == {"open": False}
+
+    client = shared.start(Settings(HTTP_CLIENT_MAX_CONNECTIONS=4))
+    assert shared.get() is client # Every caller gets the same pool
+    for _ in range(3):
+        assert (await client.get("https://www.strava.com/api/v3/athlete")).json() == {"id": 1}
+    await client.post("https://www.strava.com/oauth/deauthorize", data={"access_token": "x"})
+
+    metrics = shared.metrics()
+    assert (metrics["requests"], metrics["in_flight"], metrics["error_responses"]) == (4, 0, 1)
+    assert metrics["mean_ms"] is not None
+
+    await shared.close()
+    assert client.is_closed
+    assert shared.metrics() == {"open": False}
@@ -0,0 +1,39 @@
+import pytest
+
+from app.core.rate_limit import RateLimitBudget, SHORT_WINDOW_SECONDS
+
+WINDOW_START = 1_717_200_000.0 # A quarter hour boundary (2024-06-01 00:00 UTC)
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_budget_spends_freely_then_paces_then_waits_for_reset():
+    clock = FakeClock(WINDOW_START)
+    budget = RateLimitBudget(short_limit=20, daily_limit=1000, reserve_fraction=0.5, pace_from_fraction=0.5, clock=clock)
+    # 10 usable in this window (half kept in reserve); the first 5 go out back to back
+    for _ in range(5):
+        assert budget.wait_seconds() == 0
+        budget.spend()
+    # Past half of it: the 5 left are spread over the 900 s left
+    assert budget.wait_seconds() == pytest.approx(180)
+    clock.now += 180
+    assert budget.wait_seconds() == 0
+    budget.spend()
+    budget.observe({"X-RateLimit-Limit": "20,1000", "X-RateLimit-Usage": "10,10"}) # Someone else spent the rest
+    assert budget.wait_seconds() == pytest.approx(SHORT_WINDOW_SECONDS - 180)
+    clock.now = WINDOW_START + SHORT_WINDOW_SECONDS # Next window
+    assert budget.wait_seconds() == 0
+    assert (budget.short_usage, budget.daily_usage) == (0, 10)
+
+def test_budget_takes_limits_from_headers_and_waits_for_the_next_day():
+    clock = FakeClock(WINDOW_START + 3600)
+    budget = RateLimitBudget(short_limit=200, daily_limit=2000, reserve_fraction=0.1, clock=clock)
+    budget.observe({"Content-Type": "application/json"}) # Not from Strava: ignored
+    assert budget.stats["observed"] == 0
+    budget.observe({"X-RateLimit-Limit": "100,1000", "X-RateLimit-Usage": "3,900"})
+    assert (budget.short_limit, budget.daily_limit) == (100, 1000)
+    assert budget.wait_seconds() == pytest.approx(86400 - 3600) # 900 of 1000 is the whole usable day